@@ -0,0 +1,378 @@
+"""Offline benchmarks of the evaluation and MPD tooling on synthetic data.
+
+    python3 benchmark.py --update                     # record benchmark_baseline.json
+    python3 benchmark.py                              # compare, exit status 1 on a regression
+    python3 benchmark.py --runs 10 100 --cases load_data plot_all --duration 60
+
+generate_results() writes <protocol>_<iteration>_dash.json files shaped like the runner's
+(1 s player polls with representation switches and stalls, dash.js segment records with
+their Resource Timing entries, PerformanceTiming, launch and phase timings), indented
+like the runner writes them. generate_segments() writes a <height>/out tree per rung of
+fragmented MP4 segments with the segmenter's output.mpd, the media data is left sparse
+so that large trees cost no disk space. Both are generated once per parameter set below
+--workdir and reused.
+
+Every case runs in a freshly spawned process, its peak RSS is the larger ru_maxrss of
+that process and its worker processes:
+
+    load_data         parse all result files, writing the parsed-results cache
+    load_data_cached  load_data again from that cache
+    plot_all          plot the tables of load_data (loaded from the cache, not timed)
+    process_mpds      index the segments and write bbb.mpd, with as many segments per
+                      representation as runs
+
+A case regresses when its wall time exceeds the baseline by more than --threshold and
+--min_delta_s, or its peak RSS by more than --rss_threshold.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+VIDEO_PROCESSING = os.path.join(ROOT, "scripts", "video_processing")
+
+CASES = ["load_data", "load_data_cached", "plot_all", "process_mpds"]
+RUN_COUNTS = [10, 100, 1000, 10000]
+PROTOCOLS = ["tcp", "quic-ss", "quic-cr"]
+GENERATOR_VERSION = 2  # bump whenever the synthetic data changes, it is regenerated then
+
+# the ladder of scripts/video_processing/video_driver.py
+RESOLUTIONS = [(640, 360), (854, 480), (1280, 720), (1920, 1080)]
+BITRATES_MBIT = [1.5, 4, 7.5, 12]
+FRAMERATE = 60
+TIMESCALE = 15360  # ffmpeg's default video timescale at 60 fps
+
+
+def _performance_timing(navigation_start: int, rng) -> dict:
+    offsets = np.cumsum(rng.integers(0, 40, 20))
+    names = ["redirectStart", "redirectEnd", "fetchStart", "domainLookupStart", "domainLookupEnd", "connectStart",
+             "secureConnectionStart", "connectEnd", "requestStart", "responseStart", "responseEnd", "domLoading",
+             "domInteractive", "domContentLoadedEventStart", "domContentLoadedEventEnd", "domComplete",
+             "loadEventStart", "loadEventEnd", "unloadEventStart", "unloadEventEnd"]
+    timing = {"navigationStart": navigation_start}
+    for name, offset in zip(names, offsets):
+        # like the browser, events that did not happen are 0
+        timing[name] = 0 if name.startswith(("redirect", "unload")) else navigation_start + int(offset)
+    return timing
+
+
+def synthetic_result(protocol: str, duration_s: int, rng, start_ms: int = 1_700_000_000_000) -> dict:
+    """Returns one result of duration_s seconds of playback in the shape chrome-dash_run.py writes."""
+    driver_get = start_ms + int(rng.integers(0, 3_600_000))
+    timing = _performance_timing(driver_get + int(rng.integers(5, 50)), rng)
+    initialized = timing["loadEventEnd"] + int(rng.integers(5, 30))
+    can_play = initialized + int(rng.integers(300, 3000))
+
+    # the first sample is pushed when the player is initialized, the poller adds one per second
+    times = initialized + np.concatenate([[0], 1000 * np.arange(1, duration_s + 1) + rng.integers(0, 15, duration_s)])
+    quality = np.clip(np.cumsum(rng.choice([-1, 0, 0, 0, 0, 1], duration_s)) + 1, 0, len(RESOLUTIONS) - 1)
+    buffer = np.minimum(np.cumsum(rng.uniform(0.3, 1.6, duration_s)), 30)
+    stalls = rng.poisson(0.02 * duration_s)
+    stall_starts = np.sort(rng.uniform(can_play, times[-1], stalls)).astype(np.int64)
+    stall_durations = rng.integers(200, 4000, stalls)
+
+    width = [None] + [RESOLUTIONS[q][0] for q in quality]
+    height = [None] + [RESOLUTIONS[q][1] for q in quality]
+    dropped = np.cumsum(rng.poisson(0.2, duration_s))
+    metrics = {
+        "bufferLevel": [0] + np.round(buffer, 3).tolist(),
+        "frameRate": [None] + [FRAMERATE] * duration_s,
+        "reportedBitrate": [None] + [int(BITRATES_MBIT[q] * 1000) for q in quality],
+        "droppedFrames": [None] + [{"time": "2023-11-14T22:13:20.000Z", "droppedFrames": int(d)} for d in dropped],
+        "resWidth": width,
+        "resHeight": height,
+        "currentTime": times.tolist(),
+        "eventLog": [],
+        "initialized": [initialized],
+        "canPlay": [can_play],
+        "stallStartTime": stall_starts.tolist(),
+        "stallDuration": stall_durations.tolist(),
+        "segments": [],
+        "resourceTiming": [],
+        "ABRStrategy": "abrThroughput",
+        "urlSettings": {},
+        "mpd": "data/bbb.mpd",
+    }
+
+    # one 1 s video segment per second of media, fetched back to back
+    request = initialized + int(rng.integers(50, 200))
+    for index, q in enumerate(np.concatenate([[0], quality])):
+        size = int(BITRATES_MBIT[q] * 1e6 / 8 * rng.uniform(0.6, 1.4))
+        ttfb, transfer = int(rng.integers(20, 700)), int(size * 8 / 1000 / rng.uniform(5, 60))
+        url = f"https://10.77.0.2/data/{RESOLUTIONS[q][1]}/out/0-{index + 1:05}.m4s"
+        metrics["segments"].append({
+            "mediaType": "video", "type": "MediaSegment", "index": index, "quality": int(q), "representationId": str(q),
+            "url": url, "requestStart": request, "firstByte": request + ttfb, "requestEnd": request + ttfb + transfer,
+            "bytes": size, "error": None})
+        connect = float(request) if index == 0 else None
+        metrics["resourceTiming"].append({
+            "url": url, "protocol": "h2" if protocol == "tcp" else "h3", "startTime": request + 0.25,
+            "connectStart": connect, "connectEnd": connect and connect + rng.uniform(10, 700),
+            "requestStart": request + 0.5, "responseStart": request + ttfb + 0.25, "responseEnd": request + ttfb + transfer,
+            "transferSize": size + 300, "encodedBodySize": size})
+        request += ttfb + transfer + int(rng.integers(0, 20))
+
+    phases = {"profile_create": 0.002, "server_ready": rng.uniform(0.01, 0.5), "chrome_acquire": rng.uniform(0.5, 2),
+              "chrome_get": rng.uniform(0.2, 1.5), "playback": float(duration_s), "metrics_extract": rng.uniform(0.01, 0.2),
+              "results_wait": 0.001, "profile_cleanup": rng.uniform(0.005, 0.05), "result_encode": rng.uniform(0.001, 0.01)}
+    if protocol != "tcp":
+        phases |= {"server_start": rng.uniform(0.005, 0.02), "server_join": rng.uniform(0.01, 0.1)}
+    # like run_protocol's, the total includes a little time outside of the phases
+    phases["run_total"] = sum(phases.values()) + rng.uniform(0.01, 0.1)
+    return {
+        "chrome_driver.get()": driver_get,
+        "chrome_performanceTiming": timing,
+        "chrome_metrics": metrics,
+        "chrome_metrics_streamed": None,
+        "chrome_media_events": None,
+        "chrome_launch": {"chrome_driver_start_s": 0.3, "chrome_browser_launch_s": rng.uniform(0.4, 1.2),
+                          "chrome_pooled": False},
+        "chrome_netlog": None,
+        "runner_waits": {"playback_s": float(duration_s), "playback_stop": "media_seconds",
+                         "server_ready_s": phases["server_ready"], "server_ready_detected": True},
+        "session": {"slot": 0, "parallel": 1, "picoquic_port": 44321, "started": start_ms / 1000,
+                    "setup_phases": {"chromedriver_start": 0.05}, "campaign": None},
+        "runner_phases": phases,
+    }
+
+
+def generate_results(out_dir: str, runs: int, duration_s: int, seed: int = 0):
+    """Writes runs result files, the protocols take turns."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for i in range(runs):
+        protocol = PROTOCOLS[i % len(PROTOCOLS)]
+        with open(os.path.join(out_dir, f"{protocol}_{i // len(PROTOCOLS):03}_dash.json"), "w") as f:
+            json.dump(synthetic_result(protocol, duration_s, rng), f, indent=2)
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _full_box(box_type: bytes, version: int, flags: int, payload: bytes) -> bytes:
+    return _box(box_type, bytes([version]) + flags.to_bytes(3, "big") + payload)
+
+
+def _init_segment() -> bytes:
+    mdhd = _full_box(b"mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, TIMESCALE, 0, 0, 0))
+    trex = _full_box(b"trex", 0, 0, struct.pack(">IIIII", 1, 1, TIMESCALE // FRAMERATE, 0, 0x00010000))
+    return _box(b"ftyp", b"iso5\0\0\0\0") + _box(b"moov", _box(b"trak", _box(b"mdia", mdhd)) + _box(b"mvex", trex))
+
+
+def _write_media_segment(path: str, number: int, sizes):
+    """Writes a styp/sidx/moof/mdat segment of one GOP, the mdat payload is a hole."""
+    frames, sample_duration = len(sizes), TIMESCALE // FRAMERATE
+    flags = [0x02000000] + [0x01010000] * (frames - 1)  # a keyframe, then non-sync samples
+    trun = _full_box(b"trun", 0, 0x1 | 0x200 | 0x400, struct.pack(">Ii", frames, 0) + b"".join(
+        struct.pack(">II", size, flag) for size, flag in zip(sizes, flags)))
+    tfhd = _full_box(b"tfhd", 0, 0x20000 | 0x8, struct.pack(">II", 1, sample_duration))
+    tfdt = _full_box(b"tfdt", 1, 0, struct.pack(">Q", (number - 1) * frames * sample_duration))
+    moof = _box(b"moof", _full_box(b"mfhd", 0, 0, struct.pack(">I", number)) + _box(b"traf", tfhd + tfdt + trun))
+    mdat_size = 8 + int(sum(sizes))
+    sidx = _full_box(b"sidx", 0, 0, struct.pack(">IIIIHH", 1, TIMESCALE, (number - 1) * frames * sample_duration, 0, 0, 1)
+                     + struct.pack(">III", len(moof) + mdat_size, frames * sample_duration, 0x90000000))
+    with open(path, "wb") as f:
+        f.write(_box(b"styp", b"msdh\0\0\0\0") + sidx + moof + struct.pack(">I4s", mdat_size, b"mdat"))
+        f.truncate(f.tell() + mdat_size - 8)
+
+
+def generate_segments(prefix: str, segments: int, seed: int = 0):
+    """Writes <prefix>/<height>/out with output.mpd and segments 1 s long for every rung of the ladder."""
+    rng = np.random.default_rng(seed)
+    frames = FRAMERATE
+    for (width, height), bitrate in zip(RESOLUTIONS, BITRATES_MBIT):
+        out_dir = os.path.join(prefix, str(height), "out")
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "0-init.m4s"), "wb") as f:
+            f.write(_init_segment())
+        gop_bytes = bitrate * 1e6 / 8
+        for number in range(1, segments + 1):
+            # a keyframe of about ten times the size of the other frames
+            weights = np.concatenate([[10], rng.uniform(0.5, 1.5, frames - 1)])
+            sizes = np.maximum(1, weights / weights.sum() * gop_bytes * rng.uniform(0.7, 1.3)).astype(np.int64)
+            _write_media_segment(os.path.join(out_dir, f"0-{number:05}.m4s"), number, sizes)
+        # what the segmenter's ffmpeg writes, as far as mpd_generator.py reads it
+        with open(os.path.join(out_dir, "output.mpd"), "w") as f:
+            f.write(f'<?xml version="1.0" encoding="utf-8"?>\n<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" '
+                    f'type="static" mediaPresentationDuration="PT{segments}.0S" minBufferTime="PT{segments}.0S">\n'
+                    f' <Period id="0" start="PT0.0S">\n  <AdaptationSet id="0" contentType="video">\n'
+                    f'   <Representation id="0" mimeType="video/mp4" codecs="avc1.64001f" '
+                    f'bandwidth="{int(bitrate * 1e6)}" width="{width}" height="{height}">\n'
+                    f'    <SegmentList timescale="{TIMESCALE}" duration="{TIMESCALE}"/>\n'
+                    f'   </Representation>\n  </AdaptationSet>\n </Period>\n</MPD>\n')
+
+
+def _prepare(workdir: str, kind: str, runs: int, duration_s: int, seed: int) -> str:
+    """Returns the directory of a synthetic data set, generating it unless it is complete already."""
+    params = {"version": GENERATOR_VERSION, "kind": kind, "runs": runs, "duration_s": duration_s, "seed": seed}
+    path = os.path.join(workdir, f"{kind}_{runs}" + (f"_{duration_s}s" if kind == "results" else "") + f"_{seed}")
+    stamp = os.path.join(path, ".generated.json")
+    if os.path.isfile(stamp):
+        with open(stamp) as f:
+            if json.load(f) == params:
+                return path
+    shutil.rmtree(path, ignore_errors=True)
+    start = time.monotonic()
+    if kind == "results":
+        generate_results(path, runs, duration_s, seed)
+    else:
+        generate_segments(path, runs, seed)
+    with open(stamp, "w") as f:
+        json.dump(params, f)
+    print(f"Generated {kind} for {runs} runs in {path} ({time.monotonic() - start:.1f} s)")
+    return path
+
+
+def _run_case(case: str, path: str, workers: int) -> dict:
+    """Runs one case in this (fresh) process and returns its wall time and peak RSS."""
+    os.environ["MPLBACKEND"] = "Agg"
+    sys.path[:0] = [ROOT, VIDEO_PROCESSING]
+    if case == "process_mpds":
+        process_mpds = importlib.import_module("mpd_generator").process_mpds
+        meta = {"resolutions": [f"{w}x{h}" for w, h in RESOLUTIONS], "prefix": path + "/", "media_prefix": "../data",
+                "framerate": FRAMERATE}
+        start = time.perf_counter()
+        process_mpds(meta)
+    else:
+        evaluation = importlib.import_module("chrome-dash_eval")
+        if case == "plot_all":
+            tables = evaluation.load_data(path, workers)
+            start = time.perf_counter()
+            evaluation.plot_all(*tables, path)
+        else:
+            start = time.perf_counter()
+            evaluation.load_data(path, workers)
+    wall = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux, parse workers have exited and count as children
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {"wall_s": wall, "peak_rss_mb": peak / 1024}
+
+
+def _spawn_case(context, case: str, path: str, workers: int) -> dict:
+    """Runs _run_case in a fresh process, unlike multiprocessing.Pool workers it may start parse workers."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_run_case, case, path, workers).result()
+
+
+def run_benchmarks(cases, run_counts, duration_s: int, workdir: str, workers: int = None, repeat: int = 3,
+                   seed: int = 0) -> dict:
+    """Returns the results of all cases and run counts keyed by "<case>@<runs>"."""
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for runs in run_counts:
+        for case in cases:
+            if case == "process_mpds":
+                path = _prepare(workdir, "segments", runs, duration_s, seed)
+            else:
+                path = _prepare(workdir, "results", runs, duration_s, seed)
+            samples = []
+            for _ in range(repeat):
+                if case in ("load_data", "process_mpds"):
+                    # cold: without the parsed-results cache or the segment index
+                    shutil.rmtree(os.path.join(path, ".eval_cache"), ignore_errors=True)
+                    for height in (h for _, h in RESOLUTIONS):
+                        for name in ("segment_index.npy", "segment_index.json"):
+                            if os.path.exists(os.path.join(path, str(height), "out", name)):
+                                os.remove(os.path.join(path, str(height), "out", name))
+                elif case == "load_data_cached" and not os.path.isdir(os.path.join(path, ".eval_cache")):
+                    _spawn_case(context, "load_data", path, workers)
+                samples.append(_spawn_case(context, case, path, workers))
+            result = {"case": case, "runs": runs, "wall_s": min(s["wall_s"] for s in samples),
+                      "peak_rss_mb": max(s["peak_rss_mb"] for s in samples)}
+            results[f"{case}@{runs}"] = result
+            print(f"{case:>18} {runs:>6} runs: {result['wall_s']:8.3f} s {result['peak_rss_mb']:8.1f} MB", flush=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, rss_threshold: float, min_delta_s: float) -> list:
+    """Prints the results next to the baseline and returns the regressions."""
+    regressions = []
+    print(f"\n{'case':>18} {'runs':>6} {'wall (s)':>10} {'baseline':>10} {'change':>8} "
+          f"{'RSS (MB)':>10} {'baseline':>10} {'change':>8}")
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{result['case']:>18} {result['runs']:>6} {result['wall_s']:10.3f} {'-':>10} {'':>8} "
+                  f"{result['peak_rss_mb']:10.1f} {'-':>10}")
+            continue
+        wall_change = result["wall_s"] / base["wall_s"] - 1 if base["wall_s"] else 0
+        rss_change = result["peak_rss_mb"] / base["peak_rss_mb"] - 1 if base["peak_rss_mb"] else 0
+        slow = wall_change > threshold and result["wall_s"] - base["wall_s"] > min_delta_s
+        large = rss_change > rss_threshold
+        print(f"{result['case']:>18} {result['runs']:>6} {result['wall_s']:10.3f} {base['wall_s']:10.3f} "
+              f"{wall_change:+8.1%} {result['peak_rss_mb']:10.1f} {base['peak_rss_mb']:10.1f} {rss_change:+8.1%}"
+              + (" \033[91mREGRESSION\033[0m" if slow or large else ""))
+        if slow:
+            regressions.append(f"{key}: wall time {base['wall_s']:.3f} s -> {result['wall_s']:.3f} s ({wall_change:+.1%})")
+        if large:
+            regressions.append(f"{key}: peak RSS {base['peak_rss_mb']:.1f} MB -> {result['peak_rss_mb']:.1f} MB "
+                               f"({rss_change:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, nargs='+', default=RUN_COUNTS,
+                        help="Numbers of result files (and segments per representation) to benchmark with "
+                             "(default: %(default)s)")
+    parser.add_argument('--cases', choices=CASES, nargs='+', default=CASES,
+                        help="Cases to run (default: all)")
+    parser.add_argument('--duration', type=int, default=30,
+                        help="Seconds of playback per synthetic run, one player sample and segment per second "
+                             "(default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes load_data parses with (default: all cores)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per case, the fastest wall time and the largest RSS count (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed of the synthetic data (default: %(default)s)")
+    parser.add_argument('--workdir', type=str, default=os.path.join(tempfile.gettempdir(), "chrome-dash-benchmark"),
+                        help="Directory of the generated data, reused across invocations (default: %(default)s)")
+    parser.add_argument('--baseline', type=str, default="benchmark_baseline.json",
+                        help="JSON baseline to compare with (default: %(default)s)")
+    parser.add_argument('--update', action='store_true', default=False,
+                        help="Write the results to --baseline instead of comparing with it")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Relative wall time increase that counts as a regression (default: %(default)s)")
+    parser.add_argument('--rss_threshold', type=float, default=0.2,
+                        help="Relative peak RSS increase that counts as a regression (default: %(default)s)")
+    parser.add_argument('--min_delta_s', type=float, default=0.1,
+                        help="Wall time increases below this many seconds are noise, never a regression "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+
+    params = {"duration_s": args.duration, "workers": args.workers, "seed": args.seed}
+    results = run_benchmarks(args.cases, args.runs, args.duration, args.workdir, args.workers, args.repeat, args.seed)
+
+    if args.update or not os.path.isfile(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump({"created": time.time(), "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                                                           "cpus": os.cpu_count()},
+                       "params": params, "results": results}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["params"] != params:
+        sys.exit(f"{args.baseline} was recorded with {baseline['params']}, not {params}, record a new one with --update")
+    regressions = compare(results, baseline["results"], args.threshold, args.rss_threshold, args.min_delta_s)
+    if regressions:
+        print("\n\033[91mRegressions:\033[0m\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("\nNo regressions")
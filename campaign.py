@@ -0,0 +1,145 @@
+"""Resumable parameter-sweep campaigns for chrome-dash_run.py.
+
+A campaign spec (JSON) lists the protocols, Careful Resume parameter grids, player
+configurations and the number of repetitions, e.g.
+
+    {
+        "name": "cr-sweep",
+        "repetitions": 10,
+        "seed": 1,
+        "protocols": ["tcp", "quic-ss", "quic-cr"],
+        "cr_parameters": {"PREVIOUS_RTT": [300000, 600000], "PREVIOUS_CWND_BYTES": [3750000]},
+        "players": {
+            "default": {},
+            "dynamic": {"page": "player_highLatency.html", "streaming.abr.ABRStrategy": "abrDynamic"}
+        },
+        "retries": 3,
+        "backoff_s": 5
+    }
+
+cr_parameters is either a grid (every combination is one variant) or a list of parameter
+strings. Player settings other than "page" are passed to the player as URL query
+parameters, e.g. "mpd": "data/bbb_seg2s.mpd" plays the video packaged in 2 s segments.
+The spec expands into a plan that runs every variant once per repetition in a random
+order, so variants are interleaved in time. The plan is stored as a manifest
+next to the results and reused when the campaign is restarted: runs with a result file
+are skipped, failed runs are retried with exponential backoff and every attempt is
+appended to a log.
+"""
+
+import itertools
+import json
+import os
+import random
+import re
+import time
+import traceback
+
+PROTOCOLS = ("tcp", "quic-ss", "quic-cr")
+
+
+def load_spec(path: str) -> dict:
+    with open(path) as f:
+        spec = json.load(f)
+    if not re.fullmatch(r"[\w.-]+", spec.get("name", "")):
+        raise ValueError(f"{path}: campaign needs a name of letters, digits, '.', '-' or '_'")
+    unknown = set(spec.get("protocols", PROTOCOLS)) - set(PROTOCOLS)
+    if unknown:
+        raise ValueError(f"{path}: unknown protocols {sorted(unknown)}, expected some of {PROTOCOLS}")
+    for label in spec.get("players", {}):
+        if not re.fullmatch(r"[A-Za-z0-9-]+", label):
+            raise ValueError(f"{path}: player label {label!r} may only contain letters, digits and '-'")
+    return spec
+
+
+def cr_variants(spec: dict, default: str) -> list:
+    """Returns the Careful Resume parameter strings of a spec."""
+    grid = spec.get("cr_parameters")
+    if grid is None:
+        return [default]
+    if isinstance(grid, list):
+        return grid
+    keys = sorted(grid)
+    return [" ".join(f"{key}={value}" for key, value in zip(keys, values))
+            for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def expand(spec: dict, default_cr: str) -> list:
+    """Expands a spec into a run plan, every repetition runs all variants in a random order."""
+    variants = []
+    players = spec.get("players") or {"default": {}}
+    crs = cr_variants(spec, default_cr)
+    for protocol in spec.get("protocols", PROTOCOLS):
+        for player, settings in players.items():
+            for i, cr in enumerate(crs if protocol == "quic-cr" else [None]):
+                tag = f"{protocol}_{player}" + (f"_cr{i}" if cr is not None else "")
+                variants.append({"variant": tag, "protocol": protocol, "player": player, "player_settings": settings,
+                                 "cr_parameters": cr})
+
+    rng = random.Random(spec.get("seed"))
+    plan = []
+    for repetition in range(spec.get("repetitions", 1)):
+        block = list(variants)
+        rng.shuffle(block)
+        for variant in block:
+            plan.append(variant | {"run_id": f"{variant['variant']}_{repetition:03}", "repetition": repetition})
+    return plan
+
+
+class Campaign:
+    """Plan, manifest and attempt log of one campaign in a results directory."""
+
+    def __init__(self, spec_path: str, results_dir: str = "results", default_cr: str = ""):
+        self.spec = load_spec(spec_path)
+        self.results_dir = results_dir
+        self.name = self.spec["name"]
+        self.retries = self.spec.get("retries", 3)
+        self.backoff_s = self.spec.get("backoff_s", 5)
+        self.manifest_path = os.path.join(results_dir, f"campaign_{self.name}.json")
+        self.log_path = os.path.join(results_dir, f"campaign_{self.name}.log.jsonl")
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest["spec"] != self.spec:
+                raise ValueError(f"{spec_path} differs from the spec stored in {self.manifest_path}, "
+                                 f"use a new campaign name to run a changed spec")
+            self.plan = manifest["plan"]
+        else:
+            self.plan = expand(self.spec, default_cr)
+            tmp = self.manifest_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"spec": self.spec, "created": time.time(), "plan": self.plan}, f, indent=2)
+            os.replace(tmp, self.manifest_path)
+
+    def result_path(self, run_id: str) -> str:
+        return os.path.join(self.results_dir, f"{run_id}_dash.json")
+
+    def pending(self) -> list:
+        """Returns the planned runs without a result file, in plan order."""
+        return [entry for entry in self.plan if not os.path.exists(self.result_path(entry["run_id"]))]
+
+    def log(self, **record):
+        # one write per line, sessions running in parallel append to the same log
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps({"time": time.time()} | record) + "\n")
+
+    def execute(self, entry: dict, run) -> bool:
+        """Calls run(entry) unless the run completed before, retrying failures with exponential backoff."""
+        if os.path.exists(self.result_path(entry["run_id"])):
+            return True
+        for attempt in range(self.retries + 1):
+            start = time.monotonic()
+            try:
+                run(entry)
+            except Exception as e:
+                self.log(run_id=entry["run_id"], attempt=attempt, status="failed", seconds=time.monotonic() - start,
+                         error=repr(e), traceback=traceback.format_exc())
+                print(f"\033[93mWARNING: {entry['run_id']} failed (attempt {attempt + 1} of {self.retries + 1}): "
+                      f"{e}\033[0m")
+                if attempt < self.retries:
+                    time.sleep(self.backoff_s * 2 ** attempt)
+                continue
+            self.log(run_id=entry["run_id"], attempt=attempt, status="done", seconds=time.monotonic() - start)
+            return True
+        return False
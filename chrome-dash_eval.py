@@ -1,130 +1,887 @@
 import argparse
 import os
 import json
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.ticker import MaxNLocator
 
-def load_data(dir_json_files):
-    dfs_canplay, dfs_buffer, dfs_dropped, dfs_resolution, dfs_stall = [], [], [], [], []
+from metrics_codec import decode_metrics
+from netlog_parser import parse_netlog
+from qlog_parser import parse_qlog
+from qoe import QOE_METRICS, bootstrap_summary, qoe_table, timeseries_bands
+from timegrid import ANCHORS, quantile_bands, resample
 
-    for filename in os.listdir(dir_json_files):
-        if not filename.endswith(".json"):
+PROTOCOLS = {
+    "tcp": "TCP HTTPS/2",
+    "quic-ss": "picoquic HyStart",
+    "quic-cr": "picoquic Careful Resume",
+}
+PROTOCOL_ORDER = ["TCP HTTPS/2", "picoquic Careful Resume", "picoquic HyStart"]
+
+# parsed tables are cached next to the result files, bump the version whenever _parse_run changes
+CACHE_DIR = ".eval_cache"
+CACHE_VERSION = 7
+
+# columns of the five tables returned by load_data, protocol and iteration are added per run
+TABLES = {
+    "canplay": ["canplay_delay_s"],
+    "buffer": ["timestamp", "bufferLevel"],
+    "dropped": ["timestamp", "droppedFrames"],
+    "resolution": ["timestamp", "width", "height", "bitrate_kbps"],
+    "stall": ["stall_start_s", "stall_duration_s"],
+}
+
+# runner phases (see PhaseTimer in chrome-dash_run.py) during which the video is fetched and played
+MEASURING_PHASES = ["chrome_get", "playback"]
+
+# one row per media segment request, returned by load_segments
+SEGMENT_COLUMNS = ["request_s", "video", "index", "quality", "bytes", "connect_ms", "ttfb_ms", "download_ms",
+                   "latency_ms", "throughput_mbps"]
+
+# polled samples with their unrounded time (ms since the epoch) and one row of anchor times per run,
+# returned by load_timeseries for resampling onto a common time grid (see timegrid.py)
+SAMPLE_COLUMNS = ["time_ms", "bufferLevel", "droppedFrames", "area", "bitrate_kbps"]
+ANCHOR_COLUMNS = ["fetch_start_ms", "can_play_ms", "driver_get_ms", "first_sample_ms"]
+
+# tables parsed and cached besides the ones of load_data
+EXTRA_TABLES = {"segment": SEGMENT_COLUMNS, "sample": SAMPLE_COLUMNS, "anchor": ANCHOR_COLUMNS}
+
+
+def _protocol(filename):
+    for prefix, protocol in PROTOCOLS.items():
+        if filename.startswith(prefix):
+            return protocol
+    return None
+
+
+def _parse_run(path):
+    """Parses one result file into per-table dicts of NumPy columns."""
+    with open(path) as f:
+        data = json.load(f)
+
+    chrome = data.get("chrome_metrics", {})
+    if data.get("chrome_metrics_encoding"):
+        chrome = decode_metrics(chrome)
+    perf = data.get("chrome_performanceTiming", {})
+    fetch_start = perf.get("fetchStart")
+    tables = {}
+
+    # JSON null (NaN in the browser) becomes NaN, the tables below only keep the samples with a time
+    current_times = np.array(chrome.get("currentTime", []), dtype=float)
+    sampled = ~np.isnan(current_times)
+    if sampled.any():
+        t0 = round(current_times[sampled][0] / 1000)
+        timestamps = (np.round(np.where(sampled, current_times, 0) / 1000) - t0).astype(np.int64)
+
+    # 1) canPlay delay
+    can_play_times = chrome.get("canPlay", [])
+    if len(can_play_times) > 0 and fetch_start is not None:
+        tables["canplay"] = {"canplay_delay_s": np.array([(can_play_times[0] - fetch_start) / 1000])}
+
+    # 2) bufferLevel timeseries
+    buffer_levels = chrome.get("bufferLevel", [])
+    if len(current_times) == len(buffer_levels) and sampled.any():
+        tables["buffer"] = {"timestamp": timestamps[sampled],
+                            "bufferLevel": np.array(buffer_levels, dtype=float)[sampled]}
+
+    # 3) droppedFrames stepplot
+    dropped_frames = chrome.get("droppedFrames", [])
+    if len(dropped_frames) == len(current_times) and sampled.any():
+        dropped = [val.get("droppedFrames", 0) if isinstance(val, dict) else 0 for val in dropped_frames]
+        tables["dropped"] = {"timestamp": timestamps[sampled],
+                             "droppedFrames": np.array(dropped, dtype=np.int64)[sampled]}
+
+    # 4) resolution timeseries, samples without a representation yet are skipped
+    res_height = chrome.get("resHeight", [])
+    res_width = chrome.get("resWidth", [])
+    if len(res_height) == len(res_width) == len(current_times) and sampled.any():
+        height = np.array(res_height, dtype=float)
+        width = np.array(res_width, dtype=float)
+        bitrate = np.array(chrome.get("reportedBitrate", []), dtype=float)
+        if len(bitrate) != len(current_times):
+            bitrate = np.full(len(current_times), np.nan)
+        valid = sampled & ~(np.isnan(height) | np.isnan(width))
+        tables["resolution"] = {
+            "timestamp": timestamps[valid],
+            "width": width[valid].astype(np.int64),
+            "height": height[valid].astype(np.int64),
+            "bitrate_kbps": bitrate[valid],
+        }
+
+    # 5) stall events
+    stall_durations = chrome.get("stallDuration", [])
+    stall_start_times = chrome.get("stallStartTime", [])
+    if sampled.any() and len(stall_durations) == len(stall_start_times) and len(stall_durations) > 0:
+        tables["stall"] = {
+            "stall_start_s": np.array(stall_start_times, dtype=float) / 1000.0 - t0,
+            "stall_duration_s": np.array(stall_durations, dtype=float) / 1000.0,
+        }
+
+    # runs recorded with DevTools Media events instead of polling (or polled before the player had a
+    # representation) get their resolution and stall tables from the events
+    media = data.get("chrome_media_events")
+    if media and sampled.any():
+        for name, table in _parse_media_events(media, t0).items():
+            if name not in tables or len(tables[name][TABLES[name][0]]) == 0:
+                tables[name] = table
+
+    # 6) unrounded samples and anchors
+    if sampled.any():
+        def column(values):
+            if len(values) != len(current_times):
+                return np.full(sampled.sum(), np.nan)
+            return np.array(values, dtype=float)[sampled]
+        dropped = [val.get("droppedFrames", np.nan) if isinstance(val, dict) else np.nan for val in dropped_frames]
+        tables["sample"] = {
+            "time_ms": current_times[sampled],
+            "bufferLevel": column(buffer_levels),
+            "droppedFrames": column(dropped),
+            "area": column(res_width) * column(res_height),
+            "bitrate_kbps": column(chrome.get("reportedBitrate", [])),
+        }
+        tables["anchor"] = {
+            "fetch_start_ms": np.array([np.nan if fetch_start is None else fetch_start], dtype=float),
+            "can_play_ms": np.array([can_play_times[0] if len(can_play_times) > 0 else np.nan], dtype=float),
+            "driver_get_ms": np.array([data.get("chrome_driver.get()", np.nan)], dtype=float),
+            "first_sample_ms": current_times[sampled][:1],
+        }
+
+    # 7) per-segment download timing
+    segments = _parse_segments(chrome.get("segments", []), chrome.get("resourceTiming", []))
+    if segments and sampled.any():
+        segments["request_s"] = segments["request_s"] / 1000.0 - t0
+        tables["segment"] = segments
+
+    return tables
+
+
+def _media_event_time(record):
+    # player events carry the browser's timestamp in seconds, everything else the time it arrived
+    timestamp = record.get("timestamp")
+    return timestamp * 1000 if timestamp and timestamp > 1e9 else record["received"]
+
+
+def _parse_media_events(media, t0):
+    """Derives the resolution and stall tables from DevTools Media domain events."""
+    tables = {}
+
+    resolution = []
+    for prop in media.get("properties", []):
+        match = re.search(r"(\d+)\D+(\d+)", str(prop.get("value"))) if "resolution" in prop["name"].lower() else None
+        if match:
+            resolution.append((prop["received"], int(match.group(1)), int(match.group(2))))
+    if resolution:
+        # resample the changes to one sample per second like the polled metrics, until the last event
+        times, width, height = (np.array(column) for column in zip(*sorted(resolution)))
+        changes = (np.round(times / 1000) - t0).astype(np.int64)
+        last = max(record["received"] for records in (media.get("events", []), media.get("properties", []))
+                   for record in records)
+        seconds = np.arange(changes[0], max(changes[-1], round(last / 1000) - t0) + 1)
+        idx = np.searchsorted(changes, seconds, side="right") - 1
+        tables["resolution"] = {"timestamp": seconds, "width": width[idx].astype(np.int64),
+                                "height": height[idx].astype(np.int64), "bitrate_kbps": np.full(len(seconds), np.nan)}
+
+    # buffering state changes, of the whole pipeline if reported, otherwise of any stream
+    states = [(_media_event_time(record), str(record.get("value")))
+              for record in media.get("events", []) + media.get("properties", [])
+              if "BUFFERING_HAVE_" in str(record.get("value"))]
+    if any("pipeline" in value for _, value in states):
+        states = [(time, value) for time, value in states if "pipeline" in value]
+    stalls, playing, stall_start = [], False, None
+    for time, value in sorted(states):
+        if "BUFFERING_HAVE_NOTHING" in value:
+            # running out of data before playback started is startup, not a stall
+            if playing and stall_start is None:
+                stall_start = time
+        else:
+            playing = True
+            if stall_start is not None:
+                stalls.append((stall_start, time - stall_start))
+                stall_start = None
+    if stalls:
+        start, duration = (np.array(column, dtype=float) for column in zip(*stalls))
+        tables["stall"] = {"stall_start_s": start / 1000.0 - t0, "stall_duration_s": duration / 1000.0}
+
+    return tables
+
+
+def _parse_segments(segments, resource_timing):
+    """Joins dash.js fragment requests with their Resource Timing entries.
+
+    Resource Timing is preferred as it separates connection setup, TTFB and transfer. dash.js
+    only knows when the request was issued, when the first progress event fired and when it ended.
+    """
+    entries = {}
+    for entry in resource_timing:
+        if entry and entry.get("url"):
+            entries.setdefault(entry["url"], []).append(entry)
+
+    rows = []
+    for segment in segments:
+        if not segment or segment.get("type") != "MediaSegment" or segment.get("error"):
             continue
-        if not (filename.startswith("tcp") or filename.startswith("quic-ss") or filename.startswith("quic-cr")):
+        # a URL requested again (e.g. after an abandoned request) matches its entries in order
+        queue = entries.get(segment.get("url"))
+        entry = queue.pop(0) if queue else {}
+
+        start = entry.get("startTime") or segment.get("requestStart")
+        request = entry.get("requestStart") or segment.get("requestStart")
+        first_byte = entry.get("responseStart") or segment.get("firstByte")
+        end = entry.get("responseEnd") or segment.get("requestEnd")
+        if start is None or request is None or first_byte is None or end is None:
             continue
+        connect = 0
+        if entry.get("connectStart") and entry.get("connectEnd"):
+            connect = entry["connectEnd"] - entry["connectStart"]
+        rows.append((start, segment.get("mediaType") == "video", segment.get("index", -1), segment.get("quality", -1),
+                     segment.get("bytes") or entry.get("encodedBodySize") or 0, connect,
+                     first_byte - request, end - first_byte, end - start))
+    if not rows:
+        return {}
+
+    start, video, index, quality, size, connect, ttfb, download, latency = (np.array(column) for column in zip(*rows))
+    download = download.astype(float)
+    return {
+        "request_s": start.astype(float),
+        "video": video.astype(bool),
+        "index": np.nan_to_num(index.astype(float), nan=-1).astype(np.int64),
+        "quality": np.nan_to_num(quality.astype(float), nan=-1).astype(np.int64),
+        "bytes": size.astype(np.int64),
+        "connect_ms": connect.astype(float),
+        "ttfb_ms": ttfb.astype(float),
+        "download_ms": download,
+        "latency_ms": latency.astype(float),
+        # transfers below the timer resolution have no meaningful throughput
+        "throughput_mbps": np.divide(size * 8 / 1000, download, out=np.full(len(rows), np.nan), where=download > 0),
+    }
+
+
+def _assemble(filenames, protocols, runs, name):
+    """Concatenates one table of all runs, protocol and iteration become categoricals."""
+    columns = TABLES[name] if name in TABLES else EXTRA_TABLES[name]
+    parts = [run.get(name) for run in runs]
+    lengths = np.array([len(part[columns[0]]) if part else 0 for part in parts], dtype=np.int64)
+    run_idx = np.repeat(np.arange(len(runs)), lengths)
+
+    protocol_codes = np.array([PROTOCOL_ORDER.index(p) for p in protocols], dtype=np.int8)
+    df = {"protocol": pd.Categorical.from_codes(protocol_codes[run_idx] if len(runs) else [], categories=PROTOCOL_ORDER)}
+    for column in columns:
+        values = [part[column] for part in parts if part]
+        df[column] = np.concatenate(values) if values else np.array([])
+    df["iteration"] = pd.Categorical.from_codes(run_idx, categories=filenames)
+    df = pd.DataFrame(df)
+
+    if name == "resolution":
+        # combine resWidth and resHeight as resolution string, plot by area
+        pairs, inverse = np.unique(np.stack([df["width"].to_numpy(), df["height"].to_numpy()], axis=1),
+                                   axis=0, return_inverse=True)
+        labels = np.array([f"{w}x{h}" for w, h in pairs], dtype=object)
+        df.insert(2, "resolution", labels[inverse.ravel()])
+        df.insert(3, "area", df.pop("width") * df.pop("height"))
+
+    return df
+
+
+def _parse_runs(paths, workers):
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_parse_run, paths, chunksize=max(1, len(paths) // (workers * 4))))
+    return [_parse_run(path) for path in paths]
+
+
+def _read_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "index.json")) as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return index if index.get("version") == CACHE_VERSION else None
+
+
+def _read_cache(cache_dir):
+    """Returns the cache index and per-run tables backed by memory-mapped columns."""
+    index = _read_index(cache_dir)
+    if index is None:
+        return {}
+
+    runs = [{} for _ in index["runs"]]
+    for name, dtypes in index["tables"].items():
+        offsets = np.load(os.path.join(cache_dir, f"{name}.offsets.npy"))
+        # a column file may be longer than the offsets after an interrupted append
+        end = int(offsets[len(runs)])
+        data = {column: np.memmap(os.path.join(cache_dir, f"{name}.{column}.bin"), dtype=dtype, mode="r", shape=(end,))
+                if end else np.empty(0, dtype=dtype) for column, dtype in dtypes.items()}
+        for i, run in enumerate(runs):
+            if offsets[i + 1] > offsets[i]:
+                run[name] = {column: values[offsets[i]:offsets[i + 1]] for column, values in data.items()}
+    return {entry["filename"]: (entry, run) for entry, run in zip(index["runs"], runs)}
+
+
+def _append_cache(cache_dir, index, entries, runs):
+    """Appends the tables of runs to the raw column files of a cache, its offsets and index are replaced last."""
+    count = len(index["runs"])
+    known = set(index["tables"])
+    tables = index["tables"]
+    for run in runs:
+        for name, table in run.items():
+            tables.setdefault(name, {column: values.dtype.str for column, values in table.items()})
 
-        protocol = None
-        if filename.startswith("tcp"):
-            protocol = "TCP HTTPS/2"
-        elif filename.startswith("quic-ss"):
-            protocol = "picoquic HyStart"
-        elif filename.startswith("quic-cr"):
-            protocol = "picoquic Careful Resume"
-
-        with open(os.path.join(dir_json_files, filename)) as f:
-            data = json.load(f)
-
-        chrome = data.get("chrome_metrics", {})
-        perf = data.get("chrome_performanceTiming", {})
-        fetch_start = perf.get("fetchStart")
-
-        # 1) canPlay delay
-        can_play_times = chrome.get("canPlay", [])
-        if len(can_play_times) > 0 and fetch_start is not None:
-            first_canplay = can_play_times[0]
-            delay_s = (first_canplay - fetch_start) / 1000
-            dfs_canplay.append({
-                "protocol": protocol,
-                "canplay_delay_s": delay_s,
-                "iteration": filename
-            })
-
-        # 2) bufferLevel timeseries
-        buffer_levels = chrome.get("bufferLevel", [])
-        current_times = chrome.get("currentTime", [])
-        if len(current_times) == len(buffer_levels) and len(buffer_levels) > 0:
-            t0 = round(current_times[0] / 1000)
-            for ts_raw, val in zip(current_times, buffer_levels):
-                ts = round(ts_raw / 1000) - t0
-                dfs_buffer.append({
-                    "protocol": protocol,
-                    "timestamp": ts,
-                    "bufferLevel": val,
-                    "iteration": filename
-                })
-
-        # 3) droppedFrames stepplot
-        dropped_frames = chrome.get("droppedFrames", [])
-        if len(dropped_frames) == len(current_times) and len(dropped_frames) > 0:
-            t0 = round(current_times[0] / 1000)
-            for ts_raw, val in zip(current_times, dropped_frames):
-                ts = round(ts_raw / 1000) - t0
-                if val is None:
-                    dropped = 0
-                elif isinstance(val, dict):
-                    dropped = val.get("droppedFrames", 0)
-                else:
-                    dropped = 0
-                dfs_dropped.append({
-                    "protocol": protocol,
-                    "timestamp": ts,
-                    "droppedFrames": dropped,
-                    "iteration": filename
-                })
-
-        # 4) resolution timeseries combining resWidth and resHeight as resolution string, plot by area
-        res_height = chrome.get("resHeight", [])
-        res_width = chrome.get("resWidth", [])
-        if len(res_height) == len(res_width) == len(current_times) and len(res_height) > 0:
-            t0 = round(current_times[0] / 1000)
-            for ts_raw, h, w in zip(current_times, res_height, res_width):
-                ts = round(ts_raw / 1000) - t0
-                if h is None or w is None:
-                    continue
-                resolution = f"{w}x{h}"
-                area = w * h
-                dfs_resolution.append({
-                    "protocol": protocol,
-                    "timestamp": ts,
-                    "resolution": resolution,
-                    "area": area,
-                    "iteration": filename
-                })
-
-        # 5) stall events
-        stall_durations = chrome.get("stallDuration", [])
-        stall_start_times = chrome.get("stallStartTime", [])
-        if (
-            len(current_times) > 0
-            and len(stall_durations) == len(stall_start_times)
-            and len(stall_durations) > 0
-        ):
-            t0 = round(current_times[0] / 1000.0)
-            for st_start, st_dur in zip(stall_start_times, stall_durations):
-                dfs_stall.append({
-                    "protocol": protocol,
-                    "stall_start_s": (st_start / 1000.0 ) - t0,
-                    "stall_duration_s": st_dur / 1000.0,
-                    "iteration": filename,
-                })
-
-    # Convert to DataFrames
-    df_canplay = pd.DataFrame(dfs_canplay)
-    df_buffer = pd.DataFrame(dfs_buffer)
-    df_dropped = pd.DataFrame(dfs_dropped)
-    df_resolution = pd.DataFrame(dfs_resolution)
-    df_stall = pd.DataFrame(dfs_stall)
-
-    return df_canplay, df_buffer, df_dropped, df_resolution, df_stall
+    for name, dtypes in tables.items():
+        if name in known:
+            offsets = np.load(os.path.join(cache_dir, f"{name}.offsets.npy"))[:count + 1]
+        else:
+            offsets = np.zeros(count + 1, dtype=np.int64)
+        end = int(offsets[-1])
+        for column, dtype in dtypes.items():
+            values = [run[name][column] for run in runs if name in run]
+            with open(os.path.join(cache_dir, f"{name}.{column}.bin"), "r+b" if name in known else "wb") as f:
+                # drop what an interrupted append left behind the last run
+                f.truncate(end * np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                if values:
+                    f.write(np.ascontiguousarray(np.concatenate(values), dtype=dtype).tobytes())
+        lengths = [len(run[name][next(iter(dtypes))]) if name in run else 0 for run in runs]
+        with open(os.path.join(cache_dir, f"{name}.offsets.tmp"), "wb") as f:
+            np.save(f, np.concatenate([offsets, end + np.cumsum(lengths, dtype=np.int64)]))
+        os.replace(os.path.join(cache_dir, f"{name}.offsets.tmp"), os.path.join(cache_dir, f"{name}.offsets.npy"))
+
+    with open(os.path.join(cache_dir, "index.tmp"), "w") as f:
+        json.dump({"version": CACHE_VERSION, "tables": tables, "runs": index["runs"] + entries}, f)
+    os.replace(os.path.join(cache_dir, "index.tmp"), os.path.join(cache_dir, "index.json"))
+
+
+def _write_cache(cache_dir, entries, runs):
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    _append_cache(tmp_dir, {"tables": {}, "runs": []}, entries, runs)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.rename(tmp_dir, cache_dir)
+
+
+def _load_runs(dir_json_files, workers=None, use_cache=True):
+    """Parses all result files, reusing the on-disk cache for files that did not change."""
+    filenames = sorted(f for f in os.listdir(dir_json_files) if f.endswith(".json") and _protocol(f))
+    paths = [os.path.join(dir_json_files, f) for f in filenames]
+    entries = []
+    for filename, path in zip(filenames, paths):
+        st = os.stat(path)
+        entries.append({"filename": filename, "mtime_ns": st.st_mtime_ns, "size": st.st_size})
+
+    cache_dir = os.path.join(dir_json_files, CACHE_DIR)
+    cached = _read_cache(cache_dir) if use_cache else {}
+    runs = [None] * len(filenames)
+    for i, entry in enumerate(entries):
+        hit = cached.get(entry["filename"])
+        if hit and hit[0] == entry:
+            runs[i] = hit[1]
+
+    missing = [i for i, run in enumerate(runs) if run is None]
+    for i, run in zip(missing, _parse_runs([paths[i] for i in missing], workers)):
+        runs[i] = run
+    print(f"Parsed {len(missing)} of {len(filenames)} result files, {len(filenames) - len(missing)} from cache")
+
+    # runs of added files are appended to the cache, changed or deleted files rewrite it
+    hits = len(filenames) - len(missing)
+    if use_cache and cached and hits == len(cached) and missing:
+        _append_cache(cache_dir, _read_index(cache_dir), [entries[i] for i in missing], [runs[i] for i in missing])
+    elif use_cache and (missing or hits != len(cached)):
+        _write_cache(cache_dir, entries, runs)
+
+    return filenames, [_protocol(f) for f in filenames], runs
+
+
+def load_data(dir_json_files, workers=None, use_cache=True):
+    filenames, protocols, runs = _load_runs(dir_json_files, workers, use_cache)
+    return tuple(_assemble(filenames, protocols, runs, name) for name in TABLES)
+
+
+def load_segments(dir_json_files, workers=None, use_cache=True):
+    """Returns one row per media segment request, request_s is relative to the run's first sample."""
+    filenames, protocols, runs = _load_runs(dir_json_files, workers, use_cache)
+    return _assemble(filenames, protocols, runs, "segment")
+
+
+def load_timeseries(dir_json_files, workers=None, use_cache=True):
+    """Returns the polled samples with unrounded times and the anchor times of every run (see timegrid.py)."""
+    filenames, protocols, runs = _load_runs(dir_json_files, workers, use_cache)
+    return _assemble(filenames, protocols, runs, "sample"), _assemble(filenames, protocols, runs, "anchor")
+
+
+def _run_t0(path):
+    with open(path) as f:
+        data = json.load(f)
+    current_times = data.get("chrome_metrics", {}).get("currentTime", [])
+    if data.get("chrome_metrics_encoding"):
+        current_times = decode_metrics({"currentTime": current_times})["currentTime"]
+    current_times = [t for t in current_times if t is not None]
+    return round(current_times[0] / 1000) if current_times else None
+
+
+def _parse_qlog_run(qlog_path, dash_path):
+    """Parses a qlog file with times relative to the first sample of its run's dash metrics."""
+    t0 = _run_t0(dash_path)
+    if t0 is None:
+        return None
+    tables = parse_qlog(qlog_path)
+    cc = {column: np.asarray(values, dtype=float) for column, values in tables["metrics"].items()}
+    cc["timestamp"] = (np.round(cc.pop("time_ms") / 1000) - t0).astype(np.int64)
+    return {
+        "cc": cc,
+        "loss": {"timestamp": np.asarray(tables["loss"]["time_ms"], dtype=float) / 1000 - t0},
+        "cr": {"timestamp": np.asarray(tables["cr"]["time_ms"], dtype=float) / 1000 - t0,
+               "state": np.asarray(tables["cr"]["state"], dtype=object)},
+    }
+
+
+def load_transport(dir_json_files, workers=None):
+    """Loads picoquic qlog files and aligns them on wall-clock time with their run's dash metrics.
+
+    qlogs are named <run>_<connection>.qlog(.gz) by the runner and belong to <run>_dash.json.
+    """
+    names = os.listdir(dir_json_files)
+    runs = {f[:-len("_dash.json")]: f for f in names if f.endswith("_dash.json") and _protocol(f)}
+    pairs = []
+    for f in sorted(names):
+        if not f.endswith((".qlog", ".qlog.gz")):
+            continue
+        matches = [run for run in runs if f.startswith(run + "_")]
+        if matches:
+            pairs.append((f, runs[max(matches, key=len)]))
+
+    workers = workers or os.cpu_count()
+    qlog_paths = [os.path.join(dir_json_files, qlog) for qlog, _ in pairs]
+    dash_paths = [os.path.join(dir_json_files, dash) for _, dash in pairs]
+    if workers > 1 and len(pairs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_parse_qlog_run, qlog_paths, dash_paths))
+    else:
+        parsed = [_parse_qlog_run(q, d) for q, d in zip(qlog_paths, dash_paths)]
+
+    frames = {"cc": [], "loss": [], "cr": []}
+    for (_, dash), tables in zip(pairs, parsed):
+        if tables is None:
+            continue
+        for name, columns in tables.items():
+            df = pd.DataFrame(columns)
+            df.insert(0, "protocol", _protocol(dash))
+            df["iteration"] = dash
+            frames[name].append(df)
+
+    columns = {"cc": ["timestamp", "cwnd", "smoothed_rtt", "bytes_in_flight"], "loss": ["timestamp"],
+               "cr": ["timestamp", "state"]}
+    return tuple(pd.concat(frames[name], ignore_index=True) if frames[name]
+                 else pd.DataFrame(columns=["protocol", *columns[name], "iteration"])
+                 for name in ("cc", "loss", "cr"))
+
+
+def _parse_netlog_run(netlog_path, dash_path):
+    """Parses a NetLog with times relative to the first sample of its run's dash metrics."""
+    t0 = _run_t0(dash_path)
+    if t0 is None:
+        return None
+    tables = parse_netlog(netlog_path)
+
+    sessions = {column: np.asarray(values) for column, values in tables["sessions"].items()}
+    setup = sessions.pop("setup_ms")
+    sessions = {
+        "kind": sessions["kind"].astype(object),
+        "setup_s": setup / 1000 - t0,
+        "connect_ms": sessions["connect_ms"] - setup,
+        "handshake_ms": sessions["handshake_ms"] - setup,
+        # an HTTP/2 session is created once its TLS connection is up, a QUIC session before its handshake
+        "ready_ms": np.where(sessions["kind"] == "h2", sessions["start_ms"] - setup, np.nan),
+    }
+
+    streams = {column: np.asarray(values) for column, values in tables["streams"].items()}
+    streams = {
+        "open_s": streams["open_ms"] / 1000 - t0,
+        "duration_ms": streams["close_ms"] - streams["open_ms"],
+        "bytes": streams["bytes"],
+    }
+
+    # received payload and open streams per second, seconds without traffic count as zero
+    received = tables["received"]
+    seconds = (np.round(np.asarray(received["time_ms"]) / 1000) - t0).astype(np.int64)
+    open_s = np.round(streams["open_s"])
+    close_s = np.round(streams["open_s"] + np.nan_to_num(streams["duration_ms"], nan=np.inf) / 1000)
+    first = int(min(seconds.min(initial=0), open_s.min(initial=0)))
+    last = int(max(seconds.max(initial=0), np.nan_to_num(close_s, posinf=open_s.max(initial=0)).max(initial=0)))
+    grid = np.arange(first, last + 1)
+    received_bytes = np.bincount(seconds - first, weights=np.asarray(received["bytes"], dtype=float),
+                                 minlength=len(grid))
+    open_streams = ((open_s[:, None] <= grid) & (grid < close_s[:, None])).sum(axis=0)
+    timeline = {"timestamp": grid, "received_mbps": received_bytes * 8 / 1e6, "open_streams": open_streams}
+
+    return {"sessions": sessions, "streams": streams, "timeline": timeline}
+
+
+def load_netlog(dir_json_files, workers=None):
+    """Loads Chrome NetLogs and aligns them on wall-clock time with their run's dash metrics.
+
+    NetLogs are named <run>.netlog by the runner and belong to <run>_dash.json, so TCP and
+    QUIC runs get the same transport-level view.
+    """
+    pairs = [(f, f[:-len(".netlog")] + "_dash.json") for f in sorted(os.listdir(dir_json_files))
+             if f.endswith(".netlog") and _protocol(f)]
+    pairs = [(netlog, dash) for netlog, dash in pairs if os.path.exists(os.path.join(dir_json_files, dash))]
+
+    workers = workers or os.cpu_count()
+    netlog_paths = [os.path.join(dir_json_files, netlog) for netlog, _ in pairs]
+    dash_paths = [os.path.join(dir_json_files, dash) for _, dash in pairs]
+    if workers > 1 and len(pairs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_parse_netlog_run, netlog_paths, dash_paths))
+    else:
+        parsed = [_parse_netlog_run(n, d) for n, d in zip(netlog_paths, dash_paths)]
+
+    frames = {"sessions": [], "streams": [], "timeline": []}
+    for (_, dash), tables in zip(pairs, parsed):
+        if tables is None:
+            continue
+        for name, columns in tables.items():
+            df = pd.DataFrame(columns)
+            df.insert(0, "protocol", _protocol(dash))
+            df["iteration"] = dash
+            frames[name].append(df)
+
+    columns = {"sessions": ["kind", "setup_s", "connect_ms", "handshake_ms", "ready_ms"],
+               "streams": ["open_s", "duration_ms", "bytes"],
+               "timeline": ["timestamp", "received_mbps", "open_streams"]}
+    return tuple(pd.concat(frames[name], ignore_index=True) if frames[name]
+                 else pd.DataFrame(columns=["protocol", *columns[name], "iteration"])
+                 for name in ("sessions", "streams", "timeline"))
+
+
+def plot_netlog(df_buffer, df_sessions, df_streams, df_timeline, dir_json_files):
+    """Plots the NetLog timeline of all protocols below buffer level."""
+    sns.set(style="whitegrid")
+
+    protocol_order = PROTOCOL_ORDER
+    palette = sns.color_palette(n_colors=3)
+    protocol_palette = dict(zip(protocol_order, palette))
+
+    fig, axs = plt.subplots(5, 1, figsize=(9, 18))
+    for ax in axs[2:]:
+        ax.sharex(axs[1])
+
+    setup = df_sessions.melt(id_vars=["protocol"], value_vars=["connect_ms", "handshake_ms", "ready_ms"],
+                             var_name="phase", value_name="ms").dropna()
+    sns.boxplot(data=setup, x="phase", y="ms", hue="protocol", ax=axs[0], hue_order=protocol_order,
+                palette=protocol_palette)
+    axs[0].set_title("Session setup since connection start (TCP connect, TLS/QUIC handshake, session ready)")
+    axs[0].set_xlabel("")
+    axs[0].set_ylabel("Time (ms)")
+
+    lineplot = dict(x="timestamp", hue="protocol", estimator=np.median, errorbar=("pi", 50),
+                    hue_order=protocol_order, palette=protocol_palette)
+    sns.lineplot(data=df_buffer, y="bufferLevel", ax=axs[1], **lineplot)
+    axs[1].set_title("Buffer Level")
+    axs[1].set_ylabel("Buffer Level (seconds)")
+
+    sns.lineplot(data=df_timeline, y="received_mbps", ax=axs[2], **lineplot)
+    axs[2].set_title("Stream payload received")
+    axs[2].set_ylabel("Mbit/s")
+
+    sns.lineplot(data=df_timeline, y="open_streams", ax=axs[3], drawstyle="steps-post", **lineplot)
+    axs[3].set_title("Open request streams")
+    axs[3].set_ylabel("Streams")
+    axs[3].yaxis.set_major_locator(MaxNLocator(integer=True))
+
+    sns.scatterplot(data=df_streams, x="open_s", y="duration_ms", hue="protocol", ax=axs[4],
+                    hue_order=protocol_order, palette=protocol_palette, s=10)
+    axs[4].set_yscale("log")
+    axs[4].set_title("Stream open to close")
+    axs[4].set_xlabel("Time (seconds)")
+    axs[4].set_ylabel("Duration (ms)")
+
+    plt.tight_layout()
+    plt.savefig(f"{dir_json_files}/netlog.png")
+
+
+def plot_transport(df_buffer, df_resolution, df_cc, df_loss, df_cr, dir_json_files):
+    """Plots congestion control state from qlogs below buffer level and resolution."""
+    sns.set(style="whitegrid")
+
+    protocol_order = PROTOCOL_ORDER
+    palette = sns.color_palette(n_colors=3)
+    protocol_palette = dict(zip(protocol_order, palette))
+
+    fig, axs = plt.subplots(6, 1, figsize=(9, 21), sharex=True)
+
+    lineplot = dict(x="timestamp", hue="protocol", estimator=np.median, errorbar=("pi", 50),
+                    hue_order=protocol_order, palette=protocol_palette)
+    sns.lineplot(data=df_buffer, y="bufferLevel", ax=axs[0], **lineplot)
+    axs[0].set_title("Buffer Level")
+    axs[0].set_ylabel("Buffer Level (seconds)")
+
+    unique_res = df_resolution[['resolution', 'area']].drop_duplicates().sort_values('area')
+    sns.lineplot(data=df_resolution, y="area", ax=axs[1], **lineplot)
+    axs[1].set_yticks(unique_res['area'].tolist())
+    axs[1].set_yticklabels(unique_res['resolution'].tolist())
+    axs[1].set_title("Resolution")
+    axs[1].set_ylabel("Resolution")
+
+    sns.lineplot(data=df_cc, y="cwnd", ax=axs[2], **lineplot)
+    if not df_loss.empty:
+        sns.rugplot(data=df_loss, x="timestamp", hue="protocol", ax=axs[2], hue_order=protocol_order,
+                    palette=protocol_palette, legend=False)
+    axs[2].set_title("Congestion window (ticks: packet losses)")
+    axs[2].set_ylabel("cwnd (bytes)")
+
+    sns.lineplot(data=df_cc, y="smoothed_rtt", ax=axs[3], **lineplot)
+    axs[3].set_title("Smoothed RTT")
+    axs[3].set_ylabel("RTT (ms)")
+
+    sns.lineplot(data=df_cc, y="bytes_in_flight", ax=axs[4], **lineplot)
+    axs[4].set_title("Bytes in flight")
+    axs[4].set_ylabel("Bytes")
+
+    if not df_cr.empty:
+        sns.stripplot(data=df_cr, x="timestamp", y="state", hue="protocol", ax=axs[5], hue_order=protocol_order,
+                      palette=protocol_palette, native_scale=True, jitter=0.2)
+    axs[5].set_title("Careful Resume state changes")
+    axs[5].set_xlabel("Time (seconds)")
+    axs[5].set_ylabel("State")
+
+    plt.tight_layout()
+    plt.savefig(f"{dir_json_files}/transport.png")
+
+
+def _read_phases(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {key: data.get(key) for key in ("runner_phases", "picoquic_phases", "session")}
+
+
+def summarize_phases(dir_json_files, workers=None, top=5):
+    """Prints where the campaign's wall-clock time went and returns the phases as a tidy table.
+
+    Runner phases are sequential and add up to run_total, picoquic phases run in the server
+    process at the same time and are only listed per protocol. Session and campaign setup
+    is counted once per session and campaign.
+    """
+    filenames = sorted(f for f in os.listdir(dir_json_files) if f.endswith("_dash.json") and _protocol(f))
+    paths = [os.path.join(dir_json_files, f) for f in filenames]
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_read_phases, paths, chunksize=max(1, len(paths) // (workers * 4))))
+    else:
+        parsed = [_read_phases(path) for path in paths]
+
+    rows, sessions, campaigns = [], {}, {}
+    for filename, data in zip(filenames, parsed):
+        for source in ("runner", "picoquic"):
+            for phase, seconds in (data[f"{source}_phases"] or {}).items():
+                rows.append((_protocol(filename), filename, source, phase, seconds))
+        session = data["session"] or {}
+        if "started" in session:
+            sessions[(session["started"], session.get("slot"))] = sum(session.get("setup_phases", {}).values())
+            campaign = session.get("campaign") or {}
+            campaigns[campaign.get("started")] = sum(campaign.get("phases", {}).values())
+    df = pd.DataFrame(rows, columns=["protocol", "iteration", "source", "phase", "seconds"])
+    if df.empty:
+        print("No runner phases found, results were written before phases were recorded")
+        return df
+
+    runner = df[df["source"] == "runner"]
+    run_total = runner.loc[runner["phase"] == "run_total", "seconds"].sum()
+    measuring = runner.loc[runner["phase"].isin(MEASURING_PHASES), "seconds"].sum()
+    setup = sum(sessions.values()) + sum(campaigns.values())
+    total = run_total + setup
+    print(f"{len(filenames)} runs, {total / 3600:.2f} h: measuring {measuring / total:.1%}, "
+          f"run overhead {(run_total - measuring) / total:.1%}, "
+          f"session/campaign setup {setup / total:.1%} ({len(sessions)} sessions)")
+
+    # phases not covered by a timer, e.g. printing and Python overhead between them
+    covered = runner[runner["phase"] != "run_total"].groupby("iteration")["seconds"].sum()
+    totals = runner[runner["phase"] == "run_total"].set_index("iteration")["seconds"]
+    untimed = (totals - covered.reindex(totals.index, fill_value=0)).rename("seconds").reset_index()
+    untimed = untimed.assign(protocol=untimed["iteration"].map(_protocol), source="runner", phase="untimed")
+    df = pd.concat([df, untimed[df.columns]], ignore_index=True)
+
+    per_run = df[df["phase"] != "run_total"].groupby(["protocol", "source", "phase"])["seconds"].agg(
+        ["median", "mean", "max", "sum"])
+    for protocol in PROTOCOL_ORDER:
+        if protocol not in per_run.index.get_level_values("protocol"):
+            continue
+        slowest = per_run.loc[protocol].sort_values("sum", ascending=False).head(top)
+        print(f"\nSlowest phases of {protocol} (seconds per run, sum over runs):")
+        print(slowest.round(2).to_string())
+    return df
+
+
+def plot_segments(df_segment, dir_json_files, first_segments=10):
+    """Plots per-segment throughput and latency distributions of video segments."""
+    sns.set(style="whitegrid")
+
+    protocol_order = PROTOCOL_ORDER
+    palette = sns.color_palette(n_colors=3)
+    protocol_palette = dict(zip(protocol_order, palette))
+
+    df = df_segment[df_segment["video"]]
+    first = df[(df["index"] >= 0) & (df["index"] < df["index"].min() + first_segments)] if not df.empty else df
+
+    fig, axs = plt.subplots(5, 1, figsize=(9, 21))
+
+    ecdf = dict(hue="protocol", hue_order=protocol_order, palette=protocol_palette)
+    sns.ecdfplot(data=df, x="throughput_mbps", ax=axs[0], log_scale=True, **ecdf)
+    axs[0].set_title("Segment download throughput (first byte to last byte)")
+    axs[0].set_xlabel("Throughput (Mbit/s)")
+
+    sns.ecdfplot(data=df, x="ttfb_ms", ax=axs[1], log_scale=True, **ecdf)
+    axs[1].set_title("Segment time to first byte")
+    axs[1].set_xlabel("TTFB (ms)")
+
+    sns.ecdfplot(data=df, x="latency_ms", ax=axs[2], log_scale=True, **ecdf)
+    axs[2].set_title("Segment latency (request start to last byte)")
+    axs[2].set_xlabel("Latency (ms)")
+
+    box = dict(x="index", hue="protocol", hue_order=protocol_order, palette=protocol_palette)
+    sns.boxplot(data=first, y="latency_ms", ax=axs[3], **box)
+    axs[3].set_title(f"Latency of the first {first_segments} segments")
+    axs[3].set_xlabel("Segment index")
+    axs[3].set_ylabel("Latency (ms)")
+
+    sns.boxplot(data=first, y="throughput_mbps", ax=axs[4], **box)
+    axs[4].set_title(f"Throughput of the first {first_segments} segments")
+    axs[4].set_xlabel("Segment index")
+    axs[4].set_ylabel("Throughput (Mbit/s)")
+
+    plt.tight_layout()
+    plt.savefig(f"{dir_json_files}/segments.png")
+
+    summary = df.groupby("protocol", observed=False)[["ttfb_ms", "latency_ms", "throughput_mbps"]].quantile(
+        [0.1, 0.5, 0.9]).unstack()
+    print(summary.round(1).to_string())
+
+
+def load_segment_index(data_dir):
+    """Returns the segment index of every representation in data_dir (see box_index.py) and their init sizes.
+
+    dash.js numbers the qualities of an adaptation set by ascending @bandwidth, the quality of a
+    representation is its rank by the bandwidth recorded in its index.
+    """
+    summaries, tables = [], []
+    for height in os.listdir(data_dir):
+        segment_dir = os.path.join(data_dir, height, "out")
+        if not os.path.isfile(os.path.join(segment_dir, "segment_index.json")):
+            continue
+        with open(os.path.join(segment_dir, "segment_index.json")) as f:
+            summaries.append((json.load(f), int(height)))
+        tables.append(np.load(os.path.join(segment_dir, "segment_index.npy"), mmap_mode="r"))
+    if not summaries:
+        raise FileNotFoundError(f"no segment index in {data_dir}, create it with "
+                                f"scripts/video_processing/video_driver.py --action index")
+
+    order = sorted(range(len(summaries)), key=lambda i: (summaries[i][0]["bandwidth"], summaries[i][1]))
+    parts = []
+    for quality, i in enumerate(order):
+        table = tables[i]
+        parts.append(pd.DataFrame({"quality": quality, "height": summaries[i][1], "number": table["number"],
+                                   "segment_bytes": table["size"], "duration_s": table["duration_s"]}))
+    init_bytes = pd.Series({quality: summaries[i][0]["init_size"] for quality, i in enumerate(order)})
+    return pd.concat(parts, ignore_index=True), init_bytes
+
+
+def goodput_table(df_segment, df_index, init_bytes, start_number=1):
+    """Returns per run the downloaded video bytes according to the segment index and the effective goodput.
+
+    Every video request is looked up by quality and $Number$ (dash.js index + startNumber of
+    the MPD), an init segment is counted once per quality the run played. Goodput is the
+    downloaded bits over the time from the first request to the end of the last download.
+    """
+    df = df_segment[df_segment["video"] & (df_segment["index"] >= 0)]
+    df = df.assign(number=df["index"] + start_number)
+    df = df.merge(df_index, on=["quality", "number"], how="left")
+    df["end_s"] = df["request_s"] + df["latency_ms"] / 1000
+
+    grouped = df.groupby("iteration", observed=True)
+    runs = grouped.agg(protocol=("protocol", "first"), segments=("number", "size"),
+                       unindexed=("segment_bytes", lambda s: s.isna().sum()),
+                       reported_bytes=("bytes", "sum"), segment_bytes=("segment_bytes", "sum"),
+                       media_s=("duration_s", "sum"), first_request_s=("request_s", "min"), last_end_s=("end_s", "max"))
+    qualities = df.drop_duplicates(["iteration", "quality"])
+    runs["init_bytes"] = qualities["quality"].map(init_bytes).groupby(qualities["iteration"], observed=True).sum()
+    runs["bytes"] = runs["segment_bytes"] + runs["init_bytes"].fillna(0)
+    runs["download_s"] = runs["last_end_s"] - runs["first_request_s"]
+    runs["goodput_mbps"] = runs["bytes"] * 8 / 1e6 / runs["download_s"].where(lambda t: t > 0)
+    return runs.drop(columns=["first_request_s", "last_end_s"]).reset_index()
+
+
+def plot_timegrid(df_sample, df_anchor, dir_json_files, resolution_s=0.1, anchor="fetchStart", method="step"):
+    """Plots the median and interquartile band of the resampled timeseries per protocol.
+
+    The buffer level is interpolated with method, counters, resolution and bitrate change
+    in steps and are always resampled as such.
+    """
+    sns.set(style="whitegrid")
+    palette = dict(zip(PROTOCOL_ORDER, sns.color_palette(n_colors=3)))
+    panels = [("bufferLevel", "Buffer Level (seconds)"), ("droppedFrames", "Dropped Frames"),
+              ("area", "Resolution (pixels)"), ("bitrate_kbps", "Bitrate (kbit/s)")]
+
+    fig, axs = plt.subplots(len(panels), 1, figsize=(9, 14), sharex=True)
+    for ax, (column, label) in zip(axs, panels):
+        steps = column != "bufferLevel" or method == "step"
+        grid, values, runs = resample(df_sample, df_anchor, column, resolution_s, anchor,
+                                      "step" if steps else method)
+        bands = quantile_bands(grid, values, runs)
+        for protocol in PROTOCOL_ORDER:
+            band = bands[bands["protocol"] == protocol] if not bands.empty else bands
+            if band.empty:
+                continue
+            label_runs = f"{protocol} ({(runs['protocol'] == protocol).sum()} runs)"
+            ax.plot(band["time_s"], band["q50"], color=palette[protocol], label=label_runs,
+                    drawstyle="steps-post" if steps else "default")
+            ax.fill_between(band["time_s"], band["q25"], band["q75"], color=palette[protocol], alpha=0.25,
+                            linewidth=0, step="post" if steps else None)
+        ax.set_ylabel(label)
+        ax.set_title(f"{label.split(' (')[0]}: median and interquartile range")
+    axs[0].legend()
+    axs[-1].set_xlabel(f"Time since {anchor} (seconds, {resolution_s * 1000:g} ms grid)")
+
+    plt.tight_layout()
+    plt.savefig(f"{dir_json_files}/timegrid.png")
+
+
+def plot_qoe(df_summary, dir_json_files):
+    """Plots the per-protocol means and bootstrap confidence intervals of the QoE metrics."""
+    sns.set(style="whitegrid")
+    palette = dict(zip(PROTOCOL_ORDER, sns.color_palette(n_colors=3)))
+
+    fig, axs = plt.subplots(3, 3, figsize=(12, 10))
+    for ax, metric in zip(axs.flat, QOE_METRICS):
+        rows = df_summary[df_summary["metric"] == metric].set_index("protocol").reindex(PROTOCOL_ORDER).dropna(
+            subset=["mean"])
+        for x, (protocol, row) in enumerate(rows.iterrows()):
+            # identical runs give a zero-width interval that may miss the mean by rounding
+            yerr = [[max(row["mean"] - row["ci_low"], 0)], [max(row["ci_high"] - row["mean"], 0)]]
+            ax.errorbar(x, row["mean"], yerr=yerr,
+                        fmt="o", capsize=6, color=palette[protocol])
+            ax.plot(x, row["median"], marker="x", color=palette[protocol])
+        ax.set_xticks(range(len(rows)))
+        labels = [protocol.replace(" ", "\n", 1) + f"\n({row['runs']:.0f} runs)" for protocol, row in rows.iterrows()]
+        ax.set_xticklabels(labels, fontsize=7)
+        ax.set_xlim(-0.5, len(PROTOCOL_ORDER) - 0.5)
+        ax.set_title(metric)
+    fig.suptitle("QoE per run: mean with bootstrap CI (o) and median (x)")
+
+    plt.tight_layout()
+    plt.savefig(f"{dir_json_files}/qoe.png")
 
 
 def plot_all(df_canplay, df_buffer, df_dropped, df_resolution, df_stall, dir_json_files):
     sns.set(style="whitegrid")
 
-    protocol_order = ["TCP HTTPS/2", "picoquic Careful Resume", "picoquic HyStart"]
+    protocol_order = PROTOCOL_ORDER
     palette = sns.color_palette(n_colors=3)
     protocol_palette = dict(zip(protocol_order, palette))
 
@@ -154,62 +911,40 @@ def plot_all(df_canplay, df_buffer, df_dropped, df_resolution, df_stall, dir_jso
     axs[0].set_xlabel("")
     axs[0].set_ylabel("Delay (seconds)")
 
-    # 2) BufferLevel timeseries
+    # 2-4) timeseries as the median and interquartile range of all runs per protocol, aggregated once
     axs_shared = axs[1:]  # Share x-axis among last 4 subplots
     for ax in axs_shared[1:]:
         ax.sharex(axs_shared[0])
 
-    sns.lineplot(
-        data=df_buffer,
-        x="timestamp",
-        y="bufferLevel",
-        hue="protocol",
-        estimator=np.median,
-        errorbar=("pi", 50),
-        ax=axs[1],
-        hue_order=protocol_order,
-        palette=protocol_palette
-    )
+    def plot_bands(ax, df, column, steps=False):
+        bands = timeseries_bands(df, column)
+        for protocol in protocol_order:
+            band = bands[bands["protocol"] == protocol]
+            if band.empty:
+                continue
+            ax.plot(band["timestamp"], band["q50"], color=protocol_palette[protocol], label=protocol,
+                    drawstyle="steps-post" if steps else "default")
+            ax.fill_between(band["timestamp"], band["q25"], band["q75"], color=protocol_palette[protocol],
+                            alpha=0.2, linewidth=0, step="post" if steps else None)
+        ax.legend(title="protocol")
+
+    plot_bands(axs[1], df_buffer, "bufferLevel")
     axs[1].set_title("Buffer Level")
     axs[1].set_xlabel("Time (seconds)")
     axs[1].set_ylabel("Buffer Level (seconds)")
 
-    # 3) DroppedFrames step plot timeseries
-    sns.lineplot(
-        data=df_dropped,
-        x="timestamp",
-        y="droppedFrames",
-        hue="protocol",
-        estimator="median",
-        errorbar=("pi", 50),
-        drawstyle='steps-post',
-        ax=axs[2],
-        hue_order=protocol_order,
-        palette=protocol_palette
-    )
+    plot_bands(axs[2], df_dropped, "droppedFrames", steps=True)
     axs[2].set_title("Dropped Frames")
     axs[2].set_xlabel("Time (seconds)")
     axs[2].set_ylabel("Dropped Frames")
     axs[2].yaxis.set_major_locator(MaxNLocator(integer=True))  # Ensures y-axis uses only integers
 
-    # 4) Resolution timeseries as area with y-axis resolution ordered by area ascending
+    # y-axis resolution ordered by area ascending
     unique_res = df_resolution[['resolution', 'area']].drop_duplicates().sort_values('area')
     res_order = unique_res['resolution'].tolist()
     area_order = unique_res['area'].tolist()
 
-    df_resolution['resolution'] = pd.Categorical(df_resolution['resolution'], categories=res_order, ordered=True)
-
-    sns.lineplot(
-        data=df_resolution,
-        x='timestamp',
-        y='area',
-        hue='protocol',
-        estimator=np.median,
-        errorbar=("pi", 50),
-        ax=axs[3],
-        hue_order=protocol_order,
-        palette=protocol_palette
-    )
+    plot_bands(axs[3], df_resolution, "area")
     axs[3].set_yticks(area_order)
     axs[3].set_yticklabels(res_order)
     axs[3].set_title("Resolution")
@@ -241,11 +976,77 @@ def plot_all(df_canplay, df_buffer, df_dropped, df_resolution, df_stall, dir_jso
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('dir_json_files', type=str, help='Directory containing json files')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of processes used to parse json files (default: all cores)")
+    parser.add_argument('--no_cache', action='store_true', default=False,
+                        help=f"Do not read or update the parsed results cache ({CACHE_DIR})")
+    parser.add_argument('--qlog', action='store_true', default=False,
+                        help="Also plot congestion control state from picoquic qlog files to transport.png")
+    parser.add_argument('--netlog', action='store_true', default=False,
+                        help="Also plot the transport timeline from Chrome NetLog files to netlog.png")
+    parser.add_argument('--phases', action='store_true', default=False,
+                        help="Also print where the runner spent its time (measuring vs. overhead, slowest phases)")
+    parser.add_argument('--segments', action='store_true', default=False,
+                        help="Also plot per-segment throughput and latency distributions to segments.png")
+    parser.add_argument('--qoe', action='store_true', default=False,
+                        help="Also compute QoE metrics per run (qoe.csv) with bootstrap confidence intervals per "
+                             "protocol (qoe_summary.csv) and plot them to qoe.png")
+    parser.add_argument('--bootstrap', type=int, default=10000,
+                        help="Number of bootstrap resamples for --qoe (default: %(default)s)")
+    parser.add_argument('--grid', type=float, nargs='?', const=0.1, default=None, metavar="SECONDS",
+                        help="Also resample the timeseries of all runs onto a common time grid (default resolution "
+                             "0.1 s) and plot per-protocol quantile bands to timegrid.png")
+    parser.add_argument('--anchor', choices=list(ANCHORS), default="fetchStart",
+                        help="Time zero of every run on the --grid (default: %(default)s)")
+    parser.add_argument('--interp', choices=["step", "linear"], default="step",
+                        help="Interpolation of the buffer level on the --grid (default: %(default)s)")
+    parser.add_argument('--box_index', type=str, nargs='?', const="data", default=None, metavar="DATA_DIR",
+                        help="Also compute the downloaded bytes and effective goodput of every run from the segment "
+                             "index of the representations in DATA_DIR (default data) to goodput.csv")
     args = parser.parse_args()
 
-    df_canplay, df_buffer, df_dropped, df_resolution, df_stall = load_data(args.dir_json_files)
+    df_canplay, df_buffer, df_dropped, df_resolution, df_stall = load_data(args.dir_json_files, args.workers,
+                                                                           not args.no_cache)
     plot_all(df_canplay, df_buffer, df_dropped, df_resolution, df_stall, args.dir_json_files)
 
+    if args.qoe:
+        df_qoe = qoe_table(df_canplay, df_buffer, df_dropped, df_resolution, df_stall)
+        df_summary = bootstrap_summary(df_qoe, args.bootstrap)
+        df_qoe.to_csv(f"{args.dir_json_files}/qoe.csv", index=False)
+        df_summary.to_csv(f"{args.dir_json_files}/qoe_summary.csv", index=False)
+        plot_qoe(df_summary, args.dir_json_files)
+        print(df_summary.set_index(["metric", "protocol"])[["runs", "mean", "ci_low", "ci_high"]].round(3).to_string())
+
+    if args.grid:
+        df_sample, df_anchor = load_timeseries(args.dir_json_files, args.workers, not args.no_cache)
+        plot_timegrid(df_sample, df_anchor, args.dir_json_files, args.grid, args.anchor, args.interp)
+
+    if args.phases:
+        summarize_phases(args.dir_json_files, args.workers)
+
+    if args.netlog:
+        df_sessions, df_streams, df_timeline = load_netlog(args.dir_json_files, args.workers)
+        plot_netlog(df_buffer, df_sessions, df_streams, df_timeline, args.dir_json_files)
+
+    if args.segments:
+        df_segment = load_segments(args.dir_json_files, args.workers, not args.no_cache)
+        plot_segments(df_segment, args.dir_json_files)
+
+    if args.box_index:
+        df_index, init_bytes = load_segment_index(args.box_index)
+        df_goodput = goodput_table(load_segments(args.dir_json_files, args.workers, not args.no_cache),
+                                   df_index, init_bytes)
+        df_goodput.to_csv(f"{args.dir_json_files}/goodput.csv", index=False)
+        print(df_goodput.groupby("protocol", observed=False)[["bytes", "goodput_mbps"]].quantile(
+            [0.1, 0.5, 0.9]).unstack().round(1).to_string())
+        if df_goodput["unindexed"].sum():
+            print(f"\033[93mWARNING: {df_goodput['unindexed'].sum()} segment requests not found in the index of "
+                  f"{args.box_index}\033[0m")
+
+    if args.qlog:
+        df_cc, df_loss, df_cr = load_transport(args.dir_json_files, args.workers)
+        plot_transport(df_buffer, df_resolution, df_cc, df_loss, df_cr, args.dir_json_files)
+
 
 
 
@@ -3,20 +3,38 @@
 
 import argparse
 import os
+import queue
+import re
+import shutil
+import socket
+import statistics
+import tempfile
 import time
 import json
 import subprocess
+import trio
+from contextlib import contextmanager
 from enum import Enum, auto
-from multiprocessing import Process, Queue
-from urllib.parse import urlparse
+from multiprocessing import Event, Process, Queue
+from threading import Event as ThreadEvent, Thread
+from urllib.parse import urlencode, urlparse
 
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
 from webdriver_manager.chrome import ChromeDriverManager
 
+from campaign import Campaign
+from metrics_codec import ENCODING, decode_metrics, encode_metrics
+from metrics_collector import MetricsCollector
+from qlog_transfer import transfer_qlogs
+from remote_host import LocalHost, SSHHost
+from testbed import PROFILES, Testbed
+
 
 # picoquic server configuration
 # FIXME picoquicdemo (with CR) must be compiled and executable
+server_picoquic_backend = "ssh"  # "ssh" to run picoquic on server_picoquic, "local" to run it on this host
 server_picoquic         = "your-server.de"
 server_picoquic_user    = "your-user"  # used for remote access to start picoquic and transfer qlog files
 server_picoquic_port    = 44321 # required for picoquic (bind to this port) and chrome (send request to this port)
@@ -26,64 +44,195 @@ server_picoquic_key     = "~/path-to-your/privkey.pem"
 server_picoquic_wwwdir  = "~/path-to/data/1080_360_480_720_bbd.mpd"
 server_picoquic_qlogdir = "~/dash-qlog-files"
 server_picoquic_cr_para = "PREVIOUS_RTT=600000 PREVIOUS_CWND_BYTES=3750000"
+server_picoquic_ready   = r"Starting Picoquic\b.* on port \d+"  # picoquicdemo's banner, printed as it opens its sockets
+server_ready_timeout    = 10  # seconds to wait for a server before starting Chrome anyway
 
 # chrome destination URL (h2 and h3 could be running on different servers)
 chrome_h2_url = "https://your-server.de/player.html"
 chrome_h3_url = f"https://{server_picoquic}:{server_picoquic_port}/player.html"
 
+# playback ends as soon as one of the configured conditions is met
+playback_media_seconds = None  # seconds of media played (video.currentTime)
+playback_samples       = None  # samples collected by the player (metrics.currentTime)
+playback_until_ended   = False  # video 'ended' event
+playback_timeout       = 15  # seconds since driver.get()
+playback_poll_interval = 0.25
+
+# player metrics are streamed to a local collector on this port (+ session slot), None reads them at the end only
+metrics_collector_port = None
+
+# write result files with compact columnar chrome_metrics (see metrics_codec.py) instead of indented JSON
+result_compact = False
+
+# Chrome writes a NetLog per run to results/<run>.netlog in this capture mode (Default, IncludeSensitive,
+# Everything), None disables it. A NetLog covers a whole browser, so runs with NetLog are never pooled.
+net_log_capture_mode = None
+
+# qlogs are moved to results/ compressed (see qlog_transfer.py), in the background they overlap with the next run
+qlog_background = False
+background_transfers = []  # threads of this session's background transfers
+
+# record DevTools Media domain events of the player "alongside" the polled metrics or "instead" of them
+# (the player's poller is disabled then, so --play_samples does not apply), None disables it
+cdp_media_events = None
+
+# --testbed replaces the servers above with a local testbed (see testbed.py), its link is stored with every result
+testbed_link = None
+chrome_extra_arguments = []  # e.g. the testbed certificate's SPKI hash
+
+# MPD the player loads relative to its page, e.g. a segment-duration variant (see
+# scripts/video_processing/variants.py), None keeps the player's data/bbb.mpd
+player_mpd = None
+
+# the settings above that the command line and --testbed override, they are passed to the session and
+# picoquic processes explicitly (see apply_config) since spawned processes import the defaults only
+CONFIG = ("server_picoquic", "server_picoquic_cert", "server_picoquic_key", "server_picoquic_wwwdir",
+          "server_picoquic_qlogdir", "server_picoquic_dir", "server_ready_timeout", "chrome_h2_url", "chrome_h3_url",
+          "playback_media_seconds", "playback_samples", "playback_until_ended", "playback_timeout",
+          "metrics_collector_port", "result_compact", "net_log_capture_mode", "qlog_background", "cdp_media_events",
+          "testbed_link", "chrome_extra_arguments", "player_mpd")
+
+
+def runner_config() -> dict:
+    """Returns the current values of the CONFIG settings."""
+    return {name: globals()[name] for name in CONFIG}
+
+
+def apply_config(config: dict):
+    """Installs settings returned by runner_config() in a session or picoquic process."""
+    globals().update((name, config[name]) for name in CONFIG)
+
 
 class Protocol(Enum):
     TCP = auto()
     QUIC = auto()
 
 
-def run_picoquic_server(cr_parameters: str, iteration: int):
-    """Starts Picoquic server via SSH and renames qlog files."""
-    print("Preparing and starting picoquic server")
-    cmd = ["ssh", f"{server_picoquic_user}@{server_picoquic}",
-           f"mkdir -p {server_picoquic_qlogdir}/temp"]
-    print("\033[90m" + " ".join(cmd) + "\033[0m")
-    subprocess.run(cmd, check=True)
-
-    cmd = [
-        "ssh", f"{server_picoquic_user}@{server_picoquic}",
-        f"sudo {cr_parameters} {server_picoquic_dir}/picoquicdemo "
+def h3_url(port: int) -> str:
+    """Returns chrome_h3_url pointing to the given picoquic port."""
+    url = urlparse(chrome_h3_url)
+    return url._replace(netloc=f"{url.hostname}:{port}").geturl()
+
+
+class PhaseTimer:
+    """Accumulates the monotonic wall-clock seconds spent in named phases."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def __call__(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.monotonic() - start
+
+
+def wait_for_tcp(url: str, timeout: float) -> bool:
+    """Waits until the server of an URL accepts TCP connections."""
+    url = urlparse(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((url.hostname, url.port or 443), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def wait_for_server(p_server: Process, ready: Event, timeout: float) -> bool:
+    """Waits until picoquic reported readiness, its process ended or the timeout passed."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and p_server.is_alive():
+        if ready.wait(0.05):
+            return True
+    return ready.is_set()
+
+
+def picoquic_host(backend: str):
+    """Returns the host picoquic runs on, see server_picoquic_backend."""
+    if backend == "local":
+        return LocalHost()
+    return SSHHost(server_picoquic_user, server_picoquic)
+
+
+def run_picoquic_server(host, cr_parameters: str, run_id: str, q: Queue, port: int = server_picoquic_port,
+                        slot: int = 0, ready: Event = None, config: dict = None):
+    """Starts Picoquic server on the picoquic host and renames qlog files."""
+    if config:
+        apply_config(config)
+    print(f"Preparing and starting picoquic server on {host}")
+    phases = PhaseTimer()
+    # every session writes its qlogs to a separate temp dir
+    qlog_tempdir = f"{server_picoquic_qlogdir}/temp{slot}"
+    cmd = (
+        f"mkdir -p {qlog_tempdir} && "
+        f"sudo {cr_parameters} stdbuf -oL {server_picoquic_dir}/picoquicdemo "
         f"-c {server_picoquic_cert} "
         f"-k {server_picoquic_key} "
         f"-w {server_picoquic_wwwdir} "
-        f"-q {server_picoquic_qlogdir}/temp "
-        f"-p {server_picoquic_port} -G cubic -a h3 -n {server_picoquic} -1"
-    ]
-    print("\033[90m" + " ".join(cmd) + "\033[0m")
-    res = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    # print(res.stdout)
-    # print(res.stderr)
-
-    q.put({"picoquic_stdout": res.stdout, "picoquic_stderr": res.stderr})
-
-    protocol = "quic-cr" if cr_parameters else "quic-ss"
-    cmd = ["ssh", f"{server_picoquic_user}@{server_picoquic}",
-           f"cd {server_picoquic_qlogdir}/temp; "
-           f"for i in *.qlog; do mv $i ../{protocol}_{iteration:03}_$i; done"]
-    print("\033[90m" + " ".join(cmd) + "\033[0m")
-    subprocess.run(cmd, check=True)
-
-    # FIXME optional: copy files, might also 'collect em all' later manually
-    cmd = ["scp", f"{server_picoquic_user}@{server_picoquic}:{server_picoquic_qlogdir}/*.qlog", "results"]
-    print("\033[90m" + " ".join(cmd) + "\033[0m")
-    subprocess.run(cmd, check=True)
-    cmd = ["ssh", f"{server_picoquic_user}@{server_picoquic}", f"rm -f {server_picoquic_qlogdir}/*.qlog"]
-    print("\033[90m" + " ".join(cmd) + "\033[0m")
-    subprocess.run(cmd, check=True)
-
-
-def run_chrome(dest_server: str, protocol: Protocol):
-    """Launches Chrome headlessly to fetch a webpage with QUIC/TCP."""
-    assert dest_server.startswith('https://'), "URL must start with https://"
+        f"-q {qlog_tempdir} "
+        f"-p {port} -G cubic -a h3 -n {server_picoquic} -1"
+    )
+    stdout, stderr = [], []
+    error = None
+    try:
+        start = time.monotonic()
+        proc = host.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        stderr_reader = Thread(target=lambda: stderr.extend(proc.stderr))
+        stderr_reader.start()
+        # watch stdout line by line to tell the runner as soon as picoquic accepts connections
+        for line in proc.stdout:
+            stdout.append(line)
+            if ready is not None and not ready.is_set() and re.search(server_picoquic_ready, line):
+                ready.set()
+                phases.phases["picoquic_launch"] = time.monotonic() - start
+                start = time.monotonic()
+        stderr_reader.join()
+        phases.phases["picoquic_serving"] = time.monotonic() - start
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, "".join(stdout), "".join(stderr))
+
+        with phases("qlog_rename"):
+            host.run(f"cd {qlog_tempdir}; "
+                     f"for i in *.qlog; do mv $i ../{run_id}_$i; done")
+
+        # only touch this run's qlogs, other sessions may be writing theirs
+        if not qlog_background:
+            with phases("qlog_transfer"):
+                transfer_qlogs(host, server_picoquic_qlogdir, f"{run_id}_*.qlog", "results")
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        # always answer, the runner blocks on the queue until it did
+        q.put({"picoquic_stdout": "".join(stdout), "picoquic_stderr": "".join(stderr),
+               "picoquic_phases": phases.phases, "picoquic_error": error})
 
+
+def resolve_chromedriver(path: str = None) -> str:
+    """Returns the chromedriver binary, only resolving it over the network if no local path is given."""
+    path = path or os.environ.get("CHROMEDRIVER")
+    if path:
+        assert os.access(path, os.X_OK), f"chromedriver {path} is not executable"
+        return path
+    return ChromeDriverManager().install()
+
+
+def chrome_options(dest_server: str, protocol: Protocol, user_data_dir: str = None, net_log: str = None):
+    """Returns the Chrome options for a protocol and a description for logging."""
     options = webdriver.ChromeOptions()
     options.add_argument("--headless")
     options.add_argument("--disable-gpu")
+    if user_data_dir:
+        options.add_argument(f"--user-data-dir={user_data_dir}")
+    for argument in chrome_extra_arguments:
+        options.add_argument(argument)
+    if net_log:
+        options.add_argument(f"--log-net-log={os.path.abspath(net_log)}")
+        options.add_argument(f"--net-log-capture-mode={net_log_capture_mode or 'Default'}")
 
     if protocol == Protocol.TCP:
         options.add_argument("--disable-quic")
@@ -94,79 +243,647 @@ def run_chrome(dest_server: str, protocol: Protocol):
         options.add_argument("--enable-quic")
         options.add_argument(f"--origin-to-force-quic-on={hostname}:{port}")
         info = f"Running Chrome to server {dest_server} with options --enable-quic --origin-to-force-quic-on={hostname}:{port}"
+    return options, info
+
+
+def cdp(driver, cmd: str, params: dict = None) -> dict:
+    """Executes a Chrome DevTools Protocol command."""
+    return driver.execute("executeCdpCommand", {"cmd": cmd, "params": params or {}})["value"]
+
+
+class ChromePool:
+    """Launches Chrome through one chromedriver per session and optionally keeps browsers warm.
+
+    Without a pool (size 0) every measurement gets a freshly launched browser. With a pool,
+    browsers are launched ahead of time per protocol and origin and every measurement runs
+    in a fresh browser context that is disposed afterwards.
+    """
+
+    def __init__(self, driver_path: str, size: int = 0, profile_dir: str = None):
+        self.size = size
+        self.profile_dir = profile_dir
+        self.idle = {}  # (protocol, origin) -> [(driver, browser_launch_s)]
+
+        start = time.monotonic()
+        self.service = Service(driver_path)
+        self.service.start()
+        self.driver_start_s = time.monotonic() - start
+
+    @staticmethod
+    def _key(dest_server: str, protocol: Protocol):
+        url = urlparse(dest_server)
+        return protocol.name, f"{url.hostname}:{url.port or 443}"
+
+    def _launch(self, dest_server: str, protocol: Protocol, user_data_dir: str = None, net_log: str = None):
+        options, info = chrome_options(dest_server, protocol, user_data_dir, net_log)
+        start = time.monotonic()
+        driver = webdriver.Remote(command_executor=ChromiumRemoteConnection(self.service.service_url, "goog", "chrome"),
+                                  options=options)
+        return driver, time.monotonic() - start, info
+
+    def prelaunch(self, dest_server: str, protocol: Protocol):
+        """Fills the pool for a protocol and origin so launch time does not fall into a measurement."""
+        idle = self.idle.setdefault(self._key(dest_server, protocol), [])
+        while len(idle) < self.size:
+            user_data_dir = tempfile.mkdtemp(dir=self.profile_dir)
+            driver, launch_s, _ = self._launch(dest_server, protocol, user_data_dir)
+            idle.append((driver, launch_s))
+
+    def acquire(self, dest_server: str, protocol: Protocol, user_data_dir: str = None, net_log: str = None):
+        """Returns a driver ready for one measurement, a lease to release it and launch timings."""
+        timings = {"chrome_driver_start_s": self.driver_start_s}
+        if self.size == 0 or net_log:
+            driver, timings["chrome_browser_launch_s"], info = self._launch(dest_server, protocol, user_data_dir,
+                                                                            net_log)
+            timings["chrome_pooled"] = False
+            return driver, (None, None, None, None), info, timings
+
+        key = self._key(dest_server, protocol)
+        self.prelaunch(dest_server, protocol)
+        driver, timings["chrome_browser_launch_s"] = self.idle[key].pop()
+        start = time.monotonic()
+        context = cdp(driver, "Target.createBrowserContext", {"disposeOnDetach": False})["browserContextId"]
+        target = cdp(driver, "Target.createTarget", {"url": "about:blank", "browserContextId": context})["targetId"]
+        default_window = driver.current_window_handle
+        driver.switch_to.window(target)
+        timings["chrome_context_create_s"] = time.monotonic() - start
+        timings["chrome_pooled"] = True
+        _, info = chrome_options(dest_server, protocol)
+        return driver, (key, context, default_window, timings["chrome_browser_launch_s"]), info, timings
+
+    def release(self, driver, lease, failed: bool = False):
+        key, context, default_window, launch_s = lease
+        if key is None or failed:
+            driver.quit()
+            return
+        driver.switch_to.window(default_window)
+        cdp(driver, "Target.disposeBrowserContext", {"browserContextId": context})
+        self.idle[key].append((driver, launch_s))
+
+    def close(self):
+        for idle in self.idle.values():
+            for driver, _ in idle:
+                driver.quit()
+        self.idle = {}
+        self.service.stop()
+
+
+def wait_for_playback(driver) -> str:
+    """Polls the player until one of the playback conditions is met and returns which one."""
+    deadline = time.monotonic() + playback_timeout
+    while time.monotonic() < deadline:
+        state = driver.execute_script(
+            "var video = document.querySelector('video');"
+            "return {samples: window.metricsCount ? metricsCount('currentTime') : 0,"
+            "        media: video ? video.currentTime : 0, ended: video ? video.ended : false};")
+        if playback_until_ended and state["ended"]:
+            return "ended"
+        if playback_media_seconds is not None and state["media"] >= playback_media_seconds:
+            return "media_seconds"
+        if playback_samples is not None and state["samples"] >= playback_samples:
+            return "samples"
+        time.sleep(playback_poll_interval)
+    return "timeout"
+
+
+def collect_metrics(driver, collector: MetricsCollector, run_id: str):
+    """Flushes the player's last batch and returns the streamed metrics and whether they are complete."""
+    state = driver.execute_async_script(
+        "var done = arguments[arguments.length - 1];"
+        "flushMetrics().then(function () {"
+        "    var keys = Object.keys(metrics).filter(function (key) { return Array.isArray(metrics[key]); });"
+        "    done({keys: keys, totals: metricsTotals, pending: pendingBatches.length});"
+        "});")
+    metrics = collector.read(run_id)
+    for key in state["keys"]:
+        metrics.setdefault(key, [])
+    # the player's counters are only a consistency check, the collector's file is the source of truth
+    consistent = state["pending"] == 0 and all(len(metrics[key]) == count for key, count in state["totals"].items())
+    if not consistent:
+        print(f"\033[93mWARNING: streamed metrics of {run_id} are incomplete ({state['pending']} batches pending)\033[0m")
+    return metrics, consistent
+
+
+class MediaEventRecorder:
+    """Records the DevTools Media domain events of the driver's current tab through Selenium's CDP bridge.
+
+    Player events carry the browser's timestamp, property changes and errors are stamped on
+    arrival. The listener runs in a thread with its own trio event loop next to the driver.
+    """
+
+    def __init__(self, driver, timeout: float = 10):
+        self.driver = driver
+        self.timeout = timeout
+        self.records = {"events": [], "properties": [], "errors": []}
+        self.error = None
+        self.listening = ThreadEvent()
+        self.stopped = ThreadEvent()
+        self.thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        if not self.listening.wait(self.timeout) or self.error:
+            print(f"\033[93mWARNING: recording Media events failed: {self.error or 'timeout'}\033[0m")
+
+    def stop(self) -> dict:
+        self.stopped.set()
+        self.thread.join(self.timeout)
+        return self.records | {"error": self.error}
+
+    def _run(self):
+        try:
+            trio.run(self._listen)
+        except Exception as e:
+            self.error = repr(e)
+        finally:
+            self.listening.set()
+
+    async def _listen(self):
+        async with self.driver.bidi_connection() as connection:
+            session, media = connection.session, connection.devtools.media
+            await session.execute(media.enable())
+            self.listening.set()
+            async with trio.open_nursery() as nursery:
+                async def stop_when_done():
+                    await trio.to_thread.run_sync(self.stopped.wait)
+                    nursery.cancel_scope.cancel()
+                nursery.start_soon(stop_when_done)
+
+                events = (media.PlayerEventsAdded, media.PlayerPropertiesChanged, media.PlayerErrorsRaised)
+                async for event in session.listen(*events, buffer_size=10000):
+                    received = time.time() * 1000
+                    if isinstance(event, media.PlayerEventsAdded):
+                        self.records["events"].extend({"timestamp": e.timestamp, "received": received,
+                                                       "player": event.player_id, "value": e.value}
+                                                      for e in event.events)
+                    elif isinstance(event, media.PlayerPropertiesChanged):
+                        self.records["properties"].extend({"received": received, "player": event.player_id,
+                                                           "name": p.name, "value": p.value}
+                                                          for p in event.properties)
+                    else:
+                        self.records["errors"].extend({"received": received, "player": event.player_id,
+                                                       "type": e.error_type, "code": e.code} for e in event.errors)
+
+
+def run_chrome(dest_server: str, protocol: Protocol, q: Queue, pool: ChromePool, user_data_dir: str = None,
+               collector: MetricsCollector = None, run_id: str = None, net_log: str = None, query: dict = None):
+    """Launches Chrome headlessly to fetch a webpage with QUIC/TCP, query is added to the page's URL."""
+    assert dest_server.startswith('https://'), "URL must start with https://"
 
-    driver = webdriver.Chrome(service=webdriver.chrome.service.Service(ChromeDriverManager().install()),
-                              options=options)
+    query = dict(query or {})
+    if cdp_media_events == "instead":
+        query["poll"] = "0"
+    if collector:
+        collector.begin(run_id)
+        query |= {"collector": collector.url, "run": run_id}
+    url = dest_server + (("&" if "?" in dest_server else "?") + urlencode(query) if query else "")
+
+    phases = PhaseTimer()
+    with phases("chrome_acquire"):
+        driver, lease, info, timings = pool.acquire(dest_server, protocol, user_data_dir, net_log)
     driver_get_time = int(time.time() * 1000)
+    metrics_consistent = None
+    media_events = None
 
     try:
         print(info)
-        driver.get(dest_server)
+        if cdp_media_events:
+            with phases("media_events_start"):
+                recorder = MediaEventRecorder(driver)
+                recorder.start()
+        with phases("chrome_get"):
+            driver.get(url)
 
         # let video play and collect metrics
-        time.sleep(15)
-
-        metrics = driver.execute_script("return metrics")
-        # in case of "javascript error: metrics is not defined" try to wait longer until picoquic server has started
-        # and/or check driver.page_source
-
-        perf_timing = driver.execute_script("return window.performance.timing")
+        playback_start = time.monotonic()
+        with phases("playback"):
+            playback_stop = wait_for_playback(driver)
+        playback_s = time.monotonic() - playback_start
+
+        if cdp_media_events:
+            with phases("media_events_stop"):
+                media_events = recorder.stop()
+
+        with phases("metrics_extract"):
+            if collector:
+                metrics, metrics_consistent = collect_metrics(driver, collector, run_id)
+            else:
+                metrics = driver.execute_script("return metrics")
+
+            perf_timing = driver.execute_script("return window.performance.timing")
     except Exception as e:
-        driver.quit()
+        if cdp_media_events and media_events is None:
+            recorder.stop()
+        pool.release(driver, lease, failed=True)
         raise RuntimeError(f"Chrome error: {e}")
 
-    driver.close()
+    with phases("chrome_release"):
+        pool.release(driver, lease)
     res = {
         "chrome_driver.get()": driver_get_time,
         "chrome_performanceTiming": perf_timing,
-        "chrome_metrics": metrics
+        "chrome_metrics": metrics,
+        "chrome_metrics_streamed": metrics_consistent,
+        "chrome_media_events": media_events,
+        "chrome_launch": timings,
+        "chrome_netlog": os.path.basename(net_log) if net_log else None,
+        "runner_waits": {"playback_s": playback_s, "playback_stop": playback_stop},
+        "runner_phases": phases.phases,
     }
     # print(json.dumps(res, indent=2))
     q.put(res)
 
 
+def encode_result(result: dict) -> dict:
+    """Returns the result with chrome_metrics in the compact encoding (see metrics_codec.py) if enabled."""
+    if result_compact:
+        return result | {"chrome_metrics": encode_metrics(result["chrome_metrics"]), "chrome_metrics_encoding": ENCODING}
+    return result
+
+
+def write_result(path: str, result: dict):
+    """Serializes a result (see encode_result) into a result file."""
+    dump = dict(separators=(",", ":")) if result_compact else dict(indent=2)
+    text = json.dumps(result, **dump)
+    # a campaign counts every result file as a completed run, a run killed while writing must not leave one
+    with open(path + ".tmp", "w") as file:
+        file.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def net_log_path(run_id: str):
+    return f"results/{run_id}.netlog" if net_log_capture_mode else None
+
+
+def page_url(url: str, page: str = None) -> str:
+    """Replaces the player page of a URL, e.g. with player_highLatency.html."""
+    if not page:
+        return url
+    parsed = urlparse(url)
+    return parsed._replace(path=parsed.path.rsplit("/", 1)[0] + "/" + page).geturl()
+
+
+def stop_picoquic_server(host, p_server: Process, q: Queue, port: int):
+    """Cleans up after a failed QUIC run so that the next run finds the port free and the queue empty."""
+    # the brackets keep pkill from matching the shell running it
+    host.run(f"sudo pkill -f '[p]icoquicdemo .*-p {port} '", check=False)
+    p_server.join(timeout=server_ready_timeout)
+    if p_server.is_alive():
+        p_server.terminate()
+        p_server.join()
+    while True:
+        try:
+            q.get(timeout=0.1)
+        except queue.Empty:
+            break
+
+
+def start_qlog_transfer(host, run_id: str):
+    """Transfers a run's qlogs in a thread of the session process while the next run starts."""
+    previous = background_transfers[-1] if background_transfers else None
+
+    def transfer():
+        # transfers run one after another, they share the control connection and the uplink
+        if previous:
+            previous.join()
+        try:
+            transfer_qlogs(host, server_picoquic_qlogdir, f"{run_id}_*.qlog", "results")
+        except Exception as e:
+            print(f"\033[93mWARNING: transferring the qlogs of {run_id} failed, they stay on {host}: {e}\033[0m")
+
+    thread = Thread(target=transfer)
+    thread.start()
+    background_transfers.append(thread)
+
+
+def run_protocol(protocol: str, run_id: str, q: Queue, pool: ChromePool, host, slot: int = 0, session: dict = None,
+                 session_dir: str = None, collector: MetricsCollector = None, cr_parameters: str = None,
+                 player: dict = None, strict: bool = False):
+    """Runs one measurement with tcp, quic-ss or quic-cr and writes its result file.
+
+    player holds the player page and settings passed as URL query parameters, cr_parameters
+    overrides server_picoquic_cr_para. With strict, a failing picoquic server fails the run
+    instead of being recorded in the result only.
+    """
+    player = player or {}
+    query = {key: value if isinstance(value, str) else json.dumps(value)
+             for key, value in player.items() if key != "page"}
+    if player_mpd:
+        query.setdefault("mpd", player_mpd)
+    port = server_picoquic_port + slot
+    run_start = time.monotonic()
+    phases = PhaseTimer()
+    with phases("profile_create"):
+        profile = tempfile.TemporaryDirectory(dir=session_dir)
+
+    if protocol == "tcp":
+        with profile as user_data_dir:
+            ready_start = time.monotonic()
+            with phases("server_ready"):
+                ready = wait_for_tcp(chrome_h2_url, server_ready_timeout)
+            server_ready_s = time.monotonic() - ready_start
+            run_chrome(page_url(chrome_h2_url, player.get("page")), Protocol.TCP, q, pool, user_data_dir, collector,
+                       run_id, net_log_path(run_id), query)
+            with phases("results_wait"):
+                result = q.get()
+            cleanup_start = time.monotonic()
+    else:
+        if protocol == "quic-cr":
+            cr_parameters = server_picoquic_cr_para if cr_parameters is None else cr_parameters
+        else:
+            cr_parameters = ""
+        with profile as user_data_dir:
+            server_ready = Event()
+            p_server = Process(target=run_picoquic_server, args=(host, cr_parameters, run_id, q, port, slot,
+                                                                  server_ready, runner_config()))
+
+            with phases("server_start"):
+                p_server.start()
+            ready_start = time.monotonic()
+            with phases("server_ready"):
+                ready = wait_for_server(p_server, server_ready, server_ready_timeout)
+            server_ready_s = time.monotonic() - ready_start
+            if not ready:
+                print("\033[93mWARNING: picoquic did not report readiness, starting Chrome anyway\033[0m")
+            # Chrome runs in the session process so pooled browsers can be reused
+            try:
+                run_chrome(page_url(h3_url(port), player.get("page")), Protocol.QUIC, q, pool, user_data_dir,
+                           collector, run_id, net_log_path(run_id), query)
+            except Exception:
+                stop_picoquic_server(host, p_server, q, port)
+                raise
+            print("Chromium client returned")
+
+            # drain the queue before joining, a child blocks on exit until its queue data was read
+            with phases("results_wait"):
+                result = q.get() | q.get()
+            with phases("server_join"):
+                p_server.join()
+            print("Picoquic server returned")
+            if qlog_background and not result.get("picoquic_error"):
+                start_qlog_transfer(host, run_id)
+            cleanup_start = time.monotonic()
+        if strict and result.get("picoquic_error"):
+            raise RuntimeError(f"picoquic error: {result['picoquic_error']}")
+
+    phases.phases["profile_cleanup"] = time.monotonic() - cleanup_start
+    result["session"] = session
+    if testbed_link:
+        result["testbed"] = testbed_link
+    result["runner_waits"] |= {"server_ready_s": server_ready_s, "server_ready_detected": ready}
+    if cr_parameters or player:
+        result["run_parameters"] = {"cr_parameters": cr_parameters, "player": player}
+    # encoding is the last phase within run_total, serializing the file follows after it
+    with phases("result_encode"):
+        result = encode_result(result)
+    result["runner_phases"] |= phases.phases | {"run_total": time.monotonic() - run_start}
+    # print(json.dumps(result, indent=2))
+    write_result(f"results/{run_id}_dash.json", result)
+    print(f"Finished {run_id}\n\n")
+
+
+def run_iteration(iteration: int, q: Queue, pool: ChromePool, host, slot: int = 0, session: dict = None,
+                  session_dir: str = None, collector: MetricsCollector = None):
+    """Runs TCP, QUIC HyStart and QUIC Careful Resume once and writes one result file each."""
+    print(f"\n=== Iteration {iteration} (session {slot}) ===")
+    for protocol in ["tcp", "quic-ss", "quic-cr"]:
+        run_protocol(protocol, f"{protocol}_{iteration:03}", q, pool, host, slot, session, session_dir, collector)
+
+
+def run_session(slot: int, work: list, parallel: int, driver_path: str, host, pool_size: int = 0,
+                campaign_setup: dict = None, campaign: Campaign = None, config: dict = None):
+    """Runs iterations (or the plan entries of a campaign) one after another with a queue, port,
+    chromedriver and Chrome profiles of its own, config comes from runner_config() of the main process."""
+    if config:
+        apply_config(config)
+    # setup phases are stored with every run of the session, "started" tells sessions and campaigns apart
+    session = {"slot": slot, "parallel": parallel, "picoquic_port": server_picoquic_port + slot,
+               "started": time.time(), "setup_phases": {}, "campaign": campaign_setup}
+    phases = PhaseTimer()
+    q = Queue()
+    session_dir = tempfile.mkdtemp(prefix=f"chrome-dash-session{slot}-")
+    with phases("chromedriver_start"):
+        pool = ChromePool(driver_path, pool_size, session_dir)
+    collector = None
+    if metrics_collector_port:
+        with phases("collector_start"):
+            collector = MetricsCollector("results", metrics_collector_port + slot)
+            collector.start()
+    try:
+        if pool_size:
+            with phases("chrome_prelaunch"):
+                pool.prelaunch(chrome_h2_url, Protocol.TCP)
+                pool.prelaunch(h3_url(server_picoquic_port + slot), Protocol.QUIC)
+        session["setup_phases"] |= phases.phases
+        if campaign is None:
+            for iteration in work:
+                run_iteration(iteration, q, pool, host, slot, session, session_dir, collector)
+            return
+        failed = []
+        for entry in work:
+            print(f"\n=== {entry['run_id']} (session {slot}) ===")
+            if not campaign.execute(entry, lambda e: run_protocol(
+                    e["protocol"], e["run_id"], q, pool, host, slot, session | {"campaign_name": campaign.name},
+                    session_dir, collector, e["cr_parameters"], e["player_settings"], strict=True)):
+                failed.append(entry["run_id"])
+        if failed:
+            print(f"\033[93mWARNING: {len(failed)} runs failed after {campaign.retries + 1} attempts, "
+                  f"restart the campaign to retry them: {', '.join(failed)}\033[0m")
+    finally:
+        for thread in background_transfers:
+            thread.join()
+        if collector:
+            collector.stop()
+        pool.close()
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+
+def run_throughput(result: dict) -> float:
+    """Throughput of a run's video segment downloads in Mbps, the bytes of all segments over their transfer times
+    (first byte to end of the request, like download_ms in chrome-dash_eval.py)."""
+    metrics = result.get("chrome_metrics", {})
+    if result.get("chrome_metrics_encoding"):
+        metrics = decode_metrics({"segments": metrics.get("segments", [])})
+    size, download = 0, 0
+    for segment in metrics.get("segments", []):
+        if not segment or segment.get("type") != "MediaSegment" or segment.get("mediaType") != "video" \
+                or segment.get("error") or not segment.get("bytes"):
+            continue
+        if segment.get("firstByte") is None or segment.get("requestEnd") is None:
+            continue
+        size += segment["bytes"]
+        download += segment["requestEnd"] - segment["firstByte"]
+    return size * 8 / 1000 / download if download > 0 else None
+
+
+def check_parallel_guard(iterations: list, calibration: int, threshold: float):
+    """Warns if runs executed in parallel see a different throughput than the serial calibration runs."""
+    for cr in ["tcp", "quic-ss", "quic-cr"]:
+        serial, parallel = [], []
+        for iteration in iterations:
+            try:
+                with open(f"results/{cr}_{iteration:03}_dash.json") as file:
+                    throughput = run_throughput(json.load(file))
+            except FileNotFoundError:
+                continue
+            if throughput is not None:
+                (serial if iteration < calibration else parallel).append(throughput)
+        if not serial or not parallel:
+            continue
+        ratio = statistics.median(parallel) / statistics.median(serial)
+        print(f"{cr}: median segment throughput parallel/serial = {ratio:.2f}")
+        if abs(ratio - 1) > threshold:
+            print(f"\033[93mWARNING: parallel {cr} runs differ by {abs(ratio - 1):.0%} from the serial calibration runs, "
+                  f"sessions are likely competing for resources; consider a lower --parallel\033[0m")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--configDone', action='store_true', default=False,
                         help="Confirm that you checked the hardcoded values used in the script")
     parser.add_argument('--iterations', type=int, default=1,
                         help="Number of iterations")
+    parser.add_argument('--parallel', type=int, default=1,
+                        help="Number of isolated sessions running iterations at the same time "
+                             "(session N uses picoquic port server_picoquic_port + N)")
+    parser.add_argument('--calibration', type=int, default=1,
+                        help="Number of iterations run serially before the parallel sessions start")
+    parser.add_argument('--parallel_guard', type=float, default=0.15,
+                        help="Warn if the median segment throughput of parallel runs deviates more than this fraction "
+                             "from the serial calibration runs")
+    parser.add_argument('--campaign', type=str, default=None, metavar="SPEC",
+                        help="Run the plan of a campaign spec (see campaign.py) instead of --iterations, resuming "
+                             "after the runs that already have a result file")
+    parser.add_argument('--chromedriver', type=str, default=None,
+                        help="Path to a local chromedriver binary (default: $CHROMEDRIVER or resolve with webdriver_manager)")
+    parser.add_argument('--chrome_pool', type=int, default=0,
+                        help="Number of pre-launched Chrome instances per protocol, measurements then run in a fresh "
+                             "browser context (default: launch a new browser for every measurement)")
+    parser.add_argument('--play_seconds', type=float, default=None,
+                        help="End playback after this many seconds of media were played")
+    parser.add_argument('--play_samples', type=int, default=None,
+                        help="End playback after the player collected this many samples")
+    parser.add_argument('--play_until_ended', action='store_true', default=False,
+                        help="End playback when the video ended")
+    parser.add_argument('--play_timeout', type=float, default=playback_timeout,
+                        help="End playback after this many seconds at the latest (default: %(default)s)")
+    parser.add_argument('--collector', type=int, nargs='?', const=8000, default=metrics_collector_port,
+                        metavar="PORT", help="Stream player metrics to a local collector on PORT (+ session slot, "
+                                             "default 8000) and store them in results/<run>_metrics.jsonl")
+    parser.add_argument('--compact', action='store_true', default=result_compact,
+                        help="Store chrome_metrics in a compact columnar encoding (read transparently by "
+                             "chrome-dash_eval.py)")
+    parser.add_argument('--netlog', nargs='?', const="Default", default=net_log_capture_mode,
+                        choices=["Default", "IncludeSensitive", "Everything"],
+                        help="Let Chrome write a NetLog per run to results/<run>.netlog (parsed by chrome-dash_eval.py "
+                             "--netlog), optionally with a capture mode")
+    parser.add_argument('--cdp_media', nargs='?', const="alongside", default=cdp_media_events,
+                        choices=["alongside", "instead"],
+                        help="Record DevTools Media domain events (buffering, resolution, errors) alongside the "
+                             "player's polled metrics or instead of them")
+    parser.add_argument('--qlog_background', action='store_true', default=qlog_background,
+                        help="Transfer qlogs in the background while the next runs start instead of before them")
+    parser.add_argument('--picoquic_backend', choices=["ssh", "local"], default=server_picoquic_backend,
+                        help="Run picoquic on server_picoquic over one multiplexed SSH connection or on this host "
+                             "(default: %(default)s)")
+    parser.add_argument('--picoquic_dir', type=str, default=server_picoquic_dir,
+                        help="Directory of the picoquicdemo binary on the picoquic host (default: %(default)s)")
+    parser.add_argument('--testbed', type=str, default=None, metavar="PROFILE",
+                        help=f"Serve --testbed_data from a local H2 server and picoquic in a network namespace "
+                             f"behind an emulated link instead of the configured servers (needs sudo), profiles: "
+                             f"{', '.join(PROFILES)}, parameters can be overridden, e.g. geo,loss=1")
+    parser.add_argument('--testbed_data', type=str, default="data",
+                        help="data directory served by the testbed (default: %(default)s)")
+    parser.add_argument('--testbed_preload', type=int, nargs='*', default=[], metavar="HEIGHT",
+                        help="Load the segments of these representations into the testbed H2 server's memory cache "
+                             "before the first run, e.g. 360 1080")
+    parser.add_argument('--testbed_cache_mb', type=float, default=512,
+                        help="Byte cap of the testbed H2 server's segment cache in MB (default: %(default)s)")
+    parser.add_argument('--variant', type=str, default=None, metavar="NAME",
+                        help="Let the player load the segment-duration variant NAME (data/bbb_NAME.mpd, e.g. seg2s, "
+                             "see data/variants.json) instead of data/bbb.mpd")
+    parser.add_argument('--server_ready_timeout', type=float, default=server_ready_timeout,
+                        help="Seconds to wait for a server to accept connections (default: %(default)s)")
     args = parser.parse_args()
 
     assert args.configDone, "Confirm that you checked the hardcoded values used in the script with --configDone"
     assert args.iterations > 0, "Please specify number of iterations > 0"
+    assert args.parallel > 0, "Please specify number of parallel sessions > 0"
     os.makedirs("results", exist_ok=True)
 
-    for iteration in range(args.iterations):
-        print(f"\n=== Iteration {iteration} ===")
-        q = Queue()
-
-        # tcp
-        run_chrome(chrome_h2_url, Protocol.TCP)
-        result = q.get()
-        # print(json.dumps(result, indent=2))
-        with open(f"results/tcp_{iteration:03}_dash.json", "w") as file:
-            json.dump(result, file, indent=2)
-        print(f"Finished tcp iteration {iteration}\n\n")
-
-        # quic
-        for cr in ["quic-ss", "quic-cr"]:
-            cr_parameters = server_picoquic_cr_para if cr == "quic-cr" else ""
-            p_server = Process(target=run_picoquic_server, args=(cr_parameters, iteration))
-            p_chrome = Process(target=run_chrome,
-                               args=(chrome_h3_url, Protocol.QUIC))
-
-            p_server.start()
-            time.sleep(10)  # picoquic server needs some time to start
-            p_chrome.start()
-
-            p_server.join()
-            print("Picoquic server returned")
-            p_chrome.join()
-            print("Chromium client returned")
+    playback_media_seconds = args.play_seconds
+    playback_samples = args.play_samples
+    playback_until_ended = args.play_until_ended
+    playback_timeout = args.play_timeout
+    server_ready_timeout = args.server_ready_timeout
+    metrics_collector_port = args.collector
+    result_compact = args.compact
+    net_log_capture_mode = args.netlog
+    qlog_background = args.qlog_background
+    cdp_media_events = args.cdp_media
+    server_picoquic_dir = args.picoquic_dir
+    if args.variant:
+        player_mpd = f"data/bbb_{args.variant}.mpd"
+
+    campaign_phases = PhaseTimer()
+    campaign_setup = {"started": time.time(), "phases": campaign_phases.phases}
+
+    # a campaign replaces the iterations with its plan, runs completed before are skipped
+    campaign = None
+    if args.campaign:
+        campaign = Campaign(args.campaign, "results", server_picoquic_cr_para)
+        work = campaign.pending()
+        print(f"Campaign {campaign.name}: {len(work)} of {len(campaign.plan)} runs pending "
+              f"(manifest {campaign.manifest_path})")
+    else:
+        work = list(range(args.iterations))
+
+    # resolve the driver once per campaign instead of once per run
+    with campaign_phases("chromedriver_resolve"):
+        driver_path = resolve_chromedriver(args.chromedriver)
+    print(f"Using chromedriver {driver_path}")
+
+    # the testbed takes the place of the configured servers, sessions get them with runner_config()
+    testbed = None
+    if args.testbed:
+        # the H2 server logs the service time of every request to separate it from network delay
+        testbed = Testbed(args.testbed, args.testbed_data, h3_port=server_picoquic_port, preload=args.testbed_preload,
+                          cache_mb=args.testbed_cache_mb, server_log="results/static_server.jsonl")
+        with campaign_phases("testbed_start"):
+            testbed.start()
+        server_picoquic = testbed.address
+        server_picoquic_cert = testbed.cert
+        server_picoquic_key = testbed.key
+        server_picoquic_wwwdir = testbed.www_dir
+        server_picoquic_qlogdir = testbed.qlog_dir
+        chrome_h2_url = testbed.h2_url
+        chrome_h3_url = testbed.h3_url
+        chrome_extra_arguments = testbed.chrome_arguments
+        testbed_link = testbed.link
+
+    # one persistent control connection to the picoquic host for the whole campaign
+    host = testbed.host if testbed else picoquic_host(args.picoquic_backend)
+    with campaign_phases("host_connect"):
+        host.connect()
 
-            result = q.get() | q.get()
-            # print(json.dumps(result, indent=2))
-            with open(f"results/{cr}_{iteration:03}_dash.json", "w") as file:
-                json.dump(result, file, indent=2)
-            print(f"Finished {cr} iteration {iteration}\n\n")
+    try:
+        if args.parallel == 1:
+            run_session(0, work, 1, driver_path, host, args.chrome_pool, campaign_setup, campaign)
+        else:
+            # calibrate without competing sessions first, then spread the rest over the sessions
+            calibration = min(args.calibration, len(work))
+            run_session(0, work[:calibration], 1, driver_path, host, args.chrome_pool, campaign_setup, campaign)
+            sessions = [Process(target=run_session, args=(slot, work[calibration:][slot::args.parallel],
+                                                          args.parallel, driver_path, host, args.chrome_pool,
+                                                          campaign_setup, campaign, runner_config()))
+                        for slot in range(args.parallel)]
+            for p in sessions:
+                p.start()
+            for p in sessions:
+                p.join()
+            if campaign is None:
+                check_parallel_guard(work, calibration, args.parallel_guard)
+    finally:
+        host.close()
+        if testbed:
+            testbed.stop()
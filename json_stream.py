@@ -0,0 +1,84 @@
+"""Bounded-memory iteration over large JSON documents.
+
+qlog and NetLog files hold one huge array of events next to a small header. JSONArrayStream
+reads such a document in chunks and decodes one array item at a time, so memory use
+depends on the largest event and not on the file size. Truncated files (e.g. a NetLog
+of a browser that was killed) yield all complete items.
+"""
+
+import json
+import re
+
+
+class JSONArrayStream:
+    """Iterates over the items of the first array stored under key in a JSON document."""
+
+    def __init__(self, fp, key: str, chunk_size: int = 1 << 20):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.eof = False
+
+        # read until the array starts, everything before it is kept as header
+        pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.buf = ""
+        search_from = 0
+        while True:
+            match = pattern.search(self.buf, search_from)
+            if match:
+                break
+            if not self._read():
+                raise ValueError(f"No array {key!r} found")
+            search_from = max(0, len(self.buf) - self.chunk_size - len(key) - 16)
+        self.header = self.buf[:match.start()]
+        self.buf = self.buf[match.end():]
+        self.pos = 0
+
+    def _read(self) -> bool:
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def value(self, key: str, default=None):
+        """Decodes the first value stored under key in the header."""
+        match = re.search(r'"%s"\s*:\s*' % re.escape(key), self.header)
+        if not match:
+            return default
+        try:
+            return self.decoder.raw_decode(self.header, match.end())[0]
+        except ValueError:
+            return default
+
+    def __iter__(self):
+        while True:
+            # skip separators, refilling the buffer as needed
+            while True:
+                while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n,":
+                    self.pos += 1
+                if self.pos < len(self.buf) or not self._read():
+                    break
+            if self.pos >= len(self.buf) or self.buf[self.pos] == "]":
+                return
+
+            try:
+                item, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer might continue in the next chunk
+                complete = end < len(self.buf) or self.eof
+            except ValueError:
+                complete = False
+            if not complete:
+                # drop consumed input before growing the buffer
+                self.buf = self.buf[self.pos:]
+                self.pos = 0
+                if not self._read():
+                    return  # truncated document
+                continue
+
+            self.pos = end
+            if self.pos > self.chunk_size:
+                self.buf = self.buf[self.pos:]
+                self.pos = 0
+            yield item
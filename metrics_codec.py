@@ -0,0 +1,115 @@
+"""Compact columnar encoding of the player's chrome_metrics.
+
+Every metric array is encoded on its own:
+ - "delta": integer series (e.g. epoch millisecond timestamps) as a base value and int64 deltas
+ - "rle": series with long constant stretches (frameRate, resHeight, ...) as values and run lengths
+ - "f64": other numeric series as a little-endian float64 array, null becomes NaN
+ - "records": arrays of objects (droppedFrames) split into one encoded series per field
+Typed arrays are stored base64 encoded. Scalars are kept as they are. decode_metrics()
+restores the plain JSON lists, NaN as null as in the uncompressed files.
+"""
+
+import base64
+import math
+import sys
+from array import array
+
+ENCODING = "compact-v1"
+
+
+def _pack(values, typecode: str) -> str:
+    a = array(typecode, values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return base64.b64encode(a.tobytes()).decode("ascii")
+
+
+def _unpack(data: str, typecode: str) -> list:
+    a = array(typecode)
+    a.frombytes(base64.b64decode(data))
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tolist()
+
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _runs(values: list):
+    run_values, run_lengths = [], []
+    for v in values:
+        if run_lengths and (run_values[-1] == v or (v != v and run_values[-1] != run_values[-1])):
+            run_lengths[-1] += 1
+        else:
+            run_values.append(v)
+            run_lengths.append(1)
+    return run_values, run_lengths
+
+
+def encode_series(values: list):
+    if not values:
+        return values
+
+    run_values, run_lengths = _runs(values)
+    if len(run_values) * 4 <= len(values):
+        return {"enc": "rle", "values": [_encode_value(v) for v in run_values], "lengths": run_lengths}
+
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        deltas = [b - a for a, b in zip(values, values[1:])]
+        return {"enc": "delta", "base": values[0], "data": _pack(deltas, "q")}
+    if all(v is None or _is_number(v) for v in values):
+        return {"enc": "f64", "data": _pack([math.nan if v is None else v for v in values], "d")}
+    if all(v is None or isinstance(v, dict) for v in values):
+        fields = sorted({key for v in values if v for key in v})
+        return {
+            "enc": "records",
+            "length": len(values),
+            "nulls": [i for i, v in enumerate(values) if v is None],
+            "fields": {key: encode_series([v.get(key) for v in values if v is not None]) for key in fields},
+        }
+    return values
+
+
+def _encode_value(v):
+    # NaN is not valid JSON
+    return None if isinstance(v, float) and v != v else v
+
+
+def decode_series(encoded):
+    if not isinstance(encoded, dict) or "enc" not in encoded:
+        return encoded
+    enc = encoded["enc"]
+    if enc == "rle":
+        values = []
+        for v, n in zip(encoded["values"], encoded["lengths"]):
+            values.extend([v] * n)
+        return values
+    if enc == "delta":
+        values = [encoded["base"]]
+        for d in _unpack(encoded["data"], "q"):
+            values.append(values[-1] + d)
+        return values
+    if enc == "f64":
+        return [None if v != v else v for v in _unpack(encoded["data"], "d")]
+    if enc == "records":
+        columns = {key: decode_series(series) for key, series in encoded["fields"].items()}
+        nulls = set(encoded["nulls"])
+        records, row = [], 0
+        for i in range(encoded["length"]):
+            if i in nulls:
+                records.append(None)
+                continue
+            record = {key: values[row] for key, values in columns.items()}
+            records.append({key: v for key, v in record.items() if v is not None})
+            row += 1
+        return records
+    raise ValueError(f"Unknown series encoding {enc}")
+
+
+def encode_metrics(metrics: dict) -> dict:
+    return {key: encode_series(value) if isinstance(value, list) else value for key, value in metrics.items()}
+
+
+def decode_metrics(metrics: dict) -> dict:
+    return {key: decode_series(value) for key, value in metrics.items()}
@@ -0,0 +1,138 @@
+"""Local asyncio collector for metrics streamed by player.html.
+
+The player posts batches of new samples to http://127.0.0.1:<port>/metrics?run=<run>
+while it plays. Every batch is appended to <directory>/<run>_metrics.jsonl as soon as
+it arrives, so a crashing browser only loses the samples of the last interval.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from urllib.parse import parse_qs, urlparse
+
+
+class MetricsCollector:
+    """Minimal HTTP/1.1 server appending metric batches to one file per run."""
+
+    def __init__(self, directory: str, port: int = 8000, host: str = "127.0.0.1"):
+        self.directory = directory
+        self.host = host
+        self.port = port
+        self.files = {}
+        self.seen = {}  # run -> sequence numbers already written, the player resends unacknowledged batches
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.writers = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def path(self, run: str) -> str:
+        return os.path.join(self.directory, f"{run}_metrics.jsonl")
+
+    def start(self):
+        """Serves in a background thread until stop() is called."""
+        started = threading.Event()
+
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=serve, daemon=True)
+        self.thread.start()
+        started.wait()
+        print(f"Metrics collector listening on {self.url}")
+
+    async def _shutdown(self):
+        self.server.close()
+        # the player keeps connections alive, closing them ends their handlers
+        for writer in list(self.writers):
+            writer.close()
+        while self.writers:
+            await asyncio.sleep(0.01)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        for f in self.files.values():
+            f.close()
+
+    async def _handle(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status = self._dispatch(method, target, body)
+                writer.write(f"HTTP/1.1 {status}\r\n"
+                             "Access-Control-Allow-Origin: *\r\n"
+                             "Access-Control-Allow-Methods: POST, OPTIONS\r\n"
+                             "Access-Control-Allow-Headers: Content-Type\r\n"
+                             "Access-Control-Allow-Private-Network: true\r\n"
+                             "Content-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def _dispatch(self, method: str, target: str, body: bytes) -> str:
+        if method == "OPTIONS":
+            return "204 No Content"
+        url = urlparse(target)
+        if method != "POST" or url.path != "/metrics":
+            return "404 Not Found"
+        run = parse_qs(url.query).get("run", [""])[0]
+        if not run or "/" in run:
+            return "400 Bad Request"
+        batch = json.loads(body)
+
+        seen = self.seen.setdefault(run, set())
+        if batch["seq"] not in seen:
+            seen.add(batch["seq"])
+            if run not in self.files:
+                self.files[run] = open(self.path(run), "a")
+            self.files[run].write(json.dumps(batch) + "\n")
+            self.files[run].flush()
+        return "204 No Content"
+
+    def begin(self, run: str):
+        """Discards batches of an earlier run with the same name."""
+        if run in self.files:
+            self.files.pop(run).close()
+        self.seen.pop(run, None)
+        if os.path.exists(self.path(run)):
+            os.remove(self.path(run))
+
+    def read(self, run: str) -> dict:
+        """Returns the metrics of a run reassembled from its batches."""
+        batches = []
+        if os.path.exists(self.path(run)):
+            with open(self.path(run)) as f:
+                batches = [json.loads(line) for line in f if line.strip()]
+
+        metrics = {}
+        for batch in sorted(batches, key=lambda b: b["seq"]):
+            for key, values in batch.get("deltas", {}).items():
+                metrics.setdefault(key, []).extend(values)
+            metrics.update(batch.get("scalars", {}))
+        return metrics
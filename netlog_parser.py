@@ -0,0 +1,153 @@
+"""Streaming parser for Chrome NetLog files (--log-net-log).
+
+Extracts the transport-level timeline of the HTTP/2 and QUIC sessions Chrome opened:
+session setup (TCP connect and TLS handshake for HTTP/2, session start and handshake
+confirmation for QUIC), request stream open and close, and stream payload received over
+time. Events are read one at a time (see json_stream.py), so multi-hundred-MB NetLogs
+do not have to fit into memory, and NetLogs of a killed browser (without the closing
+brackets) are parsed up to their last complete event. Times are converted to wall-clock
+milliseconds since the epoch, like the player's Date.now() based metrics.
+"""
+
+import math
+from array import array
+
+from json_stream import JSONArrayStream
+
+# sockets referenced by an HTTP/2 session carry its TCP connect and TLS handshake
+SOCKET_EVENTS = ("TCP_CONNECT", "SSL_CONNECT")
+# first event of a QUIC session after which the handshake is confirmed
+QUIC_HANDSHAKE_DONE = ("QUIC_SESSION_HANDSHAKE_DONE_FRAME_RECEIVED",)
+
+
+class _Session:
+    def __init__(self, kind: str, host: str, start_ms: float, socket: int = None):
+        self.kind = kind
+        self.host = host
+        self.start_ms = start_ms
+        self.socket = socket
+        self.handshake_ms = math.nan
+        self.end_ms = math.nan
+
+
+class _Collector:
+    """Collects sessions, streams and received payload of one NetLog."""
+
+    def __init__(self, host: str = None):
+        self.host = host
+        self.sockets = {}  # source id -> {event: (begin_ms, end_ms)}
+        self.sessions = {}  # source id -> _Session
+        self.streams = {}  # (session, stream id) -> [open_ms, close_ms, bytes]
+        self.received = {"time_ms": array("d"), "session": array("q"), "bytes": array("q")}
+
+    def _stream(self, session: int, stream_id: int, time_ms: float):
+        return self.streams.setdefault((session, stream_id), [time_ms, math.nan, 0])
+
+    def _receive(self, session: int, stream_id: int, time_ms: float, size: int, fin: bool):
+        stream = self._stream(session, stream_id, time_ms)
+        stream[2] += size
+        if fin:
+            stream[1] = time_ms
+        if size:
+            self.received["time_ms"].append(time_ms)
+            self.received["session"].append(session)
+            self.received["bytes"].append(size)
+
+    def add(self, time_ms: float, name: str, phase: str, source: int, params: dict):
+        if name in SOCKET_EVENTS:
+            times = self.sockets.setdefault(source, {}).setdefault(name, [math.nan, math.nan])
+            times[0 if phase == "PHASE_BEGIN" else 1] = time_ms
+            return
+
+        if name == "HTTP2_SESSION" and phase == "PHASE_BEGIN":
+            host = params.get("host", "")
+            if not self.host or host.startswith(self.host):
+                self.sessions[source] = _Session("h2", host, time_ms, params.get("source_dependency", {}).get("id"))
+            return
+        if name == "QUIC_SESSION" and phase == "PHASE_BEGIN":
+            host = params.get("host", "")
+            if not self.host or host.startswith(self.host):
+                self.sessions[source] = _Session("quic", f"{host}:{params.get('port', '')}", time_ms)
+            return
+
+        session = self.sessions.get(source)
+        if session is None:
+            return
+        if name in ("HTTP2_SESSION", "QUIC_SESSION") and phase == "PHASE_END":
+            session.end_ms = time_ms
+
+        # HTTP/2
+        elif name == "HTTP2_SESSION_SEND_HEADERS":
+            self._stream(source, params.get("stream_id"), time_ms)
+        elif name == "HTTP2_SESSION_RECV_HEADERS" and params.get("fin"):
+            self._receive(source, params.get("stream_id"), time_ms, 0, True)
+        elif name == "HTTP2_SESSION_RECV_DATA":
+            self._receive(source, params.get("stream_id"), time_ms, params.get("size", 0), params.get("fin", False))
+        elif name == "HTTP2_SESSION_RECV_RST_STREAM":
+            self._receive(source, params.get("stream_id"), time_ms, 0, True)
+
+        # QUIC, only client-initiated bidirectional streams carry requests
+        elif name in QUIC_HANDSHAKE_DONE:
+            if math.isnan(session.handshake_ms):
+                session.handshake_ms = time_ms
+        elif name == "QUIC_SESSION_STREAM_FRAME_SENT" and params.get("stream_id", 1) % 4 == 0:
+            self._stream(source, params["stream_id"], time_ms)
+        elif name == "QUIC_SESSION_STREAM_FRAME_RECEIVED" and params.get("stream_id", 1) % 4 == 0:
+            self._receive(source, params["stream_id"], time_ms, params.get("length", 0), params.get("fin", False))
+        elif name == "QUIC_SESSION_RST_STREAM_FRAME_RECEIVED" and params.get("stream_id", 1) % 4 == 0:
+            self._receive(source, params["stream_id"], time_ms, 0, True)
+
+    def tables(self) -> dict:
+        # setup_ms is when connection setup began: TCP connect for HTTP/2, session creation for QUIC
+        sessions = {"session": array("q"), "kind": [], "host": [], "setup_ms": array("d"), "connect_ms": array("d"),
+                    "handshake_ms": array("d"), "start_ms": array("d"), "end_ms": array("d")}
+        for source, session in self.sessions.items():
+            setup_ms, connect_ms, handshake_ms = session.start_ms, math.nan, session.handshake_ms
+            if session.kind == "h2":
+                socket = self.sockets.get(session.socket, {})
+                setup_ms, connect_ms = socket.get("TCP_CONNECT", [session.start_ms, math.nan])
+                handshake_ms = socket.get("SSL_CONNECT", [math.nan, math.nan])[1]
+            sessions["session"].append(source)
+            sessions["kind"].append(session.kind)
+            sessions["host"].append(session.host)
+            sessions["setup_ms"].append(setup_ms)
+            sessions["connect_ms"].append(connect_ms)
+            sessions["handshake_ms"].append(handshake_ms)
+            sessions["start_ms"].append(session.start_ms)
+            sessions["end_ms"].append(session.end_ms)
+
+        streams = {"session": array("q"), "stream_id": array("q"), "open_ms": array("d"), "close_ms": array("d"),
+                   "bytes": array("q")}
+        for (session, stream_id), (open_ms, close_ms, size) in self.streams.items():
+            streams["session"].append(session)
+            streams["stream_id"].append(stream_id)
+            streams["open_ms"].append(open_ms)
+            streams["close_ms"].append(close_ms)
+            streams["bytes"].append(size)
+
+        return {"sessions": sessions, "streams": streams, "received": self.received}
+
+
+def _invert(constants: dict, key: str) -> dict:
+    return {value: name for name, value in (constants.get(key) or {}).items()}
+
+
+def parse_netlog(path: str, host: str = None) -> dict:
+    """Returns the sessions, streams and received tables of a NetLog as dicts of columns.
+
+    With host, only sessions to origins starting with host (e.g. "example.com" or
+    "example.com:4433") are kept, so requests to the metrics collector are ignored.
+    """
+    collector = _Collector(host)
+    with open(path) as fp:
+        stream = JSONArrayStream(fp, "events")
+        constants = stream.value("constants") or {}
+        event_types = _invert(constants, "logEventTypes")
+        phases = _invert(constants, "logEventPhase")
+        tick_offset = float(constants.get("timeTickOffset", 0))
+
+        for event in stream:
+            name = event_types.get(event.get("type"), event.get("type"))
+            collector.add(tick_offset + float(event.get("time", 0)), name, phases.get(event.get("phase")),
+                          event.get("source", {}).get("id"), event.get("params") or {})
+    return collector.tables()
@@ -0,0 +1,107 @@
+"""Streaming parser for picoquic qlog files.
+
+Extracts congestion-control time series (cwnd, smoothed RTT, bytes in flight), packet
+losses and Careful Resume state changes with bounded memory. Both the JSON format
+written by picoquic (one "events" array, optionally with "event_fields") and JSON-SEQ
+(.sqlog) are supported, also gzip-compressed (.gz). Times are converted to wall-clock
+milliseconds since the epoch using the trace's reference_time, so they can be aligned
+with the browser's Date.now() based metrics (assuming client and server clocks are
+synchronized, e.g. via NTP).
+"""
+
+import gzip
+import json
+from array import array
+
+from json_stream import JSONArrayStream
+
+METRICS = ("cwnd", "smoothed_rtt", "bytes_in_flight")
+
+
+def _is_cr_event(name: str) -> bool:
+    return "careful_resume" in name or name.endswith(("cc_state_updated", "congestion_state_updated"))
+
+
+def _cr_state(data: dict) -> str:
+    for key in ("new", "new_phase", "new_state", "state", "phase"):
+        if key in data:
+            return str(data[key])
+    return json.dumps(data)
+
+
+class _Collector:
+    """Collects the columns extracted from one trace."""
+
+    def __init__(self):
+        self.scale = 1  # time units per millisecond, RTTs are given in the trace's time units
+        self.metrics = {"time_ms": array("d"), **{name: array("d") for name in METRICS}}
+        self.loss = {"time_ms": array("d")}
+        self.cr = {"time_ms": [], "state": []}
+
+    def add(self, time_ms: float, name: str, data: dict):
+        if name.endswith("metrics_updated"):
+            if not any(metric in data for metric in METRICS):
+                return
+            self.metrics["time_ms"].append(time_ms)
+            for metric in METRICS:
+                value = data.get(metric, data.get("congestion_window") if metric == "cwnd" else None)
+                if value is None:
+                    value = float("nan")
+                elif metric == "smoothed_rtt":
+                    value /= self.scale
+                self.metrics[metric].append(value)
+        elif name.endswith("packet_lost"):
+            self.loss["time_ms"].append(time_ms)
+        elif _is_cr_event(name):
+            self.cr["time_ms"].append(time_ms)
+            self.cr["state"].append(_cr_state(data))
+
+
+def _reference_ms(reference_time, time_units: str) -> float:
+    reference_time = float(reference_time or 0)
+    return reference_time / 1000 if time_units == "us" else reference_time
+
+
+def _parse_json(fp, collector: _Collector):
+    stream = JSONArrayStream(fp, "events")
+    time_units = (stream.value("configuration") or {}).get("time_units", "ms")
+    scale = collector.scale = 1000 if time_units == "us" else 1
+    reference_ms = _reference_ms((stream.value("common_fields") or {}).get("reference_time"), time_units)
+    fields = stream.value("event_fields")
+
+    for event in stream:
+        if isinstance(event, list):
+            event = dict(zip(fields, event))
+        name = event.get("name") or f"{event.get('category')}:{event.get('event')}"
+        time = event.get("relative_time", event.get("time", 0))
+        collector.add(reference_ms + float(time) / scale, name, event.get("data") or {})
+
+
+def _parse_seq(fp, collector: _Collector):
+    reference_ms, scale = 0, 1
+    for record in fp:
+        record = record.strip("\x1e \r\n")
+        if not record:
+            continue
+        record = json.loads(record)
+        if "trace" in record:
+            trace = record["trace"]
+            time_units = trace.get("configuration", {}).get("time_units", "ms")
+            scale = collector.scale = 1000 if time_units == "us" else 1
+            reference_ms = _reference_ms(trace.get("common_fields", {}).get("reference_time"), time_units)
+            continue
+        if "name" in record:
+            collector.add(reference_ms + float(record.get("time", 0)) / scale, record["name"], record.get("data") or {})
+
+
+def parse_qlog(path: str) -> dict:
+    """Returns the metrics, loss and cr tables of a qlog file (optionally gzip-compressed) as dicts of columns."""
+    collector = _Collector()
+    with (gzip.open(path, "rt") if path.endswith(".gz") else open(path)) as fp:
+        if fp.read(1) == "\x1e":
+            fp.seek(0)
+            _parse_seq(fp, collector)
+        else:
+            fp.seek(0)
+            _parse_json(fp, collector)
+    return {"metrics": collector.metrics, "loss": collector.loss, "cr": collector.cr}
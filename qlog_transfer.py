@@ -0,0 +1,103 @@
+"""Incremental, compressed transfer of qlog files from the picoquic host.
+
+Files are sent as one gzip-compressed tar stream over the host's control connection
+and stored gzip-compressed locally (<name>.gz, read transparently by qlog_parser.py).
+Only files without a matching local copy are sent. A remote file is deleted only after its local
+copy was verified against the size and SHA-256 checksum computed on the remote host,
+so an interrupted transfer loses nothing and is resumed by the next call.
+"""
+
+import gzip
+import hashlib
+import os
+import shlex
+import subprocess
+import tarfile
+import time
+
+
+def _shell_path(path: str) -> str:
+    """Quotes a path for the remote shell, a leading ~ still expands to the home directory."""
+    if path == "~":
+        return '"$HOME"'
+    if path.startswith("~/"):
+        return '"$HOME"/' + shlex.quote(path[2:])
+    return shlex.quote(path)
+
+
+def _remote_files(host, remote_dir: str, pattern: str) -> dict:
+    """Returns {name: (size, sha256)} of the remote files matching a shell pattern."""
+    # a missing directory fails the command, a pattern without matches lists nothing
+    res = host.run(f"cd {_shell_path(remote_dir)} && {{ for f in {pattern}; do [ -f \"$f\" ] && "
+                   f"echo \"$(stat -c %s \"$f\") $(sha256sum < \"$f\" | cut -d' ' -f1) $f\"; done; true; }}",
+                   check=False, capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"listing {pattern} in {remote_dir} on {host} failed: {res.stderr.strip()}")
+    files = {}
+    for line in res.stdout.splitlines():
+        size, digest, name = line.split(" ", 2)
+        files[name] = (int(size), digest)
+    return files
+
+
+def _local_checksum(path: str) -> tuple:
+    """Returns (size, sha256) of the decompressed content of a local copy, None if it is unreadable."""
+    digest, size = hashlib.sha256(), 0
+    try:
+        with gzip.open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+                size += len(chunk)
+    except (OSError, EOFError):
+        return None
+    return size, digest.hexdigest()
+
+
+def transfer_qlogs(host, remote_dir: str, pattern: str, local_dir: str, compresslevel: int = 6) -> dict:
+    """Moves the remote files matching pattern to local_dir as <name>.gz and returns transfer statistics."""
+    start = time.monotonic()
+    remote = _remote_files(host, remote_dir, pattern)
+    # a local copy left by an earlier call whose remote delete failed is checked like a received one
+    present = {name for name, checksum in remote.items()
+               if os.path.exists(os.path.join(local_dir, name + ".gz"))
+               and _local_checksum(os.path.join(local_dir, name + ".gz")) == checksum}
+    missing = sorted(set(remote) - present)
+
+    verified, received, stored = set(present), 0, 0
+    if missing:
+        proc = host.popen(f"cd {_shell_path(remote_dir)} && tar -cf - -- {' '.join(map(shlex.quote, missing))} "
+                          f"| gzip -1", stdout=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode="r|gz") as tar:
+                for member in tar:
+                    if not member.isfile() or member.name not in remote:
+                        continue
+                    path = os.path.join(local_dir, member.name + ".gz")
+                    digest, size = hashlib.sha256(), 0
+                    source = tar.extractfile(member)
+                    with gzip.open(path + ".part", "wb", compresslevel=compresslevel) as f:
+                        for chunk in iter(lambda: source.read(1 << 20), b""):
+                            digest.update(chunk)
+                            size += len(chunk)
+                            f.write(chunk)
+                    if (size, digest.hexdigest()) == remote[member.name]:
+                        os.replace(path + ".part", path)
+                        verified.add(member.name)
+                        received += size
+                        stored += os.path.getsize(path)
+                    else:
+                        os.remove(path + ".part")
+                        print(f"\033[93mWARNING: {member.name} does not match its remote checksum, "
+                              f"keeping the remote file\033[0m")
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
+    if verified:
+        host.run(f"cd {_shell_path(remote_dir)} && rm -f -- {' '.join(map(shlex.quote, sorted(verified)))}")
+    failed = sorted(set(remote) - verified)
+    if failed:
+        print(f"\033[93mWARNING: {len(failed)} qlogs were not transferred and stay in {remote_dir} on {host}: "
+              f"{', '.join(failed)}\033[0m")
+    return {"files": len(missing), "skipped": len(present), "failed": len(failed), "bytes": received,
+            "stored_bytes": stored, "seconds": time.monotonic() - start}
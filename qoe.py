@@ -0,0 +1,132 @@
+"""Per-run QoE metrics and bootstrap confidence intervals per protocol.
+
+qoe_table() reduces the tables of chrome-dash_eval.py's load_data to one row per run:
+
+    startup_s             fetchStart to the player's CAN_PLAY event
+    session_s             first to last buffer sample
+    rebuffer_count        stalls recorded by the player
+    rebuffer_s            total stall duration
+    rebuffer_ratio        rebuffer_s / (rebuffer_s + played seconds)
+    bitrate_kbps          time-weighted average bitrate of the played representations
+    height_px             time-weighted average resolution height
+    switch_count          representation switches
+    dropped_frames_per_s  dropped frames per played second
+
+Samples are weighted by the time until the next sample of the run (the last one by the
+polling interval). bootstrap_summary() resamples the runs of each protocol to get
+confidence intervals of the per-protocol means, all metrics and resamples at once.
+timeseries_bands() aggregates a timeseries table once per protocol and second for plotting.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+QOE_METRICS = ["startup_s", "session_s", "rebuffer_count", "rebuffer_s", "rebuffer_ratio", "bitrate_kbps",
+               "height_px", "switch_count", "dropped_frames_per_s"]
+
+SAMPLE_INTERVAL_S = 1  # polling interval of the player
+
+
+def _runs(*dfs) -> pd.DataFrame:
+    """Returns protocol and iteration of every run found in any of the tables."""
+    pairs = pd.concat([df[["iteration", "protocol"]] for df in dfs if not df.empty], ignore_index=True)
+    pairs = pairs.drop_duplicates("iteration")
+    return pairs.assign(iteration=pairs["iteration"].astype(str)).set_index("iteration").sort_index()
+
+
+def _per_run(df: pd.DataFrame, column: str, how: str) -> pd.Series:
+    if df.empty:
+        return pd.Series(dtype=float)
+    return df.groupby(df["iteration"].astype(str))[column].agg(how)
+
+
+def qoe_table(df_canplay, df_buffer, df_dropped, df_resolution, df_stall) -> pd.DataFrame:
+    """Returns one row per run with protocol, iteration and the QOE_METRICS columns."""
+    runs = _runs(df_canplay, df_buffer, df_dropped, df_resolution, df_stall)
+    qoe = pd.DataFrame(index=runs.index)
+    qoe["startup_s"] = _per_run(df_canplay, "canplay_delay_s", "first")
+    qoe["session_s"] = _per_run(df_buffer, "timestamp", "max") - _per_run(df_buffer, "timestamp", "min")
+    qoe["rebuffer_count"] = _per_run(df_stall, "stall_duration_s", "count")
+    qoe["rebuffer_s"] = _per_run(df_stall, "stall_duration_s", "sum")
+    qoe[["rebuffer_count", "rebuffer_s"]] = qoe[["rebuffer_count", "rebuffer_s"]].fillna(0)
+
+    played = (qoe["session_s"] - qoe["startup_s"].fillna(0) - qoe["rebuffer_s"]).clip(lower=0)
+    qoe["rebuffer_ratio"] = qoe["rebuffer_s"] / (qoe["rebuffer_s"] + played).where(lambda t: t > 0)
+
+    if not df_resolution.empty:
+        res = df_resolution.assign(iteration=df_resolution["iteration"].astype(str))
+        res = res.sort_values(["iteration", "timestamp"], kind="stable")
+        grouped = res.groupby("iteration", sort=False)
+        # weight of a sample: time until the next one, the last one lasts one polling interval
+        weight = (grouped["timestamp"].shift(-1) - res["timestamp"]).fillna(SAMPLE_INTERVAL_S).to_numpy(float)
+        bitrate = res["bitrate_kbps"].to_numpy(float)
+        has_bitrate = ~np.isnan(bitrate)
+        # load_data combines width and height to a "WxH" label, parse each distinct label once
+        codes, labels = pd.factorize(res["resolution"].astype(str))
+        height = np.array([float(label.rsplit("x", 1)[1]) for label in labels])[codes]
+        area = res["area"].to_numpy()
+        weighted = pd.DataFrame({
+            "iteration": res["iteration"].to_numpy(),
+            "weight": weight,
+            "height": height * weight,
+            "bitrate": np.where(has_bitrate, bitrate, 0) * weight,
+            "bitrate_weight": np.where(has_bitrate, weight, 0),
+            "switch": (grouped["area"].shift().to_numpy() != area) & (grouped.cumcount().to_numpy() > 0),
+        }).groupby("iteration").sum()
+        qoe["height_px"] = weighted["height"] / weighted["weight"]
+        qoe["bitrate_kbps"] = weighted["bitrate"] / weighted["bitrate_weight"].where(lambda w: w > 0)
+        qoe["switch_count"] = weighted["switch"]
+
+    # droppedFrames is a counter since the start of the run
+    qoe["dropped_frames_per_s"] = _per_run(df_dropped, "droppedFrames", "max") / played.where(lambda t: t > 0)
+
+    qoe = qoe.reindex(columns=QOE_METRICS)
+    qoe.insert(0, "protocol", runs["protocol"])
+    return qoe.rename_axis("iteration").reset_index()
+
+
+def bootstrap_summary(qoe: pd.DataFrame, n_boot: int = 10000, ci: float = 0.95, seed: int = 0,
+                      chunk_elements: int = 1 << 24) -> pd.DataFrame:
+    """Returns per protocol and metric the mean, median and a percentile bootstrap CI of the mean.
+
+    The tidy result has one row per (protocol, metric). Resampled means of all metrics are
+    computed as one (resamples x runs x metrics) gather per chunk of resamples, NaN values
+    (e.g. runs without bitrate samples) are left out of the mean of their resample.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for protocol, group in qoe.groupby("protocol", observed=True, sort=False):
+        values = group[QOE_METRICS].to_numpy(float)
+        n = len(values)
+        means = np.empty((n_boot, len(QOE_METRICS)))
+        chunk = max(1, chunk_elements // max(1, n * len(QOE_METRICS)))
+        # a resample of only NaN values of a metric has no mean, it is ignored by the quantiles
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for start in range(0, n_boot, chunk):
+                idx = rng.integers(0, n, size=(min(chunk, n_boot - start), n))
+                means[start:start + len(idx)] = np.nanmean(values[idx], axis=1)
+            low, high = np.nanquantile(means, [(1 - ci) / 2, (1 + ci) / 2], axis=0)
+            mean, median = np.nanmean(values, axis=0), np.nanmedian(values, axis=0)
+        count = (~np.isnan(values)).sum(axis=0)
+        for i, metric in enumerate(QOE_METRICS):
+            rows.append((protocol, metric, count[i], mean[i], median[i], low[i], high[i]))
+    return pd.DataFrame(rows, columns=["protocol", "metric", "runs", "mean", "median", "ci_low", "ci_high"])
+
+
+def timeseries_bands(df: pd.DataFrame, column: str, quantiles=(0.25, 0.5, 0.75)) -> pd.DataFrame:
+    """Returns per protocol and timestamp the quantiles of column over the samples of all runs.
+
+    The tidy result has the columns protocol, timestamp, samples and one column per quantile
+    (q25, q50, ...), like timegrid.quantile_bands but on the load_data tables' whole seconds.
+    """
+    names = [f"q{round(q * 100):02}" for q in quantiles]
+    if df.empty:
+        return pd.DataFrame(columns=["protocol", "timestamp", "samples", *names])
+    grouped = df.dropna(subset=[column]).groupby(["protocol", "timestamp"], observed=True)[column]
+    bands = grouped.quantile(list(quantiles)).unstack()
+    bands.columns = names
+    bands.insert(0, "samples", grouped.size())
+    return bands.reset_index()
@@ -0,0 +1,105 @@
+"""Command execution and file transfer on the host running picoquic.
+
+SSHHost keeps one multiplexed OpenSSH connection (ControlMaster) per campaign, so
+control commands and scp transfers do not pay a full handshake each. LocalHost
+offers the same interface to run picoquic on the local machine, e.g. on loopback
+or in a network namespace.
+"""
+
+import subprocess
+import time
+
+
+class SSHHost:
+    """Runs commands and transfers files over one persistent, multiplexed SSH connection."""
+
+    def __init__(self, user: str, host: str, timeout: float = 30, persist: int = 600, retries: int = 2):
+        self.destination = f"{user}@{host}"
+        self.timeout = timeout
+        self.retries = retries
+        self.options = [
+            "-o", "ControlMaster=auto",
+            "-o", "ControlPath=/tmp/chrome-dash-%C",
+            "-o", f"ControlPersist={persist}",
+            "-o", f"ConnectTimeout={int(timeout)}",
+            "-o", "ServerAliveInterval=5",
+            "-o", "ServerAliveCountMax=3",
+            "-o", "BatchMode=yes",
+        ]
+
+    def __repr__(self):
+        return f"SSHHost({self.destination})"
+
+    def _ssh(self, *args) -> list:
+        return ["ssh", *self.options, *args]
+
+    def connect(self):
+        """Opens the master connection, later commands reuse it."""
+        self.run("true")
+
+    def _retry(self, cmd: list, check: bool, timeout: float, **kwargs) -> subprocess.CompletedProcess:
+        print("\033[90m" + " ".join(cmd) + "\033[0m")
+        for attempt in range(self.retries + 1):
+            try:
+                res = subprocess.run(cmd, timeout=timeout or self.timeout, **kwargs)
+            except subprocess.TimeoutExpired:
+                res = None
+            # ssh exits with 255 if the connection failed, everything else is the remote command's status
+            if res is not None and res.returncode != 255:
+                break
+            if attempt < self.retries:
+                print(f"\033[93mWARNING: connection to {self.destination} failed, reconnecting\033[0m")
+                time.sleep(2 ** attempt)
+                subprocess.run(self._ssh("-O", "exit", self.destination), capture_output=True)
+        if res is None:
+            raise RuntimeError(f"Timed out after {timeout or self.timeout}s: {' '.join(cmd)}")
+        if check and res.returncode != 0:
+            raise subprocess.CalledProcessError(res.returncode, cmd, res.stdout, res.stderr)
+        return res
+
+    def run(self, command: str, check: bool = True, timeout: float = None, **kwargs) -> subprocess.CompletedProcess:
+        """Runs an idempotent command, retrying on connection failures."""
+        return self._retry(self._ssh(self.destination, command), check, timeout, **kwargs)
+
+    def popen(self, command: str, **kwargs) -> subprocess.Popen:
+        """Starts a long-running command, it is not retried."""
+        cmd = self._ssh(self.destination, command)
+        print("\033[90m" + " ".join(cmd) + "\033[0m")
+        return subprocess.Popen(cmd, **kwargs)
+
+    def fetch(self, remote_pattern: str, local_dir: str, timeout: float = None):
+        """Copies remote files matching a shell pattern into a local directory."""
+        self._retry(["scp", *self.options, f"{self.destination}:{remote_pattern}", local_dir], True, timeout)
+
+    def close(self):
+        subprocess.run(self._ssh("-O", "exit", self.destination), capture_output=True)
+
+
+class LocalHost:
+    """Runs picoquic on this machine with the same interface as SSHHost."""
+
+    def __init__(self, timeout: float = 30):
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "LocalHost()"
+
+    def connect(self):
+        pass
+
+    def run(self, command: str, check: bool = True, timeout: float = None, **kwargs) -> subprocess.CompletedProcess:
+        print("\033[90m" + command + "\033[0m")
+        try:
+            return subprocess.run(["bash", "-c", command], check=check, timeout=timeout or self.timeout, **kwargs)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"Timed out after {timeout or self.timeout}s: {command}")
+
+    def popen(self, command: str, **kwargs) -> subprocess.Popen:
+        print("\033[90m" + command + "\033[0m")
+        return subprocess.Popen(["bash", "-c", command], **kwargs)
+
+    def fetch(self, remote_pattern: str, local_dir: str, timeout: float = None):
+        self.run(f"cp {remote_pattern} {local_dir}", timeout=timeout)
+
+    def close(self):
+        pass
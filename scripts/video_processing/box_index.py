@@ -0,0 +1,250 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Per-segment table of the fragmented MP4 segments of one representation (data/<height>/out),
+# stored next to them as segment_index.npy (structured, memory-mappable) and segment_index.json.
+# Segments are memory-mapped and their boxes parsed in place, sample tables are read as NumPy
+# views of the mapping.
+
+INDEX_NAME = 'segment_index'
+INDEX_VERSION = 2
+
+SEGMENT_DTYPE = np.dtype([
+	('number', '<i4'),               # $Number$ of the segment file
+	('size', '<i8'),                 # bytes of the segment file
+	('mdat_size', '<i8'),            # bytes of media data
+	('samples', '<i4'),
+	('start_s', '<f8'),              # decode time of the first sample (tfdt)
+	('duration_s', '<f8'),
+	('keyframe_offset_s', '<f8'),    # decode time of the first sync sample after start_s, NaN without one
+	('bitrate_bps', '<f8'),          # size over duration
+	('peak_bitrate_bps', '<f8'),     # highest bitrate of any PEAK_WINDOW_S of samples
+])
+
+PEAK_WINDOW_S = 0.5
+NON_SYNC_SAMPLE = 0x00010000  # sample_is_non_sync_sample bit of the ISO BMFF sample flags
+
+CONTAINERS = {b'moov', b'trak', b'mdia', b'mvex', b'moof', b'traf'}
+
+
+def _boxes(buf, start, end):
+	"""Yields (type, payload start, box end) of the boxes in buf[start:end]."""
+	while start + 8 <= end:
+		size, box_type = struct.unpack_from('>I4s', buf, start)
+		header = 8
+		if size == 1:
+			size = struct.unpack_from('>Q', buf, start + 8)[0]
+			header = 16
+		elif size == 0:
+			size = end - start
+		if size < header or start + size > end:
+			raise ValueError('Truncated %s box at offset %d' % (box_type.decode(errors='replace'), start))
+		yield box_type, start + header, start + size
+		start += size
+
+
+def _walk(buf, start, end, found):
+	# collects the payload ranges of all boxes below containers, in file order
+	for box_type, payload, box_end in _boxes(buf, start, end):
+		found.setdefault(box_type, []).append((payload, box_end))
+		if box_type in CONTAINERS:
+			_walk(buf, payload, box_end, found)
+	return found
+
+
+def parse_init(path):
+	"""Returns timescale and trex sample defaults of an init segment."""
+	with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+		found = _walk(buf, 0, len(buf), {})
+		payload, _ = found[b'mdhd'][0]
+		version = buf[payload]
+		timescale = struct.unpack_from('>I', buf, payload + (20 if version == 1 else 12))[0]
+		defaults = {'duration': 0, 'size': 0, 'flags': 0}
+		if b'trex' in found:
+			payload, _ = found[b'trex'][0]
+			_, _, duration, size, flags = struct.unpack_from('>IIIII', buf, payload + 4)
+			defaults = {'duration': duration, 'size': size, 'flags': flags}
+		return {'timescale': timescale, 'defaults': defaults, 'size': len(buf)}
+
+
+def _parse_traf(buf, traf, defaults):
+	"""Returns decode start, sample durations, sizes and flags of a track fragment."""
+	tfhd, _ = traf[b'tfhd'][0]
+	flags = int.from_bytes(buf[tfhd + 1:tfhd + 4], 'big')
+	offset = tfhd + 8  # version, flags, track_ID
+	if flags & 0x1:
+		offset += 8  # base_data_offset
+	if flags & 0x2:
+		offset += 4  # sample_description_index
+	fields = {}
+	for bit, name in ((0x8, 'duration'), (0x10, 'size'), (0x20, 'flags')):
+		if flags & bit:
+			fields[name] = struct.unpack_from('>I', buf, offset)[0]
+			offset += 4
+	defaults = dict(defaults, **fields)
+
+	start = 0
+	if b'tfdt' in traf:
+		payload, _ = traf[b'tfdt'][0]
+		start = struct.unpack_from('>Q' if buf[payload] == 1 else '>I', buf, payload + 4)[0]
+
+	durations, sizes, sample_flags = [], [], []
+	for payload, _ in traf.get(b'trun', []):
+		flags = int.from_bytes(buf[payload + 1:payload + 4], 'big')
+		count = struct.unpack_from('>I', buf, payload + 4)[0]
+		offset = payload + 8
+		if flags & 0x1:
+			offset += 4  # data_offset
+		first_flags = None
+		if flags & 0x4:
+			first_flags = struct.unpack_from('>I', buf, offset)[0]
+			offset += 4
+		present = [bit for bit in (0x100, 0x200, 0x400, 0x800) if flags & bit]
+		# the sample table is read in place as a (samples x fields) big-endian view
+		table = np.frombuffer(buf, dtype='>u4', count=count * len(present), offset=offset).reshape(count, len(present))
+		columns = dict(zip(present, table.T))
+		durations.append(columns.get(0x100, np.full(count, defaults['duration'])).astype(np.int64))
+		sizes.append(columns.get(0x200, np.full(count, defaults['size'])).astype(np.int64))
+		run_flags = columns.get(0x400, np.full(count, defaults['flags'])).astype(np.int64)
+		if first_flags is not None and count:
+			run_flags[0] = first_flags
+		sample_flags.append(run_flags)
+	if not durations:
+		return start, np.array([], np.int64), np.array([], np.int64), np.array([], np.int64)
+	return start, np.concatenate(durations), np.concatenate(sizes), np.concatenate(sample_flags)
+
+
+def _peak_bitrate(durations_s, sizes, window_s=PEAK_WINDOW_S):
+	"""Highest bitrate of any run of consecutive samples lasting at least window_s."""
+	if len(sizes) == 0:
+		return np.nan
+	ends = np.cumsum(durations_s)
+	starts = ends - durations_s
+	if ends[-1] <= window_s:
+		return sizes.sum() * 8 / ends[-1] if ends[-1] > 0 else np.nan
+	bytes_before = np.concatenate([[0], np.cumsum(sizes)])
+	# for every first sample, the first sample whose end completes the window
+	last = np.searchsorted(ends, starts + window_s - 1e-9)
+	valid = last < len(sizes)
+	first = np.nonzero(valid)[0]
+	window_bytes = bytes_before[last[valid] + 1] - bytes_before[first]
+	return (window_bytes * 8 / (ends[last[valid]] - starts[first])).max()
+
+
+def parse_segment(path, init):
+	"""Returns one SEGMENT_DTYPE row of a media segment."""
+	timescale = init['timescale']
+	with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+		top = list(_boxes(buf, 0, len(buf)))
+		mdat_size = sum(end - payload for box_type, payload, end in top if box_type == b'mdat')
+
+		start, durations, sizes, flags = None, [], [], []
+		sidx_duration = 0
+		for box_type, payload, end in top:
+			if box_type == b'sidx':
+				version = buf[payload]
+				sidx_timescale = struct.unpack_from('>I', buf, payload + 8)[0]
+				offset = payload + (32 if version == 1 else 24)  # first reference, after reserved and reference_count
+				count = struct.unpack_from('>H', buf, offset - 2)[0]
+				# subsegment_duration of every reference, the view must not outlive the mapping
+				sidx_duration += np.frombuffer(buf, dtype='>u4', count=count * 3, offset=offset)[1::3].sum(dtype=np.int64) / sidx_timescale
+			elif box_type == b'moof':
+				for traf_payload, traf_end in _walk(buf, payload, end, {}).get(b'traf', []):
+					traf = _walk(buf, traf_payload, traf_end, {})
+					traf_start, traf_durations, traf_sizes, traf_flags = _parse_traf(buf, traf, init['defaults'])
+					start = traf_start if start is None else start
+					durations.append(traf_durations)
+					sizes.append(traf_sizes)
+					flags.append(traf_flags)
+		size = len(buf)
+
+	durations = np.concatenate(durations) if durations else np.array([], np.int64)
+	sizes = np.concatenate(sizes) if sizes else np.array([], np.int64)
+	flags = np.concatenate(flags) if flags else np.array([], np.int64)
+	duration = durations.sum() / timescale if durations.sum() else sidx_duration
+	sync = np.nonzero((flags & NON_SYNC_SAMPLE) == 0)[0]
+	keyframe_offset = durations[:sync[0]].sum() / timescale if len(sync) else np.nan
+
+	row = np.zeros(1, SEGMENT_DTYPE)
+	row['number'] = int(os.path.basename(path).split('-')[-1].split('.')[0])
+	row['size'] = size
+	row['mdat_size'] = mdat_size
+	row['samples'] = len(sizes)
+	row['start_s'] = (start or 0) / timescale
+	row['duration_s'] = duration
+	row['keyframe_offset_s'] = keyframe_offset
+	row['bitrate_bps'] = size * 8 / duration if duration else np.nan
+	row['peak_bitrate_bps'] = _peak_bitrate(durations / timescale, sizes)
+	return row
+
+
+def dash_bandwidth(sizes, durations, min_buffer_time):
+	"""Lowest bandwidth (bit/s) that delivers every segment before its playout when playback starts
+	after min_buffer_time, the @bandwidth definition of ISO/IEC 23009-1."""
+	bits = np.cumsum(np.asarray(sizes, dtype=float) * 8)
+	deadlines = min_buffer_time + np.concatenate([[0], np.cumsum(durations)[:-1]])
+	return int(np.ceil((bits / deadlines).max())) if len(bits) else 0
+
+
+def _segment_files(segment_dir):
+	return sorted(f for f in os.listdir(segment_dir) if f.startswith('0-') and f.endswith('.m4s') and 'init' not in f)
+
+
+def _signature(segment_dir, files):
+	# the index is rebuilt whenever a segment was added, removed or rewritten
+	stats = [os.stat(os.path.join(segment_dir, f)) for f in ['0-init.m4s'] + files]
+	return {'files': len(files), 'bytes': sum(st.st_size for st in stats), 'mtime_ns': max(st.st_mtime_ns for st in stats)}
+
+
+def build_index(segment_dir, min_buffer_time=10.0):
+	"""Indexes the segments of one representation and writes segment_index.npy/.json."""
+	files = _segment_files(segment_dir)
+	init = parse_init(os.path.join(segment_dir, '0-init.m4s'))
+	table = np.concatenate([parse_segment(os.path.join(segment_dir, f), init) for f in files]) if files else np.zeros(0, SEGMENT_DTYPE)
+
+	summary = {
+		'version': INDEX_VERSION,
+		'signature': _signature(segment_dir, files),
+		'timescale': init['timescale'],
+		'init_size': init['size'],
+		'segments': len(table),
+		'bytes': int(table['size'].sum()) + init['size'],
+		'duration_s': float(table['duration_s'].sum()),
+		'average_bitrate_bps': float(table['size'].sum() * 8 / table['duration_s'].sum()) if len(table) else 0,
+		'peak_bitrate_bps': float(np.nanmax(table['peak_bitrate_bps'])) if len(table) else 0,
+		'min_buffer_time': min_buffer_time,
+		'bandwidth': dash_bandwidth(table['size'], table['duration_s'], min_buffer_time),
+	}
+	np.save(os.path.join(segment_dir, INDEX_NAME + '.npy'), table)
+	with open(os.path.join(segment_dir, INDEX_NAME + '.json'), 'w') as f:
+		json.dump(summary, f, indent=1)
+	return summary, table
+
+
+def load_index(segment_dir, min_buffer_time=10.0):
+	"""Returns the summary and memory-mapped table of a representation, indexing it first if needed."""
+	try:
+		with open(os.path.join(segment_dir, INDEX_NAME + '.json')) as f:
+			summary = json.load(f)
+		current = (summary.get('version') == INDEX_VERSION and summary.get('min_buffer_time') == min_buffer_time
+			and summary.get('signature') == _signature(segment_dir, _segment_files(segment_dir)))
+	except (FileNotFoundError, json.JSONDecodeError):
+		current = False
+	if not current:
+		print('Indexing segments in %s' % segment_dir)
+		return build_index(segment_dir, min_buffer_time)
+	return summary, np.load(os.path.join(segment_dir, INDEX_NAME + '.npy'), mmap_mode='r')
+
+
+def main_index(meta):
+	"""Indexes every representation of meta['resolutions'] and prints a summary."""
+	print('\n%-12s %9s %10s %12s %12s %12s' % ('resolution', 'segments', 'MB', 'avg(kbps)', 'peak(kbps)', 'bandwidth'))
+	for resolution in meta['resolutions']:
+		height = resolution.split('x')[1]
+		summary, _ = load_index(os.path.join(meta['prefix'], height, 'out'))
+		print('%-12s %9d %10.1f %12.0f %12.0f %12d' % (resolution, summary['segments'], summary['bytes'] / 1e6,
+			summary['average_bitrate_bps'] / 1000, summary['peak_bitrate_bps'] / 1000, summary['bandwidth']))
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+_ffmpeg_version = None
+
+
+def ffmpeg_version():
+	global _ffmpeg_version
+	if _ffmpeg_version is None:
+		res = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+		_ffmpeg_version = res.stdout.split('\n', 1)[0].strip()
+	return _ffmpeg_version
+
+
+def source_digest(path):
+	# Hashing the multi-GB source on every call is slow, so the digest is remembered
+	# next to the source together with the size and mtime it was computed for
+	st = os.stat(path)
+	memo_path = path + '.sha256'
+	if os.path.isfile(memo_path):
+		with open(memo_path) as f:
+			memo = json.load(f)
+		if memo['size'] == st.st_size and memo['mtime_ns'] == st.st_mtime_ns:
+			return memo['digest']
+
+	print('Hashing %s' % path)
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			h.update(chunk)
+	digest = h.hexdigest()
+	with open(memo_path, 'w') as f:
+		json.dump({'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'digest': digest}, f)
+	return digest
+
+
+def encode_key(meta, idx):
+	fields = {
+		'source': source_digest(meta['source']),
+		'resolution': meta['resolutions'][idx],
+		'bitrate': meta['bitrates'][idx],
+		'framerate': meta['framerate'],
+		'keyint': meta['segment_duration'],
+		'ffmpeg': ffmpeg_version(),
+	}
+	return _key(fields)
+
+
+def segment_key(meta, idx, segment_args):
+	return _key({'encode': encode_key(meta, idx), 'segment': segment_args})
+
+
+def _key(fields):
+	return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+def _stamp_path(destination):
+	return destination.rstrip('/') + '.key'
+
+
+def _read_stamp(destination):
+	try:
+		with open(_stamp_path(destination)) as f:
+			return f.read().strip()
+	except FileNotFoundError:
+		return None
+
+
+def _write_stamp(destination, key):
+	with open(_stamp_path(destination), 'w') as f:
+		f.write(key)
+
+
+def _link_tree(src, dst):
+	# hardlink where possible so the cache costs no extra disk space
+	if os.path.isdir(src):
+		os.makedirs(dst, exist_ok=True)
+		for name in os.listdir(src):
+			_link_tree(os.path.join(src, name), os.path.join(dst, name))
+		return
+	try:
+		os.link(src, dst)
+	except OSError:
+		shutil.copy2(src, dst)
+
+
+def _remove(path):
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	elif os.path.exists(path):
+		os.remove(path)
+
+
+def _size(path):
+	if os.path.isfile(path):
+		return os.path.getsize(path)
+	total = 0
+	for root, _, files in os.walk(path):
+		for name in files:
+			total += os.path.getsize(os.path.join(root, name))
+	return total
+
+
+def fetch(meta, key, destination):
+	"""Returns True if destination is up to date for key, restoring it from the cache if needed."""
+	cache_dir = meta.get('cache')
+	if not cache_dir:
+		return False
+
+	entry = os.path.join(cache_dir, key)
+	if _read_stamp(destination) == key and os.path.exists(destination):
+		print('Cache hit: %s is up to date' % destination)
+	elif os.path.isdir(entry):
+		print('Cache hit: restoring %s from %s' % (destination, entry))
+		_remove(destination)
+		_link_tree(os.path.join(entry, 'output'), destination)
+		_write_stamp(destination, key)
+	else:
+		print('Cache miss: %s' % destination)
+		# outputs may be hardlinked into the cache, never let ffmpeg overwrite them in place
+		_remove(destination)
+		return False
+
+	if os.path.isdir(entry):
+		os.utime(entry)  # mark as recently used
+	return True
+
+
+def store(meta, key, destination):
+	cache_dir = meta.get('cache')
+	if not cache_dir:
+		return
+
+	entry = os.path.join(cache_dir, key)
+	_remove(entry)
+	os.makedirs(entry)
+	_link_tree(destination, os.path.join(entry, 'output'))
+	_write_stamp(destination, key)
+	evict(cache_dir, meta.get('cache_cap'), keep=key)
+
+
+def evict(cache_dir, cap_bytes, keep=None):
+	if not cap_bytes or not os.path.isdir(cache_dir):
+		return
+
+	entries = []
+	for name in os.listdir(cache_dir):
+		path = os.path.join(cache_dir, name)
+		if os.path.isdir(path):
+			entries.append((os.path.getmtime(path), name, _size(path)))
+
+	total = sum(size for _, _, size in entries)
+	for _, name, size in sorted(entries):
+		if total <= cap_bytes:
+			break
+		if name == keep:
+			continue
+		print('Evicting cache entry %s (%.1f MB)' % (name, size / 1e6))
+		shutil.rmtree(os.path.join(cache_dir, name))
+		total -= size
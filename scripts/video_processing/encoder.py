@@ -1,4 +1,7 @@
 import os
+import subprocess
+import time
+import cache
 from utils import check_and_create
 
 def encode(meta, idx):
@@ -16,20 +19,87 @@ def encode(meta, idx):
 	if dst_dir:
 		check_and_create(dst_dir)
 
+	key = cache.encode_key(meta, idx)
+	if cache.fetch(meta, key, destination):
+		os.utime(destination)  # keep make from rebuilding an unchanged rung
+		print ('Done encoding %sp (cached)' % quality)
+		return
+
 	print("Segmenting video in " + str(segment_duration_frames / 60) + " second long chunks")
 
 	print(segment_duration_frames, type(segment_duration_frames))
 	cmd = "ffmpeg -i " + source + " -vf scale=" + resolutions[idx] + " -b:v " + str(bitrates[idx]) + "M -bufsize " + str(bitrates[idx]/2) + "M -c:v libx264 -x264opts 'keyint=" + str(segment_duration_frames) + ":min-keyint=" + str(segment_duration_frames) + ":no-scenecut' -c:a copy " + destination
 	print("Encoding %s: " % cmd)
-	os.system(cmd)
+	if os.system(cmd) == 0:
+		cache.store(meta, key, destination)
 
 	print ('Done encoding %sp' % quality) 
 
 
-# def main_encode():
-# 	for i in range(len(resolutions)):
-# 		print('Starting %s thread' % resolutions[i])
-# 		t = Thread(target=encode, args=(i,))
-# 		t.start()
+def _destination(meta, idx):
+	quality = meta['resolutions'][idx].split('x')[1]
+	return ( meta['prefix'] if meta['prefix'] else '' ) + '%s/bbb_%s_%s.mp4' % (quality, quality, meta['framerate'])
+
+
+def _count_frames(path):
+	cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=nb_frames', '-of', 'csv=p=0', path]
+	res = subprocess.run(cmd, capture_output=True, text=True)
+	try:
+		return int(res.stdout.strip())
+	except ValueError:
+		return 0
+
+
+def encode_ladder(meta, indices, cores):
+	"""Encode several rungs from a single decode of the source.
+
+	The decoded frames are fanned out with a split filter, so the 2160p source is
+	read once no matter how many rungs are encoded. Rungs found in the cache are
+	skipped. Returns per-rung stats.
+	"""
+	resolutions = meta['resolutions']
+	source = meta['source']
+	bitrates = meta['bitrates']
+	segment_duration_frames = meta['segment_duration']
+
+	keys = {}
+	misses = []
+	for i in indices:
+		destination = _destination(meta, i)
+		check_and_create(destination.rsplit('/', 1)[0])
+		keys[i] = cache.encode_key(meta, i)
+		if cache.fetch(meta, keys[i], destination):
+			os.utime(destination)
+		else:
+			misses.append(i)
+
+	wall = 0
+	if misses:
+		# spread the core budget over the rung encoders, decode and filters share what's left
+		threads = max(1, cores // len(misses))
+
+		filters = '[0:v]split=%d%s' % (len(misses), ''.join('[s%d]' % i for i in misses))
+		for i in misses:
+			filters += ';[s%d]scale=%s[v%d]' % (i, resolutions[i], i)
+
+		cmd = "ffmpeg -y -threads " + str(cores) + " -i " + source + " -filter_threads " + str(cores) + " -filter_complex '" + filters + "'"
+		for i in misses:
+			cmd += " -map '[v%d]' -map 0:a:0? -b:v " % i + str(bitrates[i]) + "M -bufsize " + str(bitrates[i]/2) + "M -c:v libx264 -threads " + str(threads) + " -x264opts 'keyint=" + str(segment_duration_frames) + ":min-keyint=" + str(segment_duration_frames) + ":no-scenecut' -c:a copy " + _destination(meta, i)
+
+		print("Encoding ladder %s: " % cmd)
+		start = time.monotonic()
+		ret = os.system(cmd)
+		wall = time.monotonic() - start
+		if ret != 0:
+			raise RuntimeError('ffmpeg ladder encode failed with exit status %s' % ret)
+		for i in misses:
+			cache.store(meta, keys[i], _destination(meta, i))
 
-# 	print ('Started all threads')
\ No newline at end of file
+	stats = []
+	for i in indices:
+		frames = _count_frames(_destination(meta, i))
+		# all encoded rungs run in the same ffmpeg process, so they share the wall time
+		rung_wall = wall if i in misses else 0
+		stats.append({'resolution': resolutions[i], 'wall': rung_wall, 'frames': frames, 'fps': frames / rung_wall if rung_wall else 0})
+	print('Done encoding ladder in %.1fs (%d of %d rungs cached)' % (wall, len(indices) - len(misses), len(indices)))
+	return stats
@@ -1,81 +1,137 @@
 import os
+import re
+import xml.etree.ElementTree as ET
 
-#TODO: Should really make a use of a built-in xml library for this
-def process_mpds(meta):
+from box_index import load_index
+
+DASH_NS = 'urn:mpeg:dash:schema:mpd:2011'
+XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+
+ET.register_namespace('', DASH_NS)
+ET.register_namespace('xsi', XSI_NS)
+
+MIN_BUFFER_TIME = 10.0
+
+
+def _tag(name):
+	return '{%s}%s' % (DASH_NS, name)
+
+
+def _parse_duration(value):
+	# ISO 8601 durations as written by ffmpeg, e.g. PT10M34.5S
+	match = re.fullmatch(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?', value)
+	if not match:
+		raise ValueError('Unsupported duration: %s' % value)
+	hours, minutes, seconds = match.groups()
+	return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+
+
+def _format_duration(seconds):
+	minutes, seconds = divmod(seconds, 60)
+	hours, minutes = divmod(int(minutes), 60)
+	return 'PT%s%s%.1fS' % ('%dH' % hours if hours else '', '%dM' % minutes if minutes else '', seconds)
+
+
+def _read_representation(segment_dir):
+	"""Parses the per-representation output.mpd written by the segmenter."""
+	root = ET.parse(os.path.join(segment_dir, 'output.mpd')).getroot()
+	representation = root.find('.//%s[@mimeType="video/mp4"]' % _tag('Representation'))
+	if representation is None:
+		representation = root.find('.//%s' % _tag('Representation'))
+	segment_list = representation.find(_tag('SegmentList'))
+	if segment_list is None:
+		segment_list = representation.find(_tag('SegmentTemplate'))
+
+	segments = sorted(f for f in os.listdir(segment_dir) if f.startswith('0') and 'init' not in f)
+	timescale = int(segment_list.get('timescale', '1'))
+	seg_duration = int(segment_list.get('duration'))
+
+	if root.get('mediaPresentationDuration'):
+		duration = _parse_duration(root.get('mediaPresentationDuration'))
+	else:
+		duration = len(segments) * seg_duration / timescale
+
+	return {
+		'bandwidth': representation.get('bandwidth'),
+		'codecs': representation.get('codecs', 'avc1.64001f'),
+		'timescale': timescale,
+		'seg_duration': seg_duration,
+		'duration': duration,
+		'segments': segments,
+	}
+
+
+def process_mpds(meta, variant=None):
+	"""Stitches the representations into bbb.mpd, or those of a segment-duration variant into bbb_<variant>.mpd."""
 	resolutions = meta['resolutions']
 	prefix = meta['prefix']
 	media_prefix = meta['media_prefix']
-	stiched_mpds = []	
-	
+	# 'template' addresses segments with $Number$, 'list' keeps one SegmentURL per segment
+	mode = meta.get('mpd_mode', 'template')
+	framerate = '%s/1' % meta.get('framerate', 60)
+	# variants are packaged below variants/<variant> (see variants.py)
+	variant_dir = os.path.join('variants', variant) if variant else ''
+
+	mpd = ET.Element(_tag('MPD'), {
+		'{%s}schemaLocation' % XSI_NS: 'urn:mpeg:DASH:schema:MPD:2011 http://standards.iso.org/ittf/PubliclyAvailableStandards/MPEG-DASH_schema_files/DASH-MPD.xsd',
+		'profiles': 'urn:mpeg:dash:profile:isoff-live:2011',
+		'type': 'static',
+		'minBufferTime': _format_duration(MIN_BUFFER_TIME),
+	})
+	program_information = ET.SubElement(mpd, _tag('ProgramInformation'))
+	ET.SubElement(program_information, _tag('Title')).text = 'Big Buck Bunny, Sunflower version'
+	period = ET.SubElement(mpd, _tag('Period'), {'id': '0', 'start': 'PT0.0S'})
+	adaptation_set = ET.SubElement(period, _tag('AdaptationSet'), {
+		'id': '0', 'contentType': 'video', 'segmentAlignment': 'true', 'bitstreamSwitching': 'true',
+		'frameRate': framerate, 'lang': 'und',
+	})
+
+	durations = []
 	for i, resolution in enumerate(resolutions):
 		width, height = resolution.split('x')
-		#<Representation id="0" mimeType="video/mp4" codecs="avc1.64001f" bandwidth="1409668" width="640" height="360" frameRate="60/1">
-		
-		segment_dir = os.path.join(prefix, height, 'out')
-		# Get the bandwidth, currently got no better way of doing this
-		with open(os.path.join(segment_dir, 'output.mpd'), 'r') as f:
-			content = f.read()
-			bandwidth = content.split('bandwidth="')[1].split('"')[0]
-			seg_duration = content.split('duration="')[1].split('"')[0]
-
-		representation_tag = '\t'*3 + '<Representation id="%s" mimeType="video/mp4" codecs="avc1.64001f" bandwidth="%s" width="%s" height="%s" frameRate="60/1">\n' % (i, bandwidth, width, height)		
-		stiched_mpds.append(representation_tag)
-		print (representation_tag) 
+
+		segment_dir = os.path.join(prefix, variant_dir, height, 'out')
+		info = _read_representation(segment_dir)
+		durations.append(info['duration'])
+		# ffmpeg's bandwidth is a nominal rate, the index gives the one the segments actually need
+		summary, _ = load_index(segment_dir, MIN_BUFFER_TIME)
+		bandwidth = str(summary['bandwidth']) if summary['segments'] else info['bandwidth']
+
+		representation = ET.SubElement(adaptation_set, _tag('Representation'), {
+			'id': str(i), 'mimeType': 'video/mp4', 'codecs': info['codecs'], 'bandwidth': bandwidth,
+			'width': width, 'height': height, 'frameRate': framerate,
+		})
+		print('Representation %s: %sx%s bandwidth=%s (ffmpeg: %s, peak: %.0f) segments=%d' % (i, width, height, bandwidth,
+			info['bandwidth'], summary['peak_bitrate_bps'], len(info['segments'])))
 
 		media_url = media_prefix if media_prefix else segment_dir
+		media_url = os.path.join(media_url, variant_dir, height, 'out')
+
+		if mode == 'template':
+			ET.SubElement(representation, _tag('SegmentTemplate'), {
+				'timescale': str(info['timescale']),
+				'duration': str(info['seg_duration']),
+				'startNumber': '1',
+				'initialization': media_url + '/0-init.m4s',
+				'media': media_url + '/0-$Number%05d$.m4s',
+			})
+		elif mode == 'list':
+			segment_list = ET.SubElement(representation, _tag('SegmentList'), {
+				'timescale': str(info['timescale']), 'duration': str(info['seg_duration']), 'startNumber': '1',
+			})
+			ET.SubElement(segment_list, _tag('Initialization'), {'sourceURL': media_url + '/0-init.m4s'})
+			for f in info['segments']:
+				ET.SubElement(segment_list, _tag('SegmentURL'), {'media': os.path.join(media_url, f)})
+		else:
+			raise ValueError('Unknown MPD mode: %s' % mode)
+
+	# the presentation is as long as the longest representation
+	mpd.set('mediaPresentationDuration', _format_duration(max(durations)))
+
+	tree = ET.ElementTree(mpd)
+	ET.indent(tree, space='\t')
+	mpd_path = '%sbbb%s.mpd' % (prefix, '_' + variant if variant else '')
+	tree.write(mpd_path, encoding='utf-8', xml_declaration=True)
 
-		media_url = os.path.join(media_url, height, 'out')
-
-		files = sorted(os.listdir(segment_dir))
-		
-		# Duration should NOT be a hardcoded value!
-		# Duration is the length of each individual segment duration (math.ciel(mediaPresentationDuration / # of segments))
-		segmentlist_tag = '\t'*4 + ('<SegmentList timescale="1000000" duration="%s" startNumber="1">\n' % seg_duration)  
-		stiched_mpds.append(segmentlist_tag)
-		print (segmentlist_tag)
-
-		initseg_tag = '\t'*5 + '<Initialization sourceURL="' + media_url + '/0-init.m4s" />\n'
-		stiched_mpds.append(initseg_tag)		
-		print (initseg_tag)
-
-		
-		for f in files:
-			if f.startswith('0') and 'init' not in f: # if the file is video and is not the initial segment
-				seg_path = os.path.join(media_url, f)
-				segment_tag = '\t'*5 + '<SegmentURL media="' + seg_path + '" />\n'
-				stiched_mpds.append(segment_tag)
-				#print ()
-
-#				print("%s/%s" % (segment_dir, f))
-		# close segment_list tag
-		stiched_mpds.append('\t'*4 + '</SegmentList>\n')
-		# close representation tag
-		stiched_mpds.append('\t'*3 + '</Representation>\n')
-	
-	# Make a string out of the stiched_mpds list
-	stiched_mpds = ''.join(x for x in stiched_mpds)
-	mpd_path = '%sbbb.mpd' % prefix
-	with open(mpd_path, 'w') as f:
-		# Put all tags prior to the <representation> tag in the mpd
-		f.write('''<?xml version="1.0" encoding="utf-8"?>
-<MPD xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-	xmlns="urn:mpeg:dash:schema:mpd:2011"
-	xmlns:xlink="http://www.w3.org/1999/xlink"
-	xsi:schemaLocation="urn:mpeg:DASH:schema:MPD:2011 http://standards.iso.org/ittf/PubliclyAvailableStandards/MPEG-DASH_schema_files/DASH-MPD.xsd"
-	profiles="urn:mpeg:dash:profile:isoff-live:2011"
-	type="static"
-	mediaPresentationDuration="PT10M34.5S"
-	minBufferTime="PT10.0S">
-	<ProgramInformation>
-		<Title>Big Buck Bunny, Sunflower version</Title>
-	</ProgramInformation>
-	<Period id="0" start="PT0.0S">
-		<AdaptationSet id="0" contentType="video" segmentAlignment="true" bitstreamSwitching="true" frameRate="60/1" lang="und">\n''') # opening tags
-
-		f.write(stiched_mpds)
-
-		f.write('\t'*2 + '''</AdaptationSet>
-	</Period>
-</MPD>''') # closing tags
-
-	print('file saved to: %s' % mpd_path)
\ No newline at end of file
+	print('file saved to: %s' % mpd_path)
+	return mpd_path
@@ -1,9 +1,12 @@
 import os
+import cache
 from utils import check_and_create
 
+SEGMENT_ARGS = "-codec copy -f dash -min_seg_duration 30 -use_template 0 -use_timeline 0 -init_seg_name '$RepresentationID$-init.m4s' -media_seg_name '$RepresentationID$-$Number%05d$.m4s'"
+
 def _segment(in_source, dst_dir):
 	print('in:%s out:%s' % (in_source, dst_dir))
-	os.system("ffmpeg -i " + in_source + " -codec copy -f dash -min_seg_duration 30 -use_template 0 -use_timeline 0 -init_seg_name '$RepresentationID$-init.m4s' -media_seg_name '$RepresentationID$-$Number%05d$.m4s' " + dst_dir + "/output.mpd")
+	return os.system("ffmpeg -i " + in_source + " " + SEGMENT_ARGS + " " + dst_dir + "/output.mpd")
 
 
 def main_segment(meta, resolution):
@@ -13,6 +16,16 @@ def main_segment(meta, resolution):
 	quality = resolution.split('x')[1]
 	#dst = res + '/out'
 	in_source = ('%s%s/bbb_%s_%s.mp4' % (prefix, quality, quality, framerate) )				
-	check_and_create('%s%s/out' % (prefix, quality) )
 	out_dir = '%s%s/out' % (prefix, quality)
-	_segment(in_source, out_dir)
\ No newline at end of file
+
+	# a rung outside the ladder (e.g. given with --extra_arg) has no encode key, it is segmented uncached
+	key = None
+	if meta.get('cache') and resolution in meta['resolutions']:
+		key = cache.segment_key(meta, meta['resolutions'].index(resolution), SEGMENT_ARGS)
+	if key and cache.fetch(meta, key, out_dir):
+		os.utime(out_dir + '/output.mpd')  # keep make from re-segmenting an unchanged rung
+		return
+
+	check_and_create('%s%s/out' % (prefix, quality) )
+	if _segment(in_source, out_dir) == 0 and key:
+		cache.store(meta, key, out_dir)
\ No newline at end of file
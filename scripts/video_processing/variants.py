@@ -0,0 +1,97 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cache
+from box_index import load_index
+from mpd_generator import process_mpds
+from utils import check_and_create
+
+# Segment-duration variants of the ladder: the keyframe-aligned encode of every rung is
+# repackaged (stream copy, video only) into segments of each duration below
+# <prefix>variants/<variant>/<height>/out, stitched into <prefix>bbb_<variant>.mpd and listed
+# in <prefix>variants.json. The player loads a variant with ?mpd=data/bbb_<variant>.mpd.
+
+VARIANTS_DIR = 'variants'
+MANIFEST_NAME = 'variants.json'
+
+# -seg_duration replaces the deprecated -min_seg_duration, segments are cut at the first keyframe after it
+VARIANT_ARGS = "-map 0:v:0 -codec copy -f dash -seg_duration %s -use_template 0 -use_timeline 0 -init_seg_name '$RepresentationID$-init.m4s' -media_seg_name '$RepresentationID$-$Number%%05d$.m4s'"
+
+
+def variant_name(seconds):
+	return 'seg%gs' % seconds
+
+
+def _package(meta, resolution, seconds):
+	quality = resolution.split('x')[1]
+	in_source = '%s%s/bbb_%s_%s.mp4' % (meta['prefix'], quality, quality, meta['framerate'])
+	variant_dir = os.path.join(meta['prefix'], VARIANTS_DIR, variant_name(seconds))
+	out_dir = os.path.join(variant_dir, quality, 'out')
+	args = VARIANT_ARGS % seconds
+
+	start = time.monotonic()
+	key = cache.segment_key(meta, meta['resolutions'].index(resolution), args) if meta.get('cache') else None
+	if key and cache.fetch(meta, key, out_dir):
+		return 0, time.monotonic() - start
+
+	# the parent directories are shared by the jobs of one variant, check_and_create is not race free
+	os.makedirs(out_dir, exist_ok=True)
+	print('in:%s out:%s' % (in_source, out_dir))
+	# -nostdin keeps the parallel ffmpeg processes from competing for the terminal
+	ret = os.system('ffmpeg -nostdin -y -loglevel error -i ' + in_source + ' ' + args + ' ' + out_dir + '/output.mpd')
+	if ret == 0 and key:
+		cache.store(meta, key, out_dir)
+	return ret, time.monotonic() - start
+
+
+def main_variants(meta, durations, cores):
+	"""Packages every rung in every segment duration in parallel and writes one MPD per variant."""
+	resolutions = meta['resolutions']
+	# the encoder places a keyframe every meta['segment_duration'] frames
+	keyint = meta['segment_duration'] / float(meta['framerate'])
+	for seconds in durations:
+		if abs(seconds / keyint - round(seconds / keyint)) > 1e-6 or seconds < keyint:
+			print('\033[93mWARNING: %gs is no multiple of the %gs keyframe interval, segments of variant %s will vary in duration\033[0m'
+				% (seconds, keyint, variant_name(seconds)))
+	for resolution in resolutions:
+		quality = resolution.split('x')[1]
+		in_source = '%s%s/bbb_%s_%s.mp4' % (meta['prefix'], quality, quality, meta['framerate'])
+		if not os.path.isfile(in_source):
+			raise FileNotFoundError('%s is missing, encode the ladder first (make stage1-ladder)' % in_source)
+
+	check_and_create(os.path.join(meta['prefix'], VARIANTS_DIR))
+	jobs = [(seconds, resolution) for seconds in durations for resolution in resolutions]
+	# stream copy is I/O bound, one ffmpeg per job and core
+	with ProcessPoolExecutor(max_workers=max(1, min(cores, len(jobs)))) as pool:
+		futures = [pool.submit(_package, meta, resolution, seconds) for seconds, resolution in jobs]
+		results = [future.result() for future in futures]
+	failed = ['%s %s' % (variant_name(seconds), resolution) for (seconds, resolution), (ret, _) in zip(jobs, results) if ret != 0]
+	if failed:
+		raise RuntimeError('ffmpeg packaging failed for %s' % ', '.join(failed))
+
+	walls = dict((job, wall) for job, (_, wall) in zip(jobs, results))
+	mpd_paths = [process_mpds(meta, variant_name(seconds)) for seconds in durations]
+
+	manifest = {'keyframe_interval_s': keyint, 'variants': []}
+	print('\n%-10s %-12s %9s %10s %12s %12s' % ('variant', 'resolution', 'segments', 'package(s)', 'avg(s)', 'bandwidth'))
+	for seconds, mpd_path in zip(durations, mpd_paths):
+		name = variant_name(seconds)
+		representations = []
+		for resolution in resolutions:
+			wall = walls[(seconds, resolution)]
+			segment_dir = os.path.join(meta['prefix'], VARIANTS_DIR, name, resolution.split('x')[1], 'out')
+			summary, _ = load_index(segment_dir)
+			average = summary['duration_s'] / summary['segments'] if summary['segments'] else 0
+			representations.append({'resolution': resolution, 'segments': summary['segments'], 'average_duration_s': average,
+				'bandwidth': summary['bandwidth'], 'package_s': wall})
+			print('%-10s %-12s %9d %10.1f %12.2f %12d' % (name, resolution, summary['segments'], wall, average, summary['bandwidth']))
+		manifest['variants'].append({'name': name, 'segment_duration_s': seconds, 'mpd': os.path.basename(mpd_path),
+			'representations': representations})
+
+	manifest_path = os.path.join(meta['prefix'], MANIFEST_NAME)
+	with open(manifest_path, 'w') as f:
+		json.dump(manifest, f, indent=1)
+	print('file saved to: %s' % manifest_path)
+	return manifest
@@ -1,12 +1,15 @@
 from threading import Thread
+from concurrent.futures import ProcessPoolExecutor
 import os
 import time
 import sys
 import argparse
 
 from mpd_generator import process_mpds
-from encoder import encode
+from encoder import encode, encode_ladder
 from segmenter import main_segment
+from box_index import main_index
+from variants import main_variants
 
 # ffmpeg -i ../bbb_fragmented.mp4 -vf scale=%s -b:v %sM -bufsize %sM -c:v libx264 -x264opts 'keyint=30:min-keyint=30:no-scenecut' -crf 0 -preset veryslow -c:a copy %s/bbb_%s_%s.mp4
 
@@ -23,6 +26,28 @@ prefix = '/vagrant/'
 framerate = 60
 media_prefix = None
 
+
+def _timed_segment(meta, resolution):
+	start = time.monotonic()
+	main_segment(meta, resolution)
+	return time.monotonic() - start
+
+
+def main_ladder(meta, cores):
+	indices = list(range(len(meta['resolutions'])))
+	stats = encode_ladder(meta, indices, cores)
+
+	# segmenting is stream-copy only and independent per rung
+	with ProcessPoolExecutor(max_workers=min(cores, len(indices))) as pool:
+		futures = [pool.submit(_timed_segment, meta, meta['resolutions'][i]) for i in indices]
+		for rung, future in zip(stats, futures):
+			rung['segment_wall'] = future.result()
+
+	print('\n%-12s %10s %8s %10s %12s' % ('resolution', 'frames', 'fps', 'encode(s)', 'segment(s)'))
+	for rung in stats:
+		print('%-12s %10d %8.1f %10.1f %12.1f' % (rung['resolution'], rung['frames'], rung['fps'], rung['wall'], rung['segment_wall']))
+
+
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description='Video utility script')
 	parser.add_argument('--prefix', '-p', help='Prefix')
@@ -33,11 +58,21 @@ if __name__ == '__main__':
 
 	parser.add_argument('--media_prefix', help='prefix to be used for media segments path')
 
-	parser.add_argument('--action', required=True, help='Action to be performed by the script. Possible actions are: encode, segment, and mpd (to generate an MPD file)')
+	parser.add_argument('--action', required=True, help='Action to be performed by the script. Possible actions are: encode, segment, ladder (encode and segment all representations from a single decode), index (index the segments of all representations), variants (repackage the ladder in every --variant_durations with stream copy, one MPD per variant), and mpd (to generate an MPD file)')
 
 	parser.add_argument('--extra_arg', help="Additional arguments to pass for encoder and segmenter actions to pick the correct representation")
 
-	parser.add_argument('--segment_duration', help="Segment duration length in seconds. Used by the encoder", type=int)
+	parser.add_argument('--segment_duration', help="Segment duration length in seconds. Used by the encoder and to key cached segments", type=int)
+
+	parser.add_argument('--cache_cap', help="Size cap of the encode/segment cache in GB, least recently used entries are evicted beyond it (default: 100)", type=float, default=100)
+
+	parser.add_argument('--no_cache', help="Disable the encode/segment cache", action='store_true')
+
+	parser.add_argument('--mpd_mode', help="MPD addressing: 'template' (SegmentTemplate with $Number$) or 'list' (one SegmentURL per segment)", choices=['template', 'list'], default='template')
+
+	parser.add_argument('--variant_durations', help="Segment durations in seconds of the variants action (default: 1 2 4 8)", type=float, nargs='+', default=[1, 2, 4, 8])
+
+	parser.add_argument('--cores', help="Number of cores the ladder action may use (default: all)", type=int, default=os.cpu_count())
 
 	args = parser.parse_args()
 	
@@ -62,6 +97,14 @@ if __name__ == '__main__':
 	meta['bitrates'] = bitrates
 	meta['resolutions'] = resolutions
 	meta['prefix'] = prefix
+	meta['mpd_mode'] = args.mpd_mode
+	meta['cache'] = None if args.no_cache else '%s.cache' % prefix
+	meta['cache_cap'] = int(args.cache_cap * 1e9)
+
+	if not args.segment_duration:
+		meta['segment_duration'] = 60
+	else:
+		meta['segment_duration'] = args.segment_duration * 60
 
 	print ('Running "%s" script with arguemnts: prefix(%s) source(%s) fps(%s)' % (args.action, prefix, source, framerate))
 	if args.action == 'segment':
@@ -77,19 +120,23 @@ if __name__ == '__main__':
 			print("Segment action requires an extra srgument to pick representation")
 			sys.exit(1)
 
-		if not args.segment_duration:
-			meta['segment_duration'] = 60
-		else:
-			meta['segment_duration'] = args.segment_duration * 60
-
 		idx = args.extra_arg
 		idx = int(idx)
 		# print("Encoding {resolutions[idx]}")
 		encode(meta, idx)
 		# print(f"Done encoding {resolutions[idx]}")
 	
+	elif args.action == 'ladder':
+		main_ladder(meta, args.cores)
+
+	elif args.action == 'index':
+		main_index(meta)
+
+	elif args.action == 'variants':
+		main_variants(meta, args.variant_durations, args.cores)
+
 	elif args.action == 'mpd':
 		process_mpds(meta)
 	else:
-		print("Unknown action requested. Specify one of: segment, encode, or mpd")
+		print("Unknown action requested. Specify one of: segment, encode, ladder, index, variants, or mpd")
 
@@ -0,0 +1,268 @@
+"""Asyncio HTTP/2 static file server, the HTTP/2 stand-in of the local testbed.
+
+Serves a directory (player pages, dash.js, MPD and m4s segments) over TLS with ALPN h2,
+e.g. inside the network namespace of testbed.py:
+
+    python3 static_server.py --root www --cert cert.pem --key key.pem --port 443 --preload data/360/out
+
+Files up to --zero_copy_mb are kept in an LRU memory cache limited to --cache_mb, cache
+misses are read in a worker thread so a cold segment does not stall other streams. TLS
+and HTTP/2 framing rule out sendfile(2), larger files are memory-mapped instead and
+framed straight from the page cache without being read into memory first. With --log,
+every request is appended to a JSON lines file with its service time (request received
+until the response headers were sent: lookup and read) and its send time (headers until
+the last frame was handed to the socket: flow control and socket backpressure), which
+separates server-side delay from the network.
+"""
+
+# pip install h2
+
+import argparse
+import asyncio
+import json
+import mimetypes
+import mmap
+import os
+import ssl
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+try:
+    from h2.config import H2Configuration
+    from h2.connection import H2Connection
+    from h2.events import ConnectionTerminated, RequestReceived, StreamReset, WindowUpdated
+    from h2.exceptions import ProtocolError, StreamClosedError
+except ImportError:  # only needed to serve, the testbed imports this module without it
+    H2Connection = None
+
+CONTENT_TYPES = {
+    ".mpd": "application/dash+xml",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".js": "application/javascript",
+    ".html": "text/html; charset=utf-8",
+}
+
+
+class SegmentCache:
+    """LRU cache of file contents limited to a total number of bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()  # path -> (mtime_ns, size, data)
+
+    def get(self, path: str, stat: os.stat_result) -> bytes:
+        entry = self.entries.get(path)
+        # a file rewritten by the packager is read again
+        if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+            return None
+        self.entries.move_to_end(path)
+        return entry[2]
+
+    def put(self, path: str, stat: os.stat_result, data: bytes) -> bool:
+        """Caches data unless it exceeds the cap, evicting the least recently used files."""
+        if len(data) > self.max_bytes:
+            return False
+        if path in self.entries:
+            self.bytes -= len(self.entries.pop(path)[2])
+        while self.bytes + len(data) > self.max_bytes:
+            self.bytes -= len(self.entries.popitem(last=False)[1][2])
+        self.entries[path] = (stat.st_mtime_ns, stat.st_size, data)
+        self.bytes += len(data)
+        return True
+
+
+class StaticServer:
+    """Serves the files below root to HTTP/2 clients, GET and HEAD only."""
+
+    def __init__(self, root: str, cert: str, key: str, port: int = 443, host: str = "0.0.0.0",
+                 cache_bytes: int = 512 << 20, zero_copy_bytes: int = 4 << 20, log_path: str = None):
+        if H2Connection is None:
+            raise RuntimeError("static_server.py needs the h2 package (pip install h2)")
+        self.root = os.path.realpath(root)
+        self.host = host
+        self.port = port
+        self.cache = SegmentCache(cache_bytes)
+        self.zero_copy_bytes = zero_copy_bytes
+        self.log = open(log_path, "a", buffering=1) if log_path else None
+        self.ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.ssl.load_cert_chain(cert, key)
+        self.ssl.set_alpn_protocols(["h2"])
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self._handle, self.host, self.port, ssl=self.ssl)
+        print(f"Static server serving {self.root} on https://{self.host}:{self.port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    def resolve(self, target: str) -> str:
+        """Returns the file of a request path, None if it is missing or outside root."""
+        path = unquote(urlparse(target).path).lstrip("/") or "index.html"
+        # contained before following symlinks, the testbed's web root links to scripts/ and data/
+        path = os.path.normpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, path]) != self.root or not os.path.isfile(path):
+            return None
+        return path
+
+    def preload(self, paths: list):
+        """Reads files or directory trees below root into the cache, e.g. the segments of some representations."""
+        files, size = 0, 0
+        for path in paths:
+            path = os.path.normpath(os.path.join(self.root, path))
+            walk = os.walk(path) if os.path.isdir(path) else [(os.path.dirname(path), [], [os.path.basename(path)])]
+            for directory, _, names in walk:
+                for name in sorted(names):
+                    file = os.path.join(directory, name)
+                    stat = os.stat(file)
+                    if stat.st_size > self.zero_copy_bytes:
+                        continue
+                    if self.cache.bytes + stat.st_size > self.cache.max_bytes:
+                        print(f"\033[93mWARNING: cache full after preloading {files} files, "
+                              f"raise --cache_mb to preload {path} completely\033[0m")
+                        return
+                    with open(file, "rb") as f:
+                        self.cache.put(file, stat, f.read())
+                    files, size = files + 1, size + stat.st_size
+        print(f"Preloaded {files} files ({size / 1e6:.1f} MB)", flush=True)
+
+    async def _read(self, path: str) -> tuple:
+        """Returns the content of a file and where it came from (cache, disk or mmap)."""
+        stat = os.stat(path)
+        if stat.st_size > self.zero_copy_bytes:
+            with open(path, "rb") as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), "mmap"
+        data = self.cache.get(path, stat)
+        if data is not None:
+            return data, "cache"
+
+        def read():
+            with open(path, "rb") as f:
+                return f.read()
+        data = await asyncio.get_running_loop().run_in_executor(None, read)
+        self.cache.put(path, stat, data)
+        return data, "disk"
+
+    async def _handle(self, reader, writer):
+        conn = H2Connection(config=H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        peer = "%s:%s" % writer.get_extra_info("peername")[:2]
+        windows = {}  # stream -> Event set when the peer opened its flow control window
+        tasks = {}
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for event in conn.receive_data(data):
+                    if isinstance(event, RequestReceived):
+                        windows[event.stream_id] = asyncio.Event()
+                        tasks[event.stream_id] = asyncio.create_task(
+                            self._respond(conn, writer, event.stream_id, dict(event.headers), windows, peer))
+                        tasks[event.stream_id].add_done_callback(lambda t, s=event.stream_id: tasks.pop(s, None))
+                    elif isinstance(event, WindowUpdated):
+                        for stream_id, window in windows.items():
+                            if event.stream_id in (0, stream_id):
+                                window.set()
+                    elif isinstance(event, StreamReset) and event.stream_id in tasks:
+                        tasks[event.stream_id].cancel()
+                    elif isinstance(event, ConnectionTerminated):
+                        return
+                writer.write(conn.data_to_send())
+                await writer.drain()
+        except (ConnectionError, ProtocolError, ssl.SSLError):
+            pass
+        finally:
+            for task in list(tasks.values()):
+                task.cancel()
+            writer.close()
+
+    async def _respond(self, conn, writer, stream_id: int, headers: dict, windows: dict, peer: str):
+        received = time.monotonic()
+        status, size, source, headers_sent, reset = None, 0, None, None, False
+        body = None
+        try:
+            method, path = headers[":method"], self.resolve(headers[":path"])
+            if method not in ("GET", "HEAD"):
+                status = 405
+            elif path is None:
+                status = 404
+            if status is not None:
+                self._send_headers(conn, writer, stream_id, status, end_stream=True)
+                headers_sent = time.monotonic()
+                return
+
+            body, source = await self._read(path)
+            status, size = 200, len(body)
+            extension = os.path.splitext(path)[1]
+            content_type = CONTENT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+            self._send_headers(conn, writer, stream_id, 200, method == "HEAD" or not body,
+                               [("content-type", content_type), ("content-length", str(size))])
+            headers_sent = time.monotonic()
+            if method == "GET":
+                with memoryview(body) as view:
+                    await self._send_body(conn, writer, stream_id, view, windows[stream_id])
+        except (StreamClosedError, asyncio.CancelledError):
+            reset = True
+        finally:
+            windows.pop(stream_id, None)
+            if source == "mmap":
+                body.close()
+            if self.log is not None:
+                done = time.monotonic()
+                self.log.write(json.dumps({
+                    "time": time.time(), "peer": peer, "stream": stream_id, "method": headers.get(":method"),
+                    "path": headers.get(":path"), "status": status, "reset": reset, "bytes": size,
+                    "source": source, "service_ms": ((headers_sent or done) - received) * 1000,
+                    "send_ms": (done - headers_sent) * 1000 if headers_sent else None}) + "\n")
+
+    @staticmethod
+    def _send_headers(conn, writer, stream_id: int, status: int, end_stream: bool = False, extra: list = ()):
+        conn.send_headers(stream_id, [(":status", str(status)), ("server", "chrome-dash"),
+                                      ("cache-control", "no-store"), *extra], end_stream=end_stream)
+        writer.write(conn.data_to_send())
+
+    @staticmethod
+    async def _send_body(conn, writer, stream_id: int, body: memoryview, window: asyncio.Event):
+        offset = 0
+        while offset < len(body):
+            size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, len(body) - offset)
+            if size <= 0:
+                window.clear()
+                await window.wait()
+                continue
+            # slices of the cached bytes or the mapping, copied only into the frame
+            conn.send_data(stream_id, body[offset:offset + size], end_stream=offset + size == len(body))
+            offset += size
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', type=str, required=True,
+                        help="Directory to serve")
+    parser.add_argument('--cert', type=str, required=True,
+                        help="TLS certificate (PEM)")
+    parser.add_argument('--key', type=str, required=True,
+                        help="TLS private key (PEM)")
+    parser.add_argument('--host', type=str, default="0.0.0.0",
+                        help="Address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=443,
+                        help="Port to listen on (default: %(default)s)")
+    parser.add_argument('--cache_mb', type=float, default=512,
+                        help="Byte cap of the LRU memory cache in MB (default: %(default)s)")
+    parser.add_argument('--zero_copy_mb', type=float, default=4,
+                        help="Files larger than this are memory-mapped instead of cached (default: %(default)s)")
+    parser.add_argument('--preload', type=str, nargs='*', default=[], metavar="PATH",
+                        help="Files or directories below --root to load into the cache before serving")
+    parser.add_argument('--log', type=str, default=None, metavar="PATH",
+                        help="Append one JSON line per request with its service and send time to PATH")
+    args = parser.parse_args()
+
+    server = StaticServer(args.root, args.cert, args.key, args.port, args.host, int(args.cache_mb * 1e6),
+                          int(args.zero_copy_mb * 1e6), args.log)
+    server.preload(args.preload)
+    asyncio.run(server.serve_forever())
@@ -0,0 +1,230 @@
+"""Local testbed: HTTP/2 and HTTP/3 servers for data/ behind an emulated satellite link.
+
+The servers run in a network namespace connected to this host by a veth pair. Both
+ends are shaped with tc netem (half the RTT each, rate per direction, loss on the
+downlink), so Chrome on this host sees the link of the selected profile:
+
+    host (10.77.0.1) <-- veth, netem --> namespace (10.77.0.2): static_server.py :443, picoquicdemo
+
+The web root holds player pages and dash.js from scripts/ and the data/ tree as links.
+A self-signed certificate is created per testbed, Chrome trusts it by its SPKI hash.
+All network setup needs root (sudo), picoquicdemo must be compiled locally.
+"""
+
+import getpass
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from remote_host import LocalHost
+
+# RTT in ms (jitter in ms), rates in Mbit/s, downlink loss in percent
+PROFILES = {
+    "none": {"rtt_ms": 0, "jitter_ms": 0, "down_mbit": None, "up_mbit": None, "loss": 0},
+    "geo": {"rtt_ms": 600, "jitter_ms": 0, "down_mbit": 50, "up_mbit": 5, "loss": 0},
+    "geo-loss": {"rtt_ms": 600, "jitter_ms": 0, "down_mbit": 50, "up_mbit": 5, "loss": 0.5},
+    "leo": {"rtt_ms": 40, "jitter_ms": 5, "down_mbit": 100, "up_mbit": 20, "loss": 0.1},
+}
+
+WEB_FILES = ["player.html", "player_highLatency.html", "dash.all.debug.js"]
+
+
+def parse_profile(spec: str) -> dict:
+    """Returns the link of a profile name with optional overrides, e.g. "geo,loss=1,down_mbit=20"."""
+    name, *overrides = spec.split(",")
+    if name not in PROFILES:
+        raise ValueError(f"unknown testbed profile {name!r}, expected one of {sorted(PROFILES)}")
+    link = dict(PROFILES[name], profile=spec)
+    for override in overrides:
+        key, value = override.split("=", 1)
+        if key not in PROFILES[name]:
+            raise ValueError(f"unknown link parameter {key!r}, expected some of {sorted(PROFILES[name])}")
+        link[key] = float(value)
+    return link
+
+
+class NamespaceHost(LocalHost):
+    """Runs picoquic in a network namespace of this machine, files are shared with the host."""
+
+    def __init__(self, namespace: str, timeout: float = 30):
+        super().__init__(timeout)
+        self.namespace = namespace
+
+    def __repr__(self):
+        return f"NamespaceHost({self.namespace})"
+
+    def popen(self, command: str, **kwargs) -> subprocess.Popen:
+        # entering the namespace needs root, the command itself runs as this user like over SSH
+        return super().popen(f"sudo ip netns exec {self.namespace} sudo -u {getpass.getuser()} "
+                             f"bash -c {shlex.quote(command)}", **kwargs)
+
+
+class Testbed:
+    """Network namespace, link emulation and servers of one local testbed."""
+
+    def __init__(self, profile: str, data_dir: str = "data", namespace: str = "chrome-dash", subnet: str = "10.77.0",
+                 h2_port: int = 443, h3_port: int = 44321, scripts_dir: str = "scripts", preload: list = (),
+                 cache_mb: float = 512, server_log: str = None):
+        self.link = parse_profile(profile)
+        self.data_dir = os.path.abspath(data_dir)
+        self.scripts_dir = os.path.abspath(scripts_dir)
+        self.namespace = namespace
+        self.host_address = f"{subnet}.1"
+        self.address = f"{subnet}.2"
+        self.veth = ("cdtb-host", "cdtb-srv")
+        self.h2_port = h2_port
+        self.h3_port = h3_port
+        self.preload = [f"data/{height}/out" for height in preload]  # representations by height
+        self.cache_mb = cache_mb
+        self.server_log = os.path.abspath(server_log) if server_log else None
+        self.local = LocalHost()
+        self.host = NamespaceHost(namespace)
+        self.workdir = None
+        self.spki = None
+        self.h2_server = None
+
+    def __repr__(self):
+        return f"Testbed({self.link['profile']}, {self.address})"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def www_dir(self) -> str:
+        return os.path.join(self.workdir, "www")
+
+    @property
+    def cert(self) -> str:
+        return os.path.join(self.workdir, "cert.pem")
+
+    @property
+    def key(self) -> str:
+        return os.path.join(self.workdir, "key.pem")
+
+    @property
+    def qlog_dir(self) -> str:
+        return os.path.join(self.workdir, "qlog")
+
+    @property
+    def h2_url(self) -> str:
+        return f"https://{self.address}:{self.h2_port}/player.html"
+
+    @property
+    def h3_url(self) -> str:
+        return f"https://{self.address}:{self.h3_port}/player.html"
+
+    @property
+    def chrome_arguments(self) -> list:
+        return [f"--ignore-certificate-errors-spki-list={self.spki}"]
+
+    def start(self):
+        assert os.path.isdir(self.data_dir), f"{self.data_dir} does not exist, generate it with make first"
+        self.workdir = tempfile.mkdtemp(prefix="chrome-dash-testbed-")
+        os.makedirs(self.qlog_dir)
+        self._create_web_root()
+        self._create_certificate()
+        try:
+            self._create_namespace()
+            self.shape()
+            self._start_h2_server()
+        except Exception:
+            self.stop()
+            raise
+        print(f"Testbed {self.link['profile']} ready: {self.h2_url} (H2), {self.h3_url} (H3)")
+
+    def _create_web_root(self):
+        os.makedirs(self.www_dir)
+        for name in WEB_FILES:
+            os.symlink(os.path.join(self.scripts_dir, name), os.path.join(self.www_dir, name))
+        # the players load data/bbb.mpd relative to the page
+        os.symlink(self.data_dir, os.path.join(self.www_dir, "data"))
+
+    def _create_certificate(self):
+        self.local.run(f"openssl req -x509 -newkey ec -pkeyopt ec_paramgen_curve:prime256v1 -nodes -days 7 "
+                       f"-subj /CN=chrome-dash-testbed -addext subjectAltName=IP:{self.address} "
+                       f"-keyout {self.key} -out {self.cert}", capture_output=True)
+        res = self.local.run(f"openssl x509 -in {self.cert} -pubkey -noout | openssl pkey -pubin -outform der "
+                             f"| openssl dgst -sha256 -binary | base64", capture_output=True, text=True)
+        self.spki = res.stdout.strip()
+
+    def _ns(self, command: str) -> str:
+        return f"sudo ip netns exec {self.namespace} {command}"
+
+    def _create_namespace(self):
+        host_veth, server_veth = self.veth
+        # leftovers of a crashed testbed would make the setup fail
+        self.local.run(f"sudo ip netns del {self.namespace}", check=False, capture_output=True)
+        self.local.run(f"sudo ip link del {host_veth}", check=False, capture_output=True)
+        self.local.run(
+            f"sudo ip netns add {self.namespace} && "
+            f"sudo ip link add {host_veth} type veth peer name {server_veth} && "
+            f"sudo ip link set {server_veth} netns {self.namespace} && "
+            f"sudo ip addr add {self.host_address}/24 dev {host_veth} && "
+            f"sudo ip link set {host_veth} up && "
+            f"{self._ns(f'ip addr add {self.address}/24 dev {server_veth}')} && "
+            f"{self._ns(f'ip link set {server_veth} up')} && "
+            f"{self._ns('ip link set lo up')}")
+
+    @staticmethod
+    def _netem(delay_ms: float, jitter_ms: float, rate_mbit: float, loss: float) -> str:
+        args = f"delay {delay_ms}ms" + (f" {jitter_ms}ms" if jitter_ms else "")
+        if loss:
+            args += f" loss {loss}%"
+        if rate_mbit:
+            args += f" rate {rate_mbit}mbit"
+        # the queue must hold at least twice the bandwidth-delay product, netem drops beyond it
+        bdp_packets = (rate_mbit or 1000) * 1e6 / 8 * max(delay_ms * 2, 1) / 1000 / 1500
+        return args + f" limit {max(1000, int(2 * bdp_packets))}"
+
+    def shape(self, link: dict = None):
+        """Applies (or changes) the emulated link, half the RTT is added in each direction."""
+        self.link = link or self.link
+        host_veth, server_veth = self.veth
+        delay, jitter = self.link["rtt_ms"] / 2, self.link["jitter_ms"] / 2
+        # egress of the host side is the uplink, egress of the namespace side the downlink
+        self.local.run(f"sudo tc qdisc replace dev {host_veth} root netem "
+                       f"{self._netem(delay, jitter, self.link['up_mbit'], 0)}")
+        self.local.run(self._ns(f"tc qdisc replace dev {server_veth} root netem "
+                                f"{self._netem(delay, jitter, self.link['down_mbit'], self.link['loss'])}"))
+
+    def _start_h2_server(self, timeout: float = 60):
+        server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static_server.py")
+        cmd = self._ns(f"{sys.executable} {server} --root {self.www_dir} --cert {self.cert} --key {self.key} "
+                       f"--port {self.h2_port} --cache_mb {self.cache_mb}")
+        if self.preload:
+            cmd += f" --preload {' '.join(self.preload)}"
+        if self.server_log:
+            cmd += f" --log {self.server_log}"
+        self.h2_server = self.local.popen(cmd)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.h2_server.poll() is None:
+            try:
+                with socket.create_connection((self.address, self.h2_port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f"static_server.py did not accept connections on {self.address}:{self.h2_port}")
+
+    def stop(self):
+        """Stops the servers and removes the namespace, the veth pair and the web root."""
+        if self.h2_server is not None:
+            self.local.run(f"sudo pkill -f '[s]tatic_server.py --root {self.www_dir} '", check=False)
+            try:
+                self.h2_server.wait(5)
+            except subprocess.TimeoutExpired:
+                self.h2_server.kill()
+            self.h2_server = None
+        # deleting the namespace also deletes both veth ends
+        self.local.run(f"sudo ip netns del {self.namespace}", check=False, capture_output=True)
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
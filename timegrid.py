@@ -0,0 +1,108 @@
+"""Resampling of player timeseries onto a common time grid.
+
+load_data() rounds sample times to whole seconds since the first poll, so several 250 ms
+samples share one x value and the same x means a different moment in every run. Here
+every run is put on one grid of a chosen resolution, relative to an anchor of the run:
+
+    fetchStart     navigation start of the player page (PerformanceTiming.fetchStart)
+    canPlay        the player's first CAN_PLAY event
+    driver_get     chrome_driver.get() called by the runner
+    first_sample   the player's first poll (the t0 of load_data)
+
+A grid point takes the last sample at or before it (step) or interpolates between its
+neighbours (linear), points before the first or after the last sample of a run stay
+NaN. All runs are resampled at once as a (runs x grid) array, one searchsorted over the
+concatenated runs, each shifted by its own offset so that runs cannot overlap.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+ANCHORS = {
+    "fetchStart": "fetch_start_ms",
+    "canPlay": "can_play_ms",
+    "driver_get": "driver_get_ms",
+    "first_sample": "first_sample_ms",
+}
+
+
+def resample(df_sample, df_anchor, column: str, resolution_s: float = 0.1, anchor: str = "fetchStart",
+             method: str = "step", start_s: float = None, end_s: float = None):
+    """Returns the grid (seconds since the anchor), a (runs x grid) array of column and the runs.
+
+    df_sample and df_anchor are the tables of load_timeseries(), runs without the anchor or
+    without samples of the column are left out. The runs are a DataFrame of iteration and
+    protocol in the order of the array's rows.
+    """
+    if method not in ("step", "linear"):
+        raise ValueError(f"unknown interpolation {method!r}, expected 'step' or 'linear'")
+    anchor_ms = df_anchor.set_index(df_anchor["iteration"].cat.codes)[ANCHORS[anchor]]
+    anchor_ms = anchor_ms[~np.isnan(anchor_ms)]
+
+    codes = df_sample["iteration"].cat.codes.to_numpy()
+    values = df_sample[column].to_numpy(float)
+    keep = ~np.isnan(values) & np.isin(codes, anchor_ms.index)
+    codes, values = codes[keep], values[keep]
+    times = (df_sample["time_ms"].to_numpy(float)[keep] - anchor_ms.reindex(codes).to_numpy()) / 1000
+    order = np.lexsort((times, codes))
+    codes, values, times = codes[order], values[order], times[order]
+
+    run_codes, rows = np.unique(codes, return_inverse=True)
+    runs = df_anchor.set_index(df_anchor["iteration"].cat.codes).loc[run_codes, ["iteration", "protocol"]]
+    runs = runs.reset_index(drop=True)
+    if len(times) == 0:
+        return np.array([]), np.empty((0, 0)), runs
+
+    start = np.floor(times.min() / resolution_s) * resolution_s if start_s is None else start_s
+    end = times.max() if end_s is None else end_s
+    # rounded to ns so that a grid point meets a sample at the same time despite float steps
+    grid = np.round(start + np.arange(int(np.floor((end - start) / resolution_s + 1e-9)) + 1) * resolution_s, 9)
+
+    # shift every run by its own offset, then one searchsorted finds the sample before each grid point
+    span = max(times.max(), grid[-1]) - min(times.min(), grid[0]) + 1
+    offsets = np.arange(len(run_codes)) * span
+    flat = times + offsets[rows]
+    queries = (grid[None, :] + offsets[:, None]).ravel()
+    before = np.searchsorted(flat, queries, side="right") - 1
+    query_rows = np.repeat(np.arange(len(run_codes)), len(grid))
+    safe = np.clip(before, 0, len(flat) - 1)
+    # a grid point before a run's first sample finds the previous run's last one
+    valid = (before >= 0) & (rows[safe] == query_rows)
+    last = np.r_[rows[1:] != rows[:-1], True]  # last sample of each run
+    valid &= queries <= flat[last][query_rows]
+
+    if method == "step":
+        resampled = np.where(valid, values[safe], np.nan)
+    else:
+        after = np.clip(safe + 1, 0, len(flat) - 1)
+        has_next = (after != safe) & (rows[after] == query_rows)
+        gap = np.where(has_next, flat[after] - flat[safe], 1)
+        weight = np.where(has_next & (gap > 0), (queries - flat[safe]) / np.where(gap > 0, gap, 1), 0)
+        resampled = np.where(valid, values[safe] + weight * (values[after] - values[safe]), np.nan)
+    return grid, resampled.reshape(len(run_codes), len(grid)), runs
+
+
+def quantile_bands(grid, values, runs, quantiles=(0.25, 0.5, 0.75), min_runs: int = 1) -> pd.DataFrame:
+    """Returns per protocol and grid point the quantiles over the runs with a value there.
+
+    The tidy result has the columns protocol, time_s, runs and one column per quantile
+    (q25, q50, ...), grid points with fewer than min_runs runs are left out.
+    """
+    parts = []
+    protocols = runs["protocol"].to_numpy()
+    for protocol in pd.unique(protocols):
+        sub = values[protocols == protocol]
+        count = (~np.isnan(sub)).sum(axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # grid points without any run
+            bands = np.nanquantile(sub, quantiles, axis=0)
+        keep = count >= max(min_runs, 1)
+        part = {"protocol": protocol, "time_s": grid[keep], "runs": count[keep]}
+        part |= {f"q{round(q * 100):02}": band[keep] for q, band in zip(quantiles, bands)}
+        parts.append(pd.DataFrame(part))
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    if not df.empty and isinstance(runs["protocol"].dtype, pd.CategoricalDtype):
+        df["protocol"] = pd.Categorical(df["protocol"], categories=runs["protocol"].cat.categories)
+    return df